@@ -0,0 +1,1820 @@
+"""Benchmarks do assistente financeiro
+
+Uso:
+    python benchmark.py            # roda todos os cenários
+    python benchmark.py escrita    # roda só o cenário escolhido
+    python benchmark.py carga --usuarios=50 --historico=5000 --mensagens=3000 --saida=antes.json
+    python benchmark.py comparar antes.json depois.json
+"""
+from datetime import datetime, date, timedelta
+import multiprocessing
+import calendar
+import platform
+import random
+import subprocess
+import urllib.parse
+import urllib.request
+import signal
+import threading
+import tempfile
+import time
+import json
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import whatsapp_financas as app
+
+
+def preparar_ambiente(pasta):
+    """Aponta os arquivos de dados do app para uma pasta temporária"""
+    app.DATA_FILE = os.path.join(pasta, 'financas_data.json')
+    app.JOURNAL_FILE = os.path.join(pasta, 'financas_journal.jsonl')
+    app.LOCK_DIR = os.path.join(pasta, 'financas_locks')
+    app.SQLITE_FILE = os.path.join(pasta, 'financas.db')
+    app.ARCHIVE_DIR = os.path.join(pasta, 'financas_arquivo')
+    app.DEDUP_ARQUIVO = os.path.join(pasta, 'financas_mensagens.jsonl')
+    app.PARTICOES_DIR = os.path.join(pasta, 'financas_usuarios')
+    app.RAZAO_DIR = os.path.join(pasta, 'financas_razao')
+    app._cache['dados'] = None
+    app._razao['instantaneos'].clear()
+    app._particoes.update(dados=None, assinatura=None, meta=None, usuarios={}, contas=0)
+    app._entregas.update(respostas=app.OrderedDict(), inode=None, posicao=0, linhas=0)
+
+
+def gerar_historico(quantidade, usuarios=('Principal',)):
+    """Gera um arquivo de dados no formato original com `quantidade` transações por usuário"""
+    dados = app.dados_vazios()
+    for nome in usuarios:
+        usuario = dados['usuarios'].setdefault(nome, app.novo_usuario())
+        data = datetime.now().strftime('%d/%m/%Y %H:%M')
+        for i in range(quantidade):
+            usuario['transacoes'].append({
+                'tipo': 'gasto',
+                'valor': 10.0 + i % 90,
+                'descricao': f'compra {i}',
+                'data': data,
+                'categoria': 'geral'
+            })
+            usuario['saldo'] -= 10.0 + i % 90
+        # Formato original: os totais são calculados pelo app na primeira leitura
+        del usuario['totais']
+        del usuario['saldos_iniciais']
+    with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+
+
+def tamanho_gravado():
+    """Bytes ocupados por snapshot + diário"""
+    return sum(
+        os.path.getsize(caminho) for caminho in (app.DATA_FILE, app.JOURNAL_FILE)
+        if os.path.exists(caminho)
+    )
+
+
+def salvar_reescrevendo(dados):
+    """Implementação anterior de salvar_dados: reescreve o documento inteiro"""
+    with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+
+
+def cenario_escrita(repeticoes=200):
+    """Custo por mensagem de escrita conforme o histórico cresce: diário vs reescrita"""
+    print('== escrita: custo por "gasto 50 almoço" ==')
+    print(f"{'histórico':>10} {'reescrita ms':>13} {'reescrita B':>12} {'diário ms':>10} {'diário B':>9}")
+    compactar_apos = app.COMPACTAR_APOS
+    app.COMPACTAR_APOS = 10 ** 9  # a compactação é medida à parte
+    try:
+        for tamanho in (1000, 10000, 100000):
+            resultado = []
+            for salvar in (salvar_reescrevendo, app.salvar_dados):
+                with tempfile.TemporaryDirectory() as pasta:
+                    preparar_ambiente(pasta)
+                    gerar_historico(tamanho)
+                    dados = app.carregar_dados()
+                    usuario = app.obter_dados_usuario(dados)
+
+                    # A reescrita completa é lenta demais para muitas repetições
+                    vezes = min(repeticoes, 20) if salvar is salvar_reescrevendo else repeticoes
+                    antes = tamanho_gravado()
+                    inicio = time.perf_counter()
+                    for _ in range(vezes):
+                        usuario['saldo'] -= 50
+                        usuario['transacoes'].append({
+                            'tipo': 'gasto',
+                            'valor': 50.0,
+                            'descricao': 'almoço',
+                            'data': datetime.now().strftime('%d/%m/%Y %H:%M'),
+                            'categoria': 'geral'
+                        })
+                        salvar(dados)
+                    duracao = time.perf_counter() - inicio
+
+                    if salvar is salvar_reescrevendo:
+                        escrito = tamanho_gravado()
+                    else:
+                        escrito = (tamanho_gravado() - antes) // vezes
+                    resultado.append((duracao / vezes * 1000, escrito))
+            (ms_antigo, b_antigo), (ms_novo, b_novo) = resultado
+            print(f'{tamanho:>10} {ms_antigo:>13.3f} {b_antigo:>12} {ms_novo:>10.3f} {b_novo:>9}')
+    finally:
+        app.COMPACTAR_APOS = compactar_apos
+
+
+def cenario_compactacao():
+    """Tempo de compactação (segundo plano) e de reconstrução snapshot + diário"""
+    print('== compactação e reconstrução ==')
+    print(f"{'histórico':>10} {'compactar ms':>13} {'carregar ms':>12}")
+    for tamanho in (1000, 10000, 100000):
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico(tamanho)
+            dados = app.carregar_dados()
+            usuario = app.obter_dados_usuario(dados)
+            for i in range(100):
+                usuario['transacoes'].append({'tipo': 'gasto', 'valor': 1.0, 'descricao': 'x',
+                                              'data': '01/01/2026 00:00', 'categoria': 'geral'})
+                app.salvar_dados(dados)
+
+            inicio = time.perf_counter()
+            app._diario['compactando'] = True
+            app._compactar()
+            compactar = time.perf_counter() - inicio
+
+            app._cache['dados'] = None
+            inicio = time.perf_counter()
+            recarregado = app.carregar_dados()
+            carregar = time.perf_counter() - inicio
+            assert len(app.obter_dados_usuario(recarregado)['transacoes']) == tamanho + 100
+            print(f'{tamanho:>10} {compactar * 1000:>13.1f} {carregar * 1000:>12.1f}')
+
+
+def cenario_leitura(repeticoes=200):
+    """Latência de saldo/extrato com dados residentes vs relendo o arquivo a cada mensagem"""
+    print('== leitura: saldo / extrato ==')
+    print(f"{'histórico':>10} {'comando':>8} {'relendo ms':>11} {'cache ms':>9}")
+    for tamanho in (1000, 10000, 100000):
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico(tamanho)
+            for comando in ('saldo', 'extrato'):
+                # Relendo: invalida o cache antes de cada mensagem (comportamento antigo)
+                vezes = min(repeticoes, 20)
+                inicio = time.perf_counter()
+                for _ in range(vezes):
+                    app._cache['dados'] = None
+                    app.processar_mensagem(comando)
+                relendo = (time.perf_counter() - inicio) / vezes
+
+                app.carregar_dados()
+                inicio = time.perf_counter()
+                for _ in range(repeticoes):
+                    app.processar_mensagem(comando)
+                cache = (time.perf_counter() - inicio) / repeticoes
+                print(f'{tamanho:>10} {comando:>8} {relendo * 1000:>11.3f} {cache * 1000:>9.3f}')
+
+
+def _disparar_webhooks(pasta, remetentes, mensagens, compactar_apos):
+    """Carga de um processo: uma thread por remetente, cada uma mandando suas mensagens em ordem"""
+    preparar_ambiente(pasta)
+    app.COMPACTAR_APOS = compactar_apos
+    cliente = app.app.test_client()
+    falhas = []
+
+    def enviar(remetente):
+        for i in range(mensagens):
+            # Alterna entrada e gasto; o saldo esperado é conhecido de antemão
+            corpo = 'entrada 3 salario' if i % 2 == 0 else 'gasto 1,5 lanche'
+            resposta = cliente.post('/whatsapp', data={'Body': corpo, 'From': remetente})
+            if resposta.status_code != 200:
+                falhas.append((remetente, i, resposta.status_code))
+
+    threads = [threading.Thread(target=enviar, args=(r,)) for r in remetentes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not falhas, falhas
+
+
+def cenario_concorrencia(processos=4, remetentes_por_processo=8, mensagens=100):
+    """Vazão de webhooks intercalados de vários remetentes em threads e processos (os saldos
+    são conferidos em test_concorrencia.py)"""
+    print('== concorrência: webhooks intercalados ==')
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar_ambiente(pasta)
+        grupos = [
+            [f'whatsapp:+55119{p:02d}{r:04d}' for r in range(remetentes_por_processo)]
+            for p in range(processos)
+        ]
+        # O primeiro remetente herda o usuário Principal; grava isso antes da carga
+        app.processar_mensagem('usuario Principal', 'whatsapp:+5500000000000')
+
+        contexto = multiprocessing.get_context('spawn')
+        inicio = time.perf_counter()
+        filhos = [
+            contexto.Process(target=_disparar_webhooks, args=(pasta, grupo, mensagens, 200))
+            for grupo in grupos
+        ]
+        for filho in filhos:
+            filho.start()
+        for filho in filhos:
+            filho.join()
+            assert filho.exitcode == 0
+        duracao = time.perf_counter() - inicio
+
+        total = processos * remetentes_por_processo * mensagens
+        print(f'{total} mensagens em {duracao:.2f}s ({total / duracao:.0f} msg/s), '
+              f'{processos} processos x {remetentes_por_processo} remetentes')
+
+
+def _medir(comando, repeticoes):
+    """Latência média (ms) de um comando passando por processar_mensagem"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        app.processar_mensagem(comando)
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def cenario_backends(tamanhos=(10000, 100000, 1000000), repeticoes=20):
+    """Relatórios e escrita no armazenamento JSON vs SQLite com históricos grandes"""
+    print('== backends: json vs sqlite ==')
+    print(f"{'histórico':>10} {'comando':>10} {'json ms':>9} {'sqlite ms':>10}")
+    comandos = ('saldo', 'extrato', 'total', 'resumo', 'gasto 1 x')
+    backend = app.STORAGE_BACKEND
+    try:
+        for tamanho in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(tamanho)
+
+                app.STORAGE_BACKEND = 'json'
+                app.carregar_dados()
+                resultado = {comando: [_medir(comando, repeticoes)] for comando in comandos}
+
+                inicio = time.perf_counter()
+                app.importar_json_para_sqlite()
+                importacao = time.perf_counter() - inicio
+                app.STORAGE_BACKEND = 'sqlite'
+                for comando in comandos:
+                    resultado[comando].append(_medir(comando, repeticoes))
+
+                for comando, (json_ms, sqlite_ms) in resultado.items():
+                    print(f'{tamanho:>10} {comando:>10} {json_ms:>9.3f} {sqlite_ms:>10.3f}')
+                print(f'{tamanho:>10} {"importar":>10} {"":>9} {importacao * 1000:>10.0f}')
+    finally:
+        app.STORAGE_BACKEND = backend
+
+
+# Cópia da cadeia if/elif anterior ao despacho por tabela, usada como referência
+_LEGADO_EXATOS = [
+    (['usuario', 'usuário', 'qual usuario', 'quem sou'], 'cmd_usuario_atual'),
+    (['usuarios', 'usuários', 'listar usuarios', 'ver usuarios'], 'cmd_listar_usuarios'),
+    (['apagar historico', 'apagar histórico', 'limpar historico', 'limpar histórico', 'deletar historico'], 'cmd_apagar_historico'),
+    (['contas fixas', 'pagamentos fixos', 'ver contas', 'contas'], 'cmd_listar_contas_fixas'),
+]
+_LEGADO_SISTEMA = [
+    (['usuario ', 'usuário ', 'mudar para '], 'cmd_trocar_usuario'),
+    (['conta fixa ', 'pagamento fixo '], 'cmd_adicionar_conta_fixa'),
+    (['remover conta ', 'deletar conta '], 'cmd_remover_conta_fixa'),
+    (['pagar conta ', 'paguei conta '], 'cmd_pagar_conta_fixa'),
+]
+_LEGADO_DIRETOS = [
+    (['oi', 'olá', 'ola', 'hey', 'opa'], 'cmd_boas_vindas'),
+    (['ajuda', 'help', 'menu', 'comandos'], 'cmd_ajuda'),
+    ('gasto ', 'cmd_gasto'), ('vr ', 'cmd_vr'), ('va ', 'cmd_va'), ('entrada ', 'cmd_entrada'),
+    ('+vr ', 'cmd_credito_vr'), ('+va ', 'cmd_credito_va'),
+    (['saldo', 'saldos', 'extrato saldo'], 'cmd_saldo'),
+    (['extrato', 'historico', 'transacoes'], 'cmd_extrato'),
+    (['extrato completo', 'historico completo', 'ver tudo', 'ver todas'], 'cmd_extrato_completo'),
+    (['limpar tudo', 'resetar', 'limpar dados'], 'cmd_limpar_tudo'),
+    (['apagar ultima', 'apagar última', 'desfazer', 'cancelar ultima'], 'cmd_apagar_ultima'),
+    (['total', 'contar', 'quantas transacoes'], 'cmd_total'),
+    (['resumo', 'relatorio', 'mes'], 'cmd_resumo'),
+    (['zerar'], 'cmd_zerar'),
+]
+
+
+def classificar_legado(msg):
+    """Comando escolhido pela cadeia linear antiga (grupos de palavras-chave na linguagem natural)"""
+    for textos, nome in _LEGADO_SISTEMA:
+        if any(msg.startswith(t) for t in textos):
+            return nome
+    for textos, nome in _LEGADO_EXATOS:
+        if msg in textos:
+            return nome
+    grupos = set()
+    if any(palavra in msg for palavra in ['gastei', 'paguei', 'comprei', 'saiu']):
+        grupos.add('gasto')
+    if any(palavra in msg for palavra in ['vr', 'vale refeição', 'va', 'vale alimentação']):
+        grupos.add('nao_gasto')
+    if any(palavra in msg for palavra in ['vr', 'vale refeição', 'vale refeicao', 'vale-refeição']):
+        grupos.add('vr')
+    if any(palavra in msg for palavra in ['va', 'vale alimentação', 'vale alimentacao', 'vale-alimentação']):
+        grupos.add('va')
+    if any(palavra in msg for palavra in ['creditaram', 'creditou', 'caiu', 'recebi', 'chegou']) or '+' in msg:
+        grupos.add('credito')
+    if any(palavra in msg for palavra in ['recebi', 'caiu', 'entrou', 'ganhei', 'salário', 'salario']):
+        grupos.add('entrada')
+    for textos, nome in _LEGADO_DIRETOS:
+        if msg in textos if isinstance(textos, list) else msg.startswith(textos):
+            return nome, frozenset(grupos)
+    return None, frozenset(grupos)
+
+
+def classificar_tabela(msg):
+    """Comando escolhido pelo despacho por tabela (dicionário, árvores de prefixos e regex única)"""
+    funcao = app._COMANDOS_EXATOS.get(msg)
+    if funcao:
+        return funcao.__name__
+    encontrado = app._buscar_prefixo('sistema', msg)
+    if encontrado:
+        return encontrado[0].__name__
+    grupos = frozenset(app.grupos_palavras_chave(msg))
+    encontrado = app._buscar_prefixo('direto', msg)
+    return (encontrado[0].__name__ if encontrado else None), grupos
+
+
+def cenario_parser(repeticoes=20000):
+    """Mensagens/s classificadas pela cadeia if/elif antiga vs despacho por tabela"""
+    print('== parser: classificação de mensagens ==')
+    corpus = [
+        'saldo', 'extrato', 'resumo', 'ajuda', 'zerar', 'quem sou', 'contas fixas',
+        'gasto 50 almoço', 'vr 30 padaria', 'va 80 mercado', 'entrada 3000 salário', '+vr 600', '+va 300',
+        'gastei 50 na padaria', 'usei vr no restaurante, 35 reais', 'usei o va, 120 no mercado',
+        'recebi salário de 3000', 'creditaram 600 no vr', 'caiu 300 no va', 'entrou 500 do freelance',
+        'comprei remédio, foi 45 reais', 'conta fixa 150 10 aluguel', 'pagar conta 1', 'paguei conta 2',
+        'remover conta 1', 'usuario maria', 'mudar para joão', 'vale-refeição +20', 'bom dia', 'blabla',
+    ]
+    # Mesmas decisões nas duas implementações; os comandos exatos agora são
+    # resolvidos antes das palavras-chave, então só os grupos calculados pelas duas são comparados
+    for msg in corpus:
+        legado, tabela = classificar_legado(msg), classificar_tabela(msg)
+        legado = legado if isinstance(legado, tuple) else (legado, None)
+        tabela = tabela if isinstance(tabela, tuple) else (tabela, None)
+        assert legado[0] == tabela[0], (msg, legado, tabela)
+        assert None in (legado[1], tabela[1]) or legado[1] == tabela[1], (msg, legado, tabela)
+
+    print(f"{'implementação':>14} {'msg/s':>10}")
+    for nome, classificar in (('if/elif', classificar_legado), ('tabela', classificar_tabela)):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes // len(corpus)):
+            for msg in corpus:
+                classificar(msg)
+        duracao = time.perf_counter() - inicio
+        print(f'{nome:>14} {repeticoes // len(corpus) * len(corpus) / duracao:>10.0f}')
+
+
+def extrair_legado(texto):
+    """Implementação anterior de extrair_valor_e_descricao (duas regex de valor + limpeza)"""
+    import re
+
+    padroes = [
+        r'r?\$?\s*(\d+[,.]?\d*)\s*(?:reais?)?',
+        r'(\d+[,.]?\d*)\s*(?:reais?|R\$)',
+    ]
+    valor = None
+    posicao = -1
+    for padrao in padroes:
+        match = re.search(padrao, texto, re.IGNORECASE)
+        if match:
+            valor = float(match.group(1).replace(',', '.'))
+            posicao = match.start()
+            break
+    if valor and posicao >= 0:
+        descricao = re.sub(
+            r'(?:gastei|usei|paguei|comprei|recebi|foi|de|no|na|em|com|r\$|reais?|\d+[,.]?\d*)',
+            '',
+            texto,
+            flags=re.IGNORECASE
+        ).strip()
+        descricao = re.sub(r'\s+', ' ', descricao)
+        return valor, descricao if descricao else 'Sem descrição'
+    return None, None
+
+
+# Mensagens reais e o resultado esperado de extrair_valor_e_descricao (também usadas por test_extrator.py)
+AMOSTRAS_EXTRATOR = [
+    ('gastei 50 na padaria', (50.0, 'padaria')),
+    ('gastei 50 reais no almoço', (50.0, 'almoço')),
+    ('paguei 30 na padaria santa tereza', (30.0, 'padaria santa tereza')),
+    ('comprei remédio, foi 45 reais', (45.0, 'remédio')),
+    ('usei VR no restaurante, 35 reais', (35.0, 'VR restaurante')),
+    ('usei o VA, 120 no mercado', (120.0, 'o VA, mercado')),
+    ('gastei 28 com VR na lanchonete', (28.0, 'VR lanchonete')),
+    ('recebi meu salário de 3000', (3000.0, 'meu salário')),
+    ('entrou 500 do freelance', (500.0, 'entrou do freelance')),
+    ('creditaram 600 no VR', (600.0, 'creditaram VR')),
+    ('caiu 300 no VA', (300.0, 'caiu VA')),
+    ('gastei 30,50 no uber', (30.5, 'uber')),
+    ('gastei 30.50 no uber', (30.5, 'uber')),
+    ('paguei R$ 1.234,56 no aluguel', (1234.56, 'aluguel')),
+    ('paguei R$1.234 de condomínio', (1234.0, 'condomínio')),
+    ('recebi 10.000 reais de bônus', (10000.0, 'bônus')),
+    ('caiu R$1,5 mil de bônus', (1500.0, 'caiu bônus')),
+    ('ganhei 2 mil no freela', (2000.0, 'ganhei freela')),
+    ('comprei 2 pães por R$ 5', (5.0, '2 pães por')),
+    ('comprei 3 cervejas, 27 reais', (27.0, '3 cervejas')),
+    ('almocei às 12h, gastei 40', (40.0, 'almocei às 12h')),
+    ('gastei 15 em pão e 10 em leite', (15.0, 'pão e 10 leite')),
+    ('paguei 99.90 na conta de luz', (99.9, 'conta luz')),
+    ('gastei 50', (50.0, 'Sem descrição')),
+    ('gastei muito hoje', (None, None)),
+    ('recebi', (None, None)),
+]
+
+
+def cenario_extrator(repeticoes=20000):
+    """Mensagens/s do extrator antigo vs o de varredura única (a correção fica em test_extrator.py)"""
+    print('== extrator: valor e descrição ==')
+    legado = sum(extrair_legado(texto) == esperado for texto, esperado in AMOSTRAS_EXTRATOR)
+    novo = sum(app.extrair_valor_e_descricao(texto) == esperado for texto, esperado in AMOSTRAS_EXTRATOR)
+    print(f'amostras corretas: antigo {legado}/{len(AMOSTRAS_EXTRATOR)}, novo {novo}/{len(AMOSTRAS_EXTRATOR)}')
+
+    textos = [texto for texto, _ in AMOSTRAS_EXTRATOR]
+    voltas = repeticoes // len(textos)
+    print(f"{'implementação':>14} {'msg/s':>10}")
+    for nome, extrair in (('antigo', extrair_legado), ('varredura', app.extrair_valor_e_descricao)):
+        inicio = time.perf_counter()
+        for _ in range(voltas):
+            for texto in textos:
+                extrair(texto)
+        duracao = time.perf_counter() - inicio
+        print(f'{nome:>14} {voltas * len(textos) / duracao:>10.0f}')
+
+
+def cenario_agregados(tamanhos=(1000, 10000, 100000), repeticoes=200):
+    """resumo/total com totais incrementais vs varrendo o histórico; confere que não há deriva"""
+    print('== agregados: resumo / total ==')
+    print(f"{'histórico':>10} {'varrendo ms':>12} {'totais ms':>10}")
+    import random
+    aleatorio = random.Random(7)
+    backend = app.STORAGE_BACKEND
+    try:
+        for tamanho in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(tamanho)
+                usuario = app.obter_dados_usuario(app.carregar_dados())
+
+                vezes = min(repeticoes, 20)
+                inicio = time.perf_counter()
+                for _ in range(vezes):
+                    app.recalcular_totais(usuario['transacoes'])
+                varrendo = (time.perf_counter() - inicio) / vezes
+                app.processar_mensagem('resumo')
+                resumo = _medir('resumo', repeticoes)
+                print(f'{tamanho:>10} {varrendo * 1000:>12.3f} {resumo:>10.3f}')
+
+                # Carga com inclusões e desfazer intercalados, nos dois armazenamentos
+                app.importar_json_para_sqlite()
+                for app.STORAGE_BACKEND in ('json', 'sqlite'):
+                    for _ in range(300):
+                        comando = aleatorio.choice(['gasto 12,34 x', 'entrada 7,1 y', '+vr 5', 'vr 1,11 z',
+                                                    '+va 3', 'desfazer', 'pagar conta 1'])
+                        app.processar_mensagem(comando)
+                    divergencias = app.verificar_totais(app.carregar_dados())
+                    assert not divergencias, divergencias[:5]
+                app.STORAGE_BACKEND = backend
+    finally:
+        app.STORAGE_BACKEND = backend
+    print('totais sem divergência em json e sqlite')
+
+
+def gerar_historico_mensal(meses, por_mes, nome='Principal'):
+    """Grava dados no formato original com por_mes transações em cada um dos últimos meses (o atual incluso)"""
+    hoje = datetime.now()
+    dados = app.dados_vazios()
+    usuario = dados['usuarios'].setdefault(nome, app.novo_usuario())
+    del usuario['totais']
+    del usuario['saldos_iniciais']
+    esperado = {}
+    for atras in range(meses - 1, -1, -1):
+        ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - atras, 12)
+        chave = f'{ano:04d}-{mes + 1:02d}'
+        for i in range(por_mes):
+            tipo, valor = ('entrada', 100.0) if i % 10 == 0 else ('gasto', 1.0 + i % 7)
+            usuario['transacoes'].append({'tipo': tipo, 'valor': valor, 'descricao': f'item {i}',
+                                          'data': f'{1 + i % 28:02d}/{mes + 1:02d}/{ano:04d} 12:00',
+                                          'categoria': 'geral'})
+            usuario['saldo'] += valor if tipo == 'entrada' else -valor
+            quantidade, soma = esperado.setdefault(chave, {}).get(tipo, (0, 0))
+            esperado[chave][tipo] = (quantidade + 1, round(soma + valor, 2))
+    with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, indent=2, ensure_ascii=False)
+    return esperado
+
+
+def cenario_virada(meses=12, por_mes=5000, repeticoes=50):
+    """Virada de mês: arquivar os meses fechados vs apagar o histórico (comportamento antigo)"""
+    print('== virada de mês: arquivo mensal ==')
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar_ambiente(pasta)
+        esperado = gerar_historico_mensal(meses, por_mes)
+        mes_atual = datetime.now().strftime('%Y-%m')
+
+        inicio = time.perf_counter()
+        app.processar_mensagem('saldo')
+        primeira = time.perf_counter() - inicio
+        depois = _medir('gasto 1 x', repeticoes)
+
+        # Nada se perde: arquivo + mês atual = histórico gerado
+        usuario = app.obter_dados_usuario(app.carregar_dados())
+        arquivados = app.meses_arquivados('Principal')
+        assert arquivados == sorted(m for m in esperado if m != mes_atual), arquivados
+        for mes in arquivados:
+            assert len(app.transacoes_arquivadas('Principal', mes)) == por_mes
+            totais = app.resumo_arquivado('Principal', mes)['totais']['tipo']
+            assert {tipo: tuple(v) for tipo, v in totais.items()} == esperado[mes], mes
+        assert len(usuario['transacoes']) == por_mes + repeticoes
+        print(f'{meses} meses x {por_mes} transações: 1ª mensagem (arquiva {len(arquivados)} meses) '
+              f'{primeira * 1000:.0f} ms; depois {depois:.3f} ms por gasto')
+
+        inicio = time.perf_counter()
+        resposta = app.processar_mensagem(f'resumo {arquivados[0]}')
+        print(f'resumo {arquivados[0]} (lê só o resumo arquivado): {(time.perf_counter() - inicio) * 1000:.3f} ms')
+        assert 'RESUMO DE' in resposta
+        gerado = tamanho_gravado()
+        app._diario['compactando'] = True
+        app._compactar()
+        print(f'dados ativos: {gerado} bytes antes, {tamanho_gravado()} bytes depois de compactar')
+
+
+def extrato_completo_legado(transacoes):
+    """Implementação anterior de 'extrato completo': uma mensagem só, montada com +="""
+    texto = f"📋 *TODAS AS TRANSAÇÕES ({len(transacoes)})*\n\n"
+    for t in reversed(transacoes):
+        emoji = app.EMOJI_TIPO.get(t['tipo'], '📌')
+        sinal = '+' if 'entrada' in t['tipo'] or 'credito' in t['tipo'] else '-'
+        texto += f"{emoji} {sinal}R$ {t['valor']:.2f} - {t['descricao']}\n"
+        texto += f"   {t['data']}\n\n"
+    return texto.strip()
+
+
+def cenario_extrato(tamanhos=(1000, 10000, 100000), repeticoes=50):
+    """'extrato completo' em uma mensagem só vs paginado; confere o limite e a cobertura das páginas"""
+    print('== extrato completo: mensagem única vs páginas ==')
+    print(f"{'histórico':>10} {'único ms':>9} {'único chars':>12} {'página ms':>10} {'maior página':>13}")
+    backend = app.STORAGE_BACKEND
+    try:
+        for tamanho in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(tamanho)
+                usuario = app.obter_dados_usuario(app.carregar_dados())
+
+                vezes = min(repeticoes, 5)
+                inicio = time.perf_counter()
+                for _ in range(vezes):
+                    unico = extrato_completo_legado(usuario['transacoes'])
+                legado = (time.perf_counter() - inicio) / vezes
+
+                paginas = [app.processar_mensagem('extrato completo')]
+                if tamanho <= 1000:
+                    # Percorre tudo com 'extrato mais': cada transação aparece uma vez, em ordem
+                    while "extrato mais" in paginas[-1]:
+                        paginas.append(app.processar_mensagem('extrato mais'))
+                    itens = sum(texto.count('\n   ') for texto in paginas)
+                    assert itens == tamanho, (itens, tamanho)
+                    assert 'Não há mais páginas' in app.processar_mensagem('extrato mais')
+                pagina = _medir('extrato página 2', repeticoes)
+                maior = max(len(texto) for texto in paginas)
+                assert maior <= app.LIMITE_MENSAGEM
+                print(f'{tamanho:>10} {legado * 1000:>9.1f} {len(unico):>12} {pagina:>10.3f} {maior:>13}')
+
+                # A mesma página no SQLite sai de uma consulta com LIMIT/OFFSET
+                app.importar_json_para_sqlite()
+                app.STORAGE_BACKEND = 'sqlite'
+                assert app.processar_mensagem('extrato página 2') == app.pagina_extrato(usuario['transacoes'], 2)[0]
+                print(f'{tamanho:>10} {"sqlite":>9} {"":>12} {_medir("extrato página 2", repeticoes):>10.3f}')
+                app.STORAGE_BACKEND = backend
+    finally:
+        app.STORAGE_BACKEND = backend
+
+
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+
+
+def _esperar_servidor(porta, processo, limite=30):
+    """Espera o servidor responder em /teste"""
+    fim = time.time() + limite
+    while time.time() < fim:
+        assert processo.poll() is None, 'servidor saiu antes de responder'
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{porta}/teste', timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f'servidor não respondeu na porta {porta}')
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def cenario_servidor(remetentes=16, mensagens=50, porta=5099):
+    """Servidor de desenvolvimento (app.run) vs gunicorn: vazão e latência do /whatsapp via HTTP"""
+    print('== servidor: app.run vs gunicorn ==')
+    print(f"{'modo':>12} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    modos = {
+        'app.run': [sys.executable, os.path.join(PASTA_APP, 'whatsapp_financas.py')],
+        'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(PASTA_APP, 'gunicorn.conf.py'),
+                     '--access-logfile', '/dev/null', 'whatsapp_financas:app'],
+    }
+    for modo, comando in modos.items():
+        with tempfile.TemporaryDirectory() as pasta:
+            ambiente = dict(os.environ, PORT=str(porta), PYTHONPATH=PASTA_APP)
+            processo = subprocess.Popen(comando, cwd=pasta, env=ambiente,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                _esperar_servidor(porta, processo)
+                latencias = []
+                falhas = []
+
+                def enviar(remetente):
+                    for i in range(mensagens):
+                        corpo = 'entrada 3 salario' if i % 2 == 0 else 'gasto 1,5 lanche'
+                        formulario = urllib.parse.urlencode({'Body': corpo, 'From': remetente}).encode()
+                        inicio = time.perf_counter()
+                        try:
+                            urllib.request.urlopen(f'http://127.0.0.1:{porta}/whatsapp', formulario, timeout=30).read()
+                        except OSError as erro:
+                            falhas.append(erro)
+                        latencias.append(time.perf_counter() - inicio)
+
+                grupo = [f'whatsapp:+55118{r:04d}' for r in range(remetentes)]
+                threads = [threading.Thread(target=enviar, args=(r,)) for r in grupo]
+                inicio = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                duracao = time.perf_counter() - inicio
+            finally:
+                # Encerramento gracioso: SIGTERM e espera os workers gravarem o pendente
+                processo.send_signal(signal.SIGTERM)
+                processo.wait(60)
+            assert not falhas, falhas[:3]
+
+            # Confere no disco, depois do encerramento, o saldo de cada remetente
+            preparar_ambiente(pasta)
+            dados = app.carregar_dados()
+            esperado = (mensagens + 1) // 2 * 3 - mensagens // 2 * 1.5
+            for remetente in grupo:
+                usuario = dados['usuarios'][dados['remetentes'][remetente]]
+                assert abs(usuario['saldo'] - esperado) < 1e-6, (modo, remetente, usuario['saldo'])
+            total = remetentes * mensagens
+            print(f'{modo:>12} {total / duracao:>8.0f} {_percentil(latencias, 0.5) * 1000:>8.1f} '
+                  f'{_percentil(latencias, 0.99) * 1000:>8.1f}')
+
+
+def cenario_assincrono(remetentes=8, mensagens=25, atraso_disco=0.02):
+    """Confirmação do webhook: síncrona vs fila assíncrona, com gravação lenta simulada (a ordem
+    das respostas e as métricas da fila são conferidas em test_fila.py)"""
+    print(f'== assíncrono: confirmação do webhook (gravação de {atraso_disco * 1000:.0f} ms) ==')
+    print(f"{'modo':>11} {'p50 ms':>8} {'p99 ms':>8} {'atraso médio ms':>16} {'atraso máx ms':>14}")
+    salvar, enviar, assincrona = app.salvar_dados, app.enviar_resposta, app.RESPOSTA_ASSINCRONA
+
+    def salvar_lento(dados):
+        time.sleep(atraso_disco)
+        return salvar(dados)
+
+    def enviar_falso(destino, origem, texto):
+        pass
+
+    app.salvar_dados = salvar_lento
+    app.enviar_resposta = enviar_falso
+    try:
+        for app.RESPOSTA_ASSINCRONA in (False, True):
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                cliente = app.app.test_client()
+                latencias = []
+                grupo = [f'whatsapp:+55117{r:04d}' for r in range(remetentes)]
+
+                def enviar(remetente):
+                    for _ in range(mensagens):
+                        inicio = time.perf_counter()
+                        resposta = cliente.post('/whatsapp', data={'Body': 'entrada 1 x', 'From': remetente,
+                                                                   'To': 'whatsapp:+14155238886'})
+                        latencias.append(time.perf_counter() - inicio)
+                        assert resposta.status_code == 200
+
+                threads = [threading.Thread(target=enviar, args=(r,)) for r in grupo]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                metricas = {'atraso_medio': 0, 'atraso_maximo': 0}
+                if app.RESPOSTA_ASSINCRONA:
+                    while app.metricas_fila()['pendentes']:
+                        time.sleep(0.01)
+                    metricas = app.metricas_fila()
+                    app._esvaziar_fila(10)
+                modo = 'assíncrono' if app.RESPOSTA_ASSINCRONA else 'síncrono'
+                print(f'{modo:>11} {_percentil(latencias, 0.5) * 1000:>8.1f} {_percentil(latencias, 0.99) * 1000:>8.1f} '
+                      f'{metricas["atraso_medio"] * 1000:>16.1f} {metricas["atraso_maximo"] * 1000:>14.1f}')
+    finally:
+        app.salvar_dados, app.enviar_resposta, app.RESPOSTA_ASSINCRONA = salvar, enviar, assincrona
+
+
+def cenario_durabilidade(remetentes=8, mensagens=100):
+    """Vazão de gravação em cada nível de durabilidade (sempre / lote / os), nos dois armazenamentos"""
+    print('== durabilidade: fsync por mensagem vs em lote vs cache do sistema ==')
+    print(f"{'armazenamento':>13} {'nível':>7} {'msg/s':>8} {'p99 ms':>8}")
+    durabilidade, backend = app.DURABILIDADE, app.STORAGE_BACKEND
+    try:
+        for app.STORAGE_BACKEND in ('json', 'sqlite'):
+            for app.DURABILIDADE in ('sempre', 'lote', 'os'):
+                with tempfile.TemporaryDirectory() as pasta:
+                    preparar_ambiente(pasta)
+                    app._sqlite.conexao = None
+                    latencias = []
+
+                    def enviar(remetente):
+                        for _ in range(mensagens):
+                            inicio = time.perf_counter()
+                            app.processar_mensagem('gasto 1 x', remetente)
+                            latencias.append(time.perf_counter() - inicio)
+
+                    threads = [threading.Thread(target=enviar, args=(f'whatsapp:+55116{r:04d}',))
+                               for r in range(remetentes)]
+                    inicio = time.perf_counter()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    duracao = time.perf_counter() - inicio
+                    print(f'{app.STORAGE_BACKEND:>13} {app.DURABILIDADE:>7} '
+                          f'{remetentes * mensagens / duracao:>8.0f} {_percentil(latencias, 0.99) * 1000:>8.2f}')
+    finally:
+        app.DURABILIDADE, app.STORAGE_BACKEND = durabilidade, backend
+        app._sqlite.conexao = None
+
+
+def gerar_dados_variados(quantidade, nome='Principal'):
+    """Histórico com datas, valores, categorias e descrições variados (mais próximo do uso real)"""
+    import random
+    aleatorio = random.Random(13)
+    dados = app.dados_vazios()
+    usuario = dados['usuarios'].setdefault(nome, app.novo_usuario())
+    descricoes = ['almoço', 'mercado', 'uber', 'farmácia', 'padaria', 'cinema', 'salário', 'aluguel']
+    inicio = datetime(2024, 1, 1).timestamp()
+    for i in range(quantidade):
+        momento = datetime.fromtimestamp(inicio + i * 600 + aleatorio.randrange(600))
+        usuario['transacoes'].append({
+            'tipo': aleatorio.choice(['gasto', 'gasto', 'gasto', 'vr', 'va', 'entrada']),
+            'valor': aleatorio.randrange(1, 500000) / 100,
+            'descricao': f'{aleatorio.choice(descricoes)} {i % 97}',
+            'data': momento.strftime('%d/%m/%Y %H:%M'),
+            'categoria': aleatorio.choice(['geral', 'alimentacao', 'transporte', None])
+        })
+    return dados
+
+
+def cenario_codificacao(tamanhos=(100000, 1000000)):
+    """Tamanho e tempo de leitura do snapshot: JSON indentado vs compacto (com e sem zlib)"""
+    print('== codificação do snapshot ==')
+    print(f"{'histórico':>10} {'formato':>16} {'bytes':>11} {'gravar ms':>10} {'ler ms':>9}")
+    formatos = {
+        'json indentado': (lambda d: json.dumps(d, indent=2, ensure_ascii=False).encode('utf-8'),
+                           lambda b: json.loads(b.decode('utf-8'))),
+        'compacto': (lambda d: app.codificar_snapshot(d, False), app.decodificar_snapshot),
+        'compacto + zlib': (lambda d: app.codificar_snapshot(d, True), app.decodificar_snapshot),
+    }
+    for tamanho in tamanhos:
+        dados = gerar_dados_variados(tamanho)
+        for formato, (codificar, decodificar) in formatos.items():
+            inicio = time.perf_counter()
+            conteudo = codificar(dados)
+            gravar = time.perf_counter() - inicio
+            inicio = time.perf_counter()
+            lido = decodificar(conteudo)
+            ler = time.perf_counter() - inicio
+            assert lido == dados, f'{formato}: ida e volta perdeu informação'
+            print(f'{tamanho:>10} {formato:>16} {len(conteudo):>11} {gravar * 1000:>10.1f} {ler * 1000:>9.1f}')
+            del lido
+
+    # Caminho completo: compactação grava no formato novo e a leitura reconhece os dois
+    formato = app.FORMATO_SNAPSHOT
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico(1000)
+            app.FORMATO_SNAPSHOT = 'compacto'
+            for comando in ('gasto 12,34 almoço', '+vr 50', 'desfazer', 'entrada 1.234,56 salário'):
+                app.processar_mensagem(comando)
+            esperado = json.loads(json.dumps(app.carregar_dados()))
+            app._compactar()
+            with open(app.DATA_FILE, 'rb') as f:
+                assert f.read(4) == app.MAGICO_COMPACTO
+            app._cache['dados'] = None
+            assert app.carregar_dados() == esperado
+    finally:
+        app.FORMATO_SNAPSHOT = formato
+    print('snapshot compacto sem perdas (ida e volta e compactação)')
+
+
+def cenario_dinheiro(operacoes=1000000, tamanhos=(100000, 1000000)):
+    """Saldos em float (+=) vs centavos inteiros: vazão, erro acumulado e verificação em lote"""
+    import random
+    aleatorio = random.Random(3)
+    valores = [aleatorio.randrange(1, 100000) / 100 for _ in range(operacoes)]
+    sinais = [aleatorio.choice((1, -1)) for _ in range(operacoes)]
+    exato = sum(sinal * round(valor * 100) for sinal, valor in zip(sinais, valores))
+
+    print(f'== dinheiro: {operacoes} atualizações de saldo ==')
+    print(f"{'caminho':>10} {'atualizações/s':>15} {'saldo final':>22} {'erro':>10}")
+    inicio = time.perf_counter()
+    saldo = 0
+    for sinal, valor in zip(sinais, valores):
+        saldo += sinal * valor
+    tempo_float = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    saldos = {'saldo': 0}
+    for sinal, valor in zip(sinais, valores):
+        app.aplicar_efeito(saldos, {'tipo': 'entrada' if sinal > 0 else 'gasto', 'valor': valor})
+    tempo_centavos = time.perf_counter() - inicio
+    for caminho, tempo, final in (('float', tempo_float, saldo), ('centavos', tempo_centavos, saldos['saldo'])):
+        print(f'{caminho:>10} {operacoes / tempo:>15.0f} {final!r:>22} {final - app.reais(exato):>10.2e}')
+    assert saldos['saldo'] == app.reais(exato)
+
+    print('== dinheiro: agregação do histórico ==')
+    print(f"{'histórico':>10} {'float ms':>9} {'centavos ms':>12} {'verificar json ms':>18} {'verificar sqlite ms':>20}")
+    backend = app.STORAGE_BACKEND
+    try:
+        for tamanho in tamanhos:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(tamanho)
+                usuario = app.obter_dados_usuario(app.carregar_dados())
+                transacoes = usuario['transacoes']
+
+                inicio = time.perf_counter()
+                soma = 0
+                for t in transacoes:
+                    if t['tipo'] == 'gasto':
+                        soma -= t['valor']
+                agregar_float = time.perf_counter() - inicio
+                inicio = time.perf_counter()
+                efeitos = app.efeitos_do_historico(transacoes)
+                agregar_centavos = time.perf_counter() - inicio
+                assert efeitos['saldo'] == app.centavos(soma)
+
+                app.saldos_iniciais(usuario)  # dados antigos: deduzidos uma vez, na primeira vez
+                inicio = time.perf_counter()
+                assert not app.verificar_saldos(app.carregar_dados())
+                verificar_json = time.perf_counter() - inicio
+                app.importar_json_para_sqlite()
+                app.STORAGE_BACKEND = 'sqlite'
+                inicio = time.perf_counter()
+                assert not app.verificar_saldos(app.carregar_dados())
+                verificar_sqlite = time.perf_counter() - inicio
+                app.STORAGE_BACKEND = backend
+                print(f'{tamanho:>10} {agregar_float * 1000:>9.1f} {agregar_centavos * 1000:>12.1f} '
+                      f'{verificar_json * 1000:>18.1f} {verificar_sqlite * 1000:>20.1f}')
+
+        # Carga com centavos quebrados, desfazer, apagar histórico e virada de mês: saldos batem com o histórico
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico_mensal(3, 200)
+            comandos = ['gasto 0,10 x', 'entrada 0,20 y', '+vr 0,30', 'vr 0,01 z', '+va 1,005', 'va 0,07 w',
+                        'gastei 1,5 mil no carro', 'desfazer', 'conta fixa 33,33 5 luz', 'pagar conta 1']
+            for app.STORAGE_BACKEND in ('json', 'sqlite'):
+                for rodada in range(1000):
+                    app.processar_mensagem(aleatorio.choice(comandos))
+                    if rodada == 500:
+                        app.processar_mensagem('apagar historico')
+                divergencias = app.verificar_saldos(app.carregar_dados())
+                assert not divergencias, divergencias
+                if app.STORAGE_BACKEND == 'json':
+                    app.importar_json_para_sqlite()
+            app.STORAGE_BACKEND = 'json'
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico_mensal(3, 200)
+            for _ in range(100):
+                app.processar_mensagem(aleatorio.choice(comandos))
+            dados = app.carregar_dados()
+            arquivadas = [t for mes in app.meses_arquivados('Principal')
+                          for t in app.transacoes_arquivadas('Principal', mes)]
+            # Começou do zero: os saldos iniciais são exatamente o efeito dos meses arquivados
+            assert arquivadas and dados['usuarios']['Principal']['saldos_iniciais'] == {
+                campo: app.reais(efeito) for campo, efeito in app.efeitos_do_historico(arquivadas).items()}
+            assert not app.verificar_saldos(dados)
+    finally:
+        app.STORAGE_BACKEND = backend
+    print('saldos sem divergência em json e sqlite (com desfazer, apagar histórico e virada)')
+
+
+def gerar_extratos(pasta, linhas):
+    """Grava extrato.csv e extrato.ofx com `linhas` lançamentos nos últimos dias; retorna os caminhos"""
+    import random
+    aleatorio = random.Random(11)
+    hoje = datetime.now().timestamp()
+    lancamentos = []
+    for i in range(linhas):
+        momento = datetime.fromtimestamp(hoje - aleatorio.randrange(20 * 86400))
+        quantia = aleatorio.randrange(1, 50000) * (1 if i % 10 == 0 else -1)
+        lancamentos.append((momento, quantia, f'Compra {aleatorio.choice(["padaria", "mercado", "posto", "pix"])} {i}'))
+    csv_caminho = os.path.join(pasta, 'extrato.csv')
+    with open(csv_caminho, 'w', encoding='utf-8') as f:
+        f.write('Data;Descrição;Valor\n')
+        for momento, quantia, descricao in lancamentos:
+            valor = f'{abs(quantia) // 100:,}'.replace(',', '.') + f',{abs(quantia) % 100:02d}'
+            f.write(f"{momento:%d/%m/%Y %H:%M};{descricao};{'-' if quantia < 0 else ''}{valor}\n")
+    ofx_caminho = os.path.join(pasta, 'extrato.ofx')
+    with open(ofx_caminho, 'w', encoding='utf-8') as f:
+        f.write('OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n')
+        for i, (momento, quantia, descricao) in enumerate(lancamentos):
+            f.write(f'<STMTTRN>\n<TRNTYPE>{"CREDIT" if quantia > 0 else "DEBIT"}\n<DTPOSTED>{momento:%Y%m%d%H%M}00[-3:BRT]\n'
+                    f'<TRNAMT>{quantia / 100:.2f}\n<FITID>{i}\n<MEMO>{descricao}\n</STMTTRN>\n')
+        f.write('</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n')
+    return csv_caminho, ofx_caminho, sum(quantia for _, quantia, _ in lancamentos)
+
+
+def cenario_importacao(linhas=100000, mensagens=2000):
+    """Extrato com `linhas` lançamentos: uma mensagem por transação vs importação em lote"""
+    import tracemalloc
+    print(f'== importação de extrato: {linhas} lançamentos ==')
+    print(f"{'caminho':>28} {'segundos':>9} {'lançamentos/s':>14}")
+    backend = app.STORAGE_BACKEND
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            inicio = time.perf_counter()
+            for i in range(mensagens):
+                app.processar_mensagem(f'gasto {1 + i % 50},{i % 100:02d} compra {i}')
+            por_mensagem = (time.perf_counter() - inicio) / mensagens
+            if app._diario['thread']:
+                app._diario['thread'].join()
+            print(f"{'mensagem a mensagem (est.)':>28} {por_mensagem * linhas:>9.1f} {1 / por_mensagem:>14.0f}")
+
+        for app.STORAGE_BACKEND, formato in (('json', 'csv'), ('json', 'ofx'), ('sqlite', 'csv')):
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                csv_caminho, ofx_caminho, _ = gerar_extratos(pasta, linhas)
+                caminho = ofx_caminho if formato == 'ofx' else csv_caminho
+                for rodada in ('lote', 'reimportar'):
+                    inicio = time.perf_counter()
+                    with open(caminho, 'rb') as f:
+                        app.importar_extrato(f, 'Principal')
+                    tempo = time.perf_counter() - inicio
+                    rotulo = f'{rodada} {formato} ({app.STORAGE_BACKEND})'
+                    print(f'{rotulo:>28} {tempo:>9.2f} {linhas / tempo:>14.0f}')
+
+        # Memória: o leitor e o executemany do SQLite não acumulam o arquivo
+        app.STORAGE_BACKEND = 'sqlite'
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            csv_caminho, ofx_caminho, _ = gerar_extratos(pasta, linhas)
+            for caminho in (csv_caminho, ofx_caminho):
+                tracemalloc.start()
+                with open(caminho, 'rb') as f:
+                    app.importar_extrato(f, os.path.basename(caminho))
+                _, pico = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f'{os.path.basename(caminho)}: {os.path.getsize(caminho) / 2 ** 20:.1f} MB no disco, '
+                      f'pico de {pico / 2 ** 20:.1f} MB alocados (sqlite)')
+    finally:
+        app.STORAGE_BACKEND = backend
+
+
+def cenario_metricas(mensagens=2000, rodadas=6):
+    """Custo das métricas e do profiler por amostragem no processar_mensagem; confere o /metrics"""
+    import re
+    print(f'== métricas: {mensagens} mensagens ==')
+    print(f"{'modo':>24} {'msg/s':>8} {'custo':>7}")
+    comandos = ['gasto 12,50 almoço', 'gastei 30 no mercado', 'saldo', 'resumo', 'extrato', '+vr 10', 'vr 1 pão']
+    durabilidade, metricas, compactar_apos = app.DURABILIDADE, app.METRICAS, app.COMPACTAR_APOS
+    # Sem fsync nem compactação em segundo plano, para o custo das métricas não sumir no ruído
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'os', 10 ** 9
+    try:
+        medidas = {}
+        # Cada rodada de cada modo parte dos mesmos dados; os modos se alternam
+        modos = ['sem métricas', 'com métricas', 'métricas + profiler']
+        for rodada in range(rodadas):
+            for modo in (modos if rodada % 2 == 0 else modos[::-1]):
+                with tempfile.TemporaryDirectory() as pasta:
+                    preparar_ambiente(pasta)
+                    gerar_historico(1000)
+                    app.processar_mensagem('saldo')
+                    app.METRICAS = modo != 'sem métricas'
+                    if modo == 'métricas + profiler':
+                        app.ligar_perfil(0.01)
+                    inicio = time.perf_counter()
+                    for i in range(mensagens):
+                        app.processar_mensagem(comandos[i % len(comandos)], f'whatsapp:+55{i % 8}')
+                    medidas[modo] = max(medidas.get(modo, 0), mensagens / (time.perf_counter() - inicio))
+                    app.desligar_perfil()
+        base = medidas['sem métricas']
+        for modo in modos:
+            vazao = medidas[modo]
+            print(f'{modo:>24} {vazao:>8.0f} {(base / vazao - 1) * 100:>6.1f}%')
+        assert app.perfil_coletado().count('processar_mensagem') > 0
+
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            app.METRICAS = True
+            app.processar_mensagem('gastei 10 no bar')
+            texto = app.app.test_client().get('/metrics').get_data(as_text=True)
+            amostra = re.compile(r'[a-z_]+(\{[^}]*\})? -?[0-9.e+-]+(inf)?')
+            for linha in texto.splitlines():
+                assert linha.startswith('# ') or amostra.fullmatch(linha), linha
+            assert 'financas_comandos_total{comando="linguagem_natural"}' in texto
+            assert 'financas_transacoes{usuario="Principal"}' in texto
+    finally:
+        app.DURABILIDADE, app.METRICAS, app.COMPACTAR_APOS = durabilidade, metricas, compactar_apos
+        app.desligar_perfil()
+    print('/metrics no formato do Prometheus')
+
+
+def cenario_repetidas(mensagens=2000, repeticoes=3):
+    """Webhook com MessageSid repetido: custo da checagem e da repetição (a correção fica em
+    test_repetidas.py)"""
+    print(f'== repetidas: {mensagens} mensagens ==')
+    # Custo: sem MessageSid, com MessageSid novo e entrega repetida
+    print(f"{'entrega':>20} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for modo in ('sem MessageSid', 'MessageSid novo', 'repetida'):
+        melhor = None
+        for _ in range(repeticoes):
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(1000)
+                cliente = app.app.test_client()
+                if modo == 'repetida':
+                    for i in range(mensagens):
+                        cliente.post('/whatsapp', data={'Body': 'gasto 1 café', 'From': 'whatsapp:+55', 'MessageSid': f'SM{i}'})
+                latencias = []
+                inicio = time.perf_counter()
+                for i in range(mensagens):
+                    formulario = {'Body': 'gasto 1 café', 'From': 'whatsapp:+55'}
+                    if modo != 'sem MessageSid':
+                        formulario['MessageSid'] = f'SM{i}'
+                    antes = time.perf_counter()
+                    cliente.post('/whatsapp', data=formulario)
+                    latencias.append(time.perf_counter() - antes)
+                duracao = time.perf_counter() - inicio
+                app.encerrar()
+                if melhor is None or duracao < melhor[0]:
+                    melhor = (duracao, latencias)
+        duracao, latencias = melhor
+        print(f'{modo:>20} {mensagens / duracao:>8.0f} {_percentil(latencias, 0.5) * 1000:>8.2f} '
+              f'{_percentil(latencias, 0.99) * 1000:>8.2f}')
+
+
+def gerar_contas_fixas(usuarios, por_usuario, inicio):
+    """Grava `usuarios` usuários com `por_usuario` contas fixas cada; metade no formato antigo (sem vencimento)"""
+    dados = app.dados_vazios()
+    sorteio = random.Random(7)
+    for u in range(usuarios):
+        usuario = dados['usuarios'].setdefault(f'U{u}', app.novo_usuario())
+        for c in range(por_usuario):
+            dia = sorteio.randint(1, 31)
+            conta = {'valor': 10.0 + c, 'dia': dia, 'descricao': f'conta {c}'}
+            if u % 2 == 0:
+                conta['vencimento'] = app.proximo_vencimento(dia, inicio).isoformat()
+            usuario['contas_fixas'].append(conta)
+        usuario['contas_fixas'].sort(key=lambda conta: conta['dia'])
+    with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+
+
+def varrer_contas_fixas(dados, hoje):
+    """Sem índice: percorre todos os usuários e contas atrás das que vencem hoje"""
+    ultimo = calendar.monthrange(hoje.year, hoje.month)[1]
+    return [
+        (nome, conta) for nome, usuario in dados['usuarios'].items()
+        for conta in usuario['contas_fixas']
+        if min(conta['dia'], ultimo) == hoje.day
+    ]
+
+
+def cenario_agenda(usuarios=20000, por_usuario=2, ociosos=200):
+    """Agenda das contas fixas: ciclo ocioso e ciclo do dia com índice vs varredura (a correção
+    fica em test_agenda.py)"""
+    print(f'== agenda: {usuarios} usuários x {por_usuario} contas fixas ==')
+    modo, durabilidade, compactar_apos = app.AGENDA_MODO, app.DURABILIDADE, app.COMPACTAR_APOS
+    app.AGENDA_MODO, app.DURABILIDADE, app.COMPACTAR_APOS = 'debitar', 'os', 10 ** 9
+    inicio = date(2026, 1, 1)
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            app.marcar_contas_alteradas()
+            gerar_contas_fixas(usuarios, por_usuario, inicio)
+            if app.STORAGE_BACKEND == 'sqlite':
+                app.importar_json_para_sqlite()
+            elif app.STORAGE_BACKEND == 'particoes':
+                app.importar_json_para_particoes()
+            dados = app.carregar_dados()
+            antes = time.perf_counter()
+            app._atualizar_indice(inicio)
+            print(f'índice montado em {(time.perf_counter() - antes) * 1000:.0f} ms')
+
+            # Dois meses, um ciclo por dia; entre eles, ciclos sem nada vencendo
+            dias, lancadas, ocioso, varredura = [], 0, [], []
+            for n in range(59):
+                hoje = inicio + timedelta(days=n)
+                antes = time.perf_counter()
+                lancadas += len(app.executar_agenda(hoje))
+                dias.append(time.perf_counter() - antes)
+                if n < 5:
+                    for _ in range(ociosos):
+                        antes = time.perf_counter()
+                        app.executar_agenda(hoje)
+                        ocioso.append(time.perf_counter() - antes)
+                        antes = time.perf_counter()
+                        varrer_contas_fixas(dados, hoje)
+                        varredura.append(time.perf_counter() - antes)
+            print(f"{'ciclo':>22} {'p50 ms':>8} {'p99 ms':>8}")
+            print(f"{'ocioso (índice)':>22} {_percentil(ocioso, 0.5) * 1000:>8.3f} {_percentil(ocioso, 0.99) * 1000:>8.3f}")
+            print(f"{'ocioso (varredura)':>22} {_percentil(varredura, 0.5) * 1000:>8.3f} {_percentil(varredura, 0.99) * 1000:>8.3f}")
+            print(f"{'do dia (índice)':>22} {_percentil(dias, 0.5) * 1000:>8.3f} {_percentil(dias, 0.99) * 1000:>8.3f}")
+            print(f'{lancadas} contas lançadas em 2 meses, uma vez por mês cada')
+    finally:
+        app.AGENDA_MODO, app.DURABILIDADE, app.COMPACTAR_APOS = modo, durabilidade, compactar_apos
+        app.marcar_contas_alteradas()
+
+
+def _reiniciar_processo():
+    """Esquece os dados residentes, como um processo que acabou de subir"""
+    app._cache.update(dados=None, assinatura=None, posicao=0)
+    app._persistido.update(seq=0, meta={}, remetentes={}, usuarios={})
+    app._particoes.update(dados=None, assinatura=None, meta=None, usuarios={}, contas=0)
+
+
+def cenario_particoes(totais=(100, 1000, 10000), historico=200, repeticoes=200):
+    """Um arquivo por usuário vs snapshot + diário: latência de um usuário conforme o total de
+    usuários (a correção fica em test_particoes.py)"""
+    print(f'== partições: {historico} transações por usuário ==')
+    print(f"{'usuários':>9} {'backend':>10} {'1ª msg ms':>10} {'gasto p50':>10} {'saldo p50':>10} {'usuarios ms':>12}")
+    backend, durabilidade, compactar_apos = app.STORAGE_BACKEND, app.DURABILIDADE, app.COMPACTAR_APOS
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'os', 10 ** 9
+    resultados = {}
+    try:
+        for total in totais:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                gerar_historico(historico, ['Principal'] + [f'U{n}' for n in range(total - 1)])
+                app.STORAGE_BACKEND = 'particoes'
+                app.importar_json_para_particoes()
+                for nome in ('json', 'particoes'):
+                    app.STORAGE_BACKEND = nome
+                    _reiniciar_processo()
+                    antes = time.perf_counter()
+                    app.processar_mensagem('saldo')
+                    primeira = time.perf_counter() - antes
+
+                    gastos, saldos = [], []
+                    for _ in range(repeticoes):
+                        antes = time.perf_counter()
+                        app.processar_mensagem('gasto 1 café')
+                        gastos.append(time.perf_counter() - antes)
+                        antes = time.perf_counter()
+                        app.processar_mensagem('saldo')
+                        saldos.append(time.perf_counter() - antes)
+
+                    antes = time.perf_counter()
+                    app.processar_mensagem('usuarios')
+                    listagem = time.perf_counter() - antes
+                    resultados[total, nome] = _percentil(gastos, 0.5)
+                    print(f'{total:>9} {nome:>10} {primeira * 1000:>10.2f} {_percentil(gastos, 0.5) * 1000:>10.3f} '
+                          f'{_percentil(saldos, 0.5) * 1000:>10.3f} {listagem * 1000:>12.1f}')
+        menor, maior = min(totais), max(totais)
+        print(f"gasto com {maior} usuários / com {menor}: json {resultados[maior, 'json'] / resultados[menor, 'json']:.1f}x, "
+              f"partições {resultados[maior, 'particoes'] / resultados[menor, 'particoes']:.1f}x")
+    finally:
+        app.STORAGE_BACKEND, app.DURABILIDADE, app.COMPACTAR_APOS = backend, durabilidade, compactar_apos
+
+
+def buscar_linear(transacoes, consulta):
+    """Sem índice: normaliza e confere a descrição de cada transação do histórico"""
+    # Sem o cache de termos do app, como seria sem índice
+    termos_busca = app.termos_busca.__wrapped__
+    termos = termos_busca(consulta)
+    return [posicao for posicao, transacao in enumerate(transacoes)
+            if termos <= termos_busca(transacao['descricao'])]
+
+
+def cenario_busca(tamanho=100000, repeticoes=50):
+    """buscar <termo>: índice invertido vs varredura do histórico; atualização incremental"""
+    print(f'== busca: histórico de {tamanho} ==')
+    durabilidade, compactar_apos = app.DURABILIDADE, app.COMPACTAR_APOS
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'os', 10 ** 9
+    consultas = ('cinema 5', 'farmacia', 'Padaria 12')
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            app._indices['entradas'].clear()
+            with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+                json.dump(gerar_dados_variados(tamanho), f, ensure_ascii=False)
+            transacoes = app.carregar_dados()['usuarios']['Principal']['transacoes']
+
+            inicio = time.perf_counter()
+            entrada = app.indice_historico('Principal', transacoes, termos=True)
+            print(f'índice montado em {(time.perf_counter() - inicio) * 1000:.0f} ms '
+                  f"({len(entrada['termos'])} termos)")
+
+            print(f"{'consulta':>12} {'resultados':>11} {'índice ms':>10} {'varredura ms':>13} {'comando ms':>11}")
+            for consulta in consultas:
+                esperado = buscar_linear(transacoes, consulta)
+                inicio = time.perf_counter()
+                for _ in range(repeticoes):
+                    posicoes = app.buscar_transacoes(app.indice_historico('Principal', transacoes, termos=True), consulta)
+                indexada = (time.perf_counter() - inicio) / repeticoes
+                assert posicoes == esperado, consulta
+                inicio = time.perf_counter()
+                for _ in range(3):
+                    buscar_linear(transacoes, consulta)
+                varredura = (time.perf_counter() - inicio) / 3
+                comando = _medir(f'buscar {consulta}', repeticoes)
+                print(f'{consulta:>12} {len(esperado):>11} {indexada * 1000:>10.3f} {varredura * 1000:>13.1f} {comando:>11.3f}')
+
+            # Lançar e desfazer entre buscas: só a ponta do histórico é reindexada
+            incremental = []
+            for n in range(repeticoes):
+                app.processar_mensagem(f'gasto {n + 1} padaria central')
+                if n % 3 == 2:
+                    app.processar_mensagem('apagar ultima')
+                inicio = time.perf_counter()
+                resposta = app.processar_mensagem('buscar padaria central')
+                incremental.append(time.perf_counter() - inicio)
+            esperado = buscar_linear(transacoes, 'padaria central')
+            assert app.buscar_transacoes(app.indice_historico('Principal', transacoes, termos=True), 'padaria central') == esperado
+            assert f'{len(esperado)} transação(ões)' in resposta, resposta
+            print(f'buscar após lançar/desfazer: p50 {_percentil(incremental, 0.5) * 1000:.3f} ms, '
+                  f'p99 {_percentil(incremental, 0.99) * 1000:.3f} ms')
+    finally:
+        app.DURABILIDADE, app.COMPACTAR_APOS = durabilidade, compactar_apos
+
+
+def gerar_historico_do_mes(quantidade, fora_de_ordem=100):
+    """Histórico ativo com `quantidade` transações espalhadas do início do mês até agora,
+    com algumas datas retroativas no fim (como num extrato importado)"""
+    agora = datetime.now().replace(second=0, microsecond=0)
+    inicio = agora.replace(day=1, hour=0, minute=0)
+    passo = max(1, int((agora - inicio).total_seconds() // 60)) / quantidade
+    sorteio = random.Random(5)
+    dados = app.dados_vazios()
+    usuario = dados['usuarios']['Principal']
+    for i in range(quantidade):
+        minuto = int(i * passo) if i < quantidade - fora_de_ordem else sorteio.randrange(int(quantidade * passo))
+        usuario['transacoes'].append({
+            'tipo': sorteio.choice(['gasto', 'gasto', 'gasto_vr', 'gasto_va', 'entrada']),
+            'valor': sorteio.randrange(100, 20000) / 100,
+            'descricao': f'compra {i}',
+            'data': (inicio + timedelta(minutes=minuto)).strftime('%d/%m/%Y %H:%M'),
+            'categoria': 'geral',
+        })
+    del usuario['totais']
+    del usuario['saldos_iniciais']
+    with open(app.DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+    return usuario['transacoes']
+
+
+def periodo_linear(transacoes, inicio, fim):
+    """Sem índice: converte a data de cada transação e filtra"""
+    return sorted(
+        (datetime.strptime(t['data'], '%d/%m/%Y %H:%M'), posicao, app._chave_indice(t))
+        for posicao, t in enumerate(transacoes)
+        if inicio <= datetime.strptime(t['data'], '%d/%m/%Y %H:%M') < fim
+    )
+
+
+def cenario_periodos(tamanho=100000, repeticoes=50):
+    """gastos hoje / extrato de um período / resumo dos últimos dias: índice por data vs varredura"""
+    print(f'== consultas por período: histórico de {tamanho} ==')
+    durabilidade, compactar_apos = app.DURABILIDADE, app.COMPACTAR_APOS
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'os', 10 ** 9
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            app._indices['entradas'].clear()
+            gerar_historico_do_mes(tamanho)
+            transacoes = app.carregar_dados()['usuarios']['Principal']['transacoes']
+            inicio = time.perf_counter()
+            app.indice_historico('Principal', transacoes, datas=True)
+            print(f'índice montado em {(time.perf_counter() - inicio) * 1000:.0f} ms')
+
+            hoje = date.today()
+            dia = hoje.replace(day=max(1, hoje.day - 3))
+            periodos = {
+                'gastos hoje': (hoje, hoje),
+                f"extrato {dia.strftime('%d/%m')}": (dia, dia),
+                'resumo últimos 7 dias': (hoje - timedelta(days=6), hoje),
+            }
+            print(f"{'consulta':>24} {'resultados':>11} {'índice ms':>10} {'varredura ms':>13} {'comando ms':>11}")
+            for comando, (primeiro, ultimo) in periodos.items():
+                de = datetime.combine(primeiro, datetime.min.time())
+                ate = datetime.combine(ultimo + timedelta(days=1), datetime.min.time())
+                esperado = periodo_linear(transacoes, de, ate)
+                inicio = time.perf_counter()
+                for _ in range(repeticoes):
+                    chaves = app.transacoes_no_periodo('Principal', transacoes, de, ate)
+                indexada = (time.perf_counter() - inicio) / repeticoes
+                assert chaves == [chave for _, _, chave in esperado], comando
+                inicio = time.perf_counter()
+                periodo_linear(transacoes, de, ate)
+                varredura = time.perf_counter() - inicio
+                print(f'{comando:>24} {len(chaves):>11} {indexada * 1000:>10.3f} {varredura * 1000:>13.1f} '
+                      f'{_medir(comando, repeticoes):>11.3f}')
+
+            # Lançar e desfazer entre consultas: só a ponta do histórico é reindexada
+            latencias = []
+            for n in range(repeticoes):
+                app.processar_mensagem(f'gasto {n + 1} padaria')
+                if n % 3 == 2:
+                    app.processar_mensagem('apagar ultima')
+                inicio = time.perf_counter()
+                app.processar_mensagem('gastos hoje')
+                latencias.append(time.perf_counter() - inicio)
+            de = datetime.combine(hoje, datetime.min.time())
+            esperado = periodo_linear(transacoes, de, de + timedelta(days=1))
+            assert app.transacoes_no_periodo('Principal', transacoes, de, de + timedelta(days=1)) == [c for _, _, c in esperado]
+            print(f'gastos hoje após lançar/desfazer: p50 {_percentil(latencias, 0.5) * 1000:.3f} ms, '
+                  f'p99 {_percentil(latencias, 0.99) * 1000:.3f} ms')
+    finally:
+        app.DURABILIDADE, app.COMPACTAR_APOS = durabilidade, compactar_apos
+
+
+# Descrições reais e a categoria esperada das regras (None: nenhuma regra reconhece)
+CASOS_CATEGORIA = [
+    ('padaria santa tereza', 'alimentacao'), ('uber', 'transporte'), ('farmácia', 'saude'),
+    ('remédios', 'saude'), ('almoço', 'alimentacao'), ('o VA, mercado', 'mercado'),
+    ('mercado livre', 'compras'), ('pão de açúcar', 'mercado'), ('água de coco', 'alimentacao'),
+    ('conta de água', 'moradia'), ('gasolina no posto ipiranga', 'transporte'), ('netflix', 'lazer'),
+    ('ração do cachorro', 'pets'), ('banho e tosa', 'pets'), ('mensalidade da faculdade', 'educacao'),
+    ('tênis novo', 'compras'), ('barbeiro', 'beleza'), ('Sem descrição', None), ('compra 12', None),
+]
+
+
+def categoria_linear(descricao):
+    """Sem a árvore: procura cada expressão das regras na descrição normalizada (a mais longa ganha)"""
+    palavras = app.palavras_da_descricao.__wrapped__(descricao)
+    texto = f" {' '.join(palavras)} "
+    singular = f" {' '.join(p[:-1] if p.endswith('s') else p for p in palavras)} "
+    melhor, tamanho = None, 0
+    for categoria, expressoes in app._REGRAS_CATEGORIA.items():
+        for expressao in expressoes:
+            palavras = app.palavras_da_descricao.__wrapped__(expressao)
+            procurada = f" {' '.join(palavras)} "
+            if len(palavras) > tamanho and (procurada in texto or procurada in singular):
+                melhor, tamanho = categoria, len(palavras)
+    return melhor
+
+
+def cenario_categorias(historico=10000, repeticoes=2000):
+    """Categorização dos gastos: custo por mensagem, regras vs varredura, correção no diário.
+
+    As regras, o aprendizado com 'categoria <nome>' e o limite das aprendidas ficam em
+    test_categorias.py.
+    """
+    print('== categorias ==')
+    # Descrições novas (fora dos caches) e repetidas (o comum no uso real)
+    lugares = [d for d, _ in CASOS_CATEGORIA]
+    novas = [f'{lugares[i % len(lugares)]} loja {i}' for i in range(repeticoes)]
+    repetidas = [lugares[i % len(lugares)] for i in range(repeticoes)]
+    usuario = app.novo_usuario()
+    for descricao in lugares[:5]:
+        app.aprender_categoria(usuario, descricao, 'lazer')
+    medicoes = {}
+    for nome, funcao, descricoes in (('varredura', categoria_linear, novas),
+                                     ('árvore, novas', lambda d: app.categorizar(usuario, 'gasto', d), novas),
+                                     ('árvore, repetidas', lambda d: app.categorizar(usuario, 'gasto', d), repetidas)):
+        inicio = time.perf_counter()
+        for descricao in descricoes:
+            funcao(descricao)
+        medicoes[nome] = (time.perf_counter() - inicio) / len(descricoes) * 1e6
+    print('por descrição: ' + '  '.join(f'{nome}: {us:.1f} µs' for nome, us in medicoes.items()))
+
+    durabilidade, compactar_apos = app.DURABILIDADE, app.COMPACTAR_APOS
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'os', 10 ** 9
+    categorizar = app.categorizar
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            preparar_ambiente(pasta)
+            gerar_historico(historico)
+            app.processar_mensagem('entrada 1000000 aporte')
+
+            # Mensagem inteira com e sem a categorização, alternadas
+            latencias = {'sem categorias': [], 'com categorias': []}
+            for i in range(repeticoes // 2):
+                nome = ('sem categorias', 'com categorias')[i % 2]
+                app.categorizar = categorizar if i % 2 else (lambda u, tipo, d: 'geral')
+                inicio = time.perf_counter()
+                app.processar_mensagem(f'paguei {i % 50 + 1} na {lugares[i % len(lugares)]}')
+                latencias[nome].append(time.perf_counter() - inicio)
+            app.categorizar = categorizar
+            print('gasto em linguagem natural, p50: ' + '  '.join(
+                f'{nome}: {_percentil(medidas, 0.5) * 1000:.3f} ms' for nome, medidas in latencias.items()))
+
+            # Correção: o diário recebe só a troca da última transação, não o histórico
+            app.processar_mensagem('paguei 30 na padaria santa tereza')
+            tamanho = os.path.getsize(app.JOURNAL_FILE)
+            inicio = time.perf_counter()
+            app.processar_mensagem('categoria lazer')
+            correcao = (time.perf_counter() - inicio) * 1000
+            gravado = os.path.getsize(app.JOURNAL_FILE) - tamanho
+            transacoes = len(app.carregar_dados()['usuarios']['Principal']['transacoes'])
+            print(f'categoria lazer com {transacoes} transações: {correcao:.3f} ms, {gravado} bytes no diário')
+    finally:
+        app.categorizar = categorizar
+        app.DURABILIDADE, app.COMPACTAR_APOS = durabilidade, compactar_apos
+
+
+# Linhas de um dia colado de uma vez (valores de 1 a 9 reais)
+LINHAS_LOTE = ['gastei {v} pão', 'gastei {v} uber', 'usei VR {v} almoço', 'paguei {v} na farmácia',
+               'va {v} feira', 'gasto {v} estacionamento', 'comprei café por {v} reais']
+
+
+def cenario_lote(tamanhos=(5, 20, 50), repeticoes=20):
+    """N mensagens de uma linha vs uma mensagem de N linhas (um load e uma gravação por lote).
+
+    A validação do lote e a igualdade com as mensagens separadas ficam em test_lote.py.
+    """
+    print('== lote: N mensagens vs uma mensagem com N linhas (DURABILIDADE=sempre) ==')
+    print(f"{'backend':>10} {'N':>4} {'mensagens ms':>13} {'lote ms':>8} {'lanç./s msgs':>13} {'lanç./s lote':>13}")
+    durabilidade, backend, compactar_apos = app.DURABILIDADE, app.STORAGE_BACKEND, app.COMPACTAR_APOS
+    app.DURABILIDADE, app.COMPACTAR_APOS = 'sempre', 10 ** 9
+    try:
+        for app.STORAGE_BACKEND in ('json', 'sqlite', 'particoes'):
+            for tamanho in tamanhos:
+                linhas = [LINHAS_LOTE[i % len(LINHAS_LOTE)].format(v=i % 9 + 1) for i in range(tamanho)]
+                lote = '\n'.join(linhas)
+                assert len(lote) <= app.LIMITE_MENSAGEM, len(lote)
+                tempos = {}
+                for modo in ('mensagens', 'lote'):
+                    with tempfile.TemporaryDirectory() as pasta:
+                        preparar_ambiente(pasta)
+                        app._sqlite.conexao = None
+                        app.processar_mensagem('entrada 100000 aporte')
+                        app.processar_mensagem(f'+vr {100 * tamanho * repeticoes}')
+                        app.processar_mensagem(f'+va {100 * tamanho * repeticoes}')
+                        inicio = time.perf_counter()
+                        for _ in range(repeticoes):
+                            if modo == 'lote':
+                                app.processar_mensagem(lote)
+                            else:
+                                for linha in linhas:
+                                    app.processar_mensagem(linha)
+                        tempos[modo] = (time.perf_counter() - inicio) / repeticoes
+                print(f"{app.STORAGE_BACKEND:>10} {tamanho:>4} {tempos['mensagens'] * 1000:>13.2f} "
+                      f"{tempos['lote'] * 1000:>8.2f} {tamanho / tempos['mensagens']:>13.0f} {tamanho / tempos['lote']:>13.0f}")
+    finally:
+        app.DURABILIDADE, app.STORAGE_BACKEND, app.COMPACTAR_APOS = durabilidade, backend, compactar_apos
+        app._sqlite.conexao = None
+
+
+def gerar_razao(usuario, eventos, semente=7):
+    """Anota no razão do usuário `eventos` eventos espalhados pelo último ano (lançamentos,
+    estornos, ajustes e alguns 'limpar tudo').
+
+    Retorna (minutos, saldos depois de cada evento) calculados à parte, para conferir.
+    """
+    sorteio = random.Random(semente)
+    tipos = list(app._EFEITO_TIPO)
+    fim = app.minuto_da_data(datetime.now().strftime('%d/%m/%Y %H:%M'))
+    passo = 365 * 1440 / eventos
+    saldos = {'saldo': 0, 'vr': 0, 'va': 0}
+    lancados, minutos, esperados = [], [], []
+    for i in range(eventos):
+        minuto = fim - int((eventos - 1 - i) * passo)
+        em = (datetime.fromordinal(minuto // 1440) + timedelta(minutes=minuto % 1440)).strftime('%d/%m/%Y %H:%M')
+        sorte = sorteio.random()
+        if sorte < 0.1 and lancados:
+            campos = {'evento': 'estorno', 'transacoes': lancados.pop(sorteio.randrange(len(lancados)))}
+        elif sorte < 0.14:
+            campos = {'evento': 'ajuste', 'efeitos': {'saldo': sorteio.randint(-5000, 5000) / 100, 'vr': 0, 'va': 0}}
+        elif sorte < 0.145:
+            campos = {'evento': 'saldos', 'saldos': {'saldo': 0, 'vr': 0, 'va': 0}}
+        else:
+            transacoes = [{'tipo': sorteio.choice(tipos), 'valor': sorteio.randint(100, 50000) / 100,
+                           'descricao': f'compra {i}', 'data': em, 'categoria': 'geral'}]
+            lancados.append(transacoes)
+            campos = {'evento': 'lancamento', 'transacoes': transacoes}
+        app.registrar_evento(usuario, campos.pop('evento'), **campos)
+        for _, evento in app._eventos_pendentes():
+            evento['em'] = em
+            app._aplicar_evento(saldos, evento)
+        minutos.append(minuto)
+        esperados.append(dict(saldos))
+        app._gravar_razao({'usuarios': {'Principal': usuario}})
+    usuario.update({campo: app.reais(valor) for campo, valor in saldos.items()})
+    return minutos, esperados
+
+
+def cenario_razao(eventos=100000, intervalos=(10, 100, 1000, 10000, 0), repeticoes=200):
+    """'saldo em dd/mm' pelo livro-razão: instantâneo + reaplicação vs reaplicar o razão inteiro
+    (a correção fica em test_razao.py)"""
+    print(f'== livro-razão: {eventos} eventos num ano, saldo em uma data passada ==')
+    print(f"{'intervalo':>10} {'gravar µs/ev':>13} {'1ª consulta ms':>15} {'consulta ms':>12} "
+          f"{'reaplicados':>12} {'razão KB':>9} {'instant. KB':>12}")
+    intervalo_original, durabilidade = app.RAZAO_INTERVALO, app.DURABILIDADE
+    app.DURABILIDADE = 'os'
+    sorteio = random.Random(3)
+    try:
+        for app.RAZAO_INTERVALO in intervalos:
+            with tempfile.TemporaryDirectory() as pasta:
+                preparar_ambiente(pasta)
+                dados = app.carregar_dados()
+                usuario = dados['usuarios'].setdefault('Principal', app.novo_usuario())
+                inicio = time.perf_counter()
+                minutos, _ = gerar_razao(usuario, eventos)
+                gravar = (time.perf_counter() - inicio) / eventos
+                app.salvar_dados(dados)
+
+                consultas = [sorteio.randint(minutos[0] - 1440, minutos[-1]) for _ in range(repeticoes)]
+                app._razao['instantaneos'].clear()
+                inicio = time.perf_counter()
+                app.saldos_em('Principal', usuario, consultas[0])
+                primeira = time.perf_counter() - inicio
+                reaplicados = 0
+                inicio = time.perf_counter()
+                for minuto in consultas:
+                    _, n = app.saldos_em('Principal', usuario, minuto)
+                    reaplicados = max(reaplicados, n)
+                consulta = (time.perf_counter() - inicio) / repeticoes
+
+                pasta_razao = app._pasta_razao('Principal')
+                tamanhos = [os.path.getsize(os.path.join(pasta_razao, nome)) if os.path.exists(os.path.join(pasta_razao, nome)) else 0
+                            for nome in ('eventos.jsonl', 'instantaneos.jsonl')]
+                print(f"{app.RAZAO_INTERVALO or 'nenhum':>10} {gravar * 1e6:>13.1f} {primeira * 1000:>15.2f} "
+                      f"{consulta * 1000:>12.3f} {reaplicados:>12} {tamanhos[0] // 1024:>9} {tamanhos[1] // 1024:>12}")
+
+                if app.RAZAO_INTERVALO == intervalo_original:
+                    dia = datetime.now() - timedelta(days=30)
+                    comando = f"saldo em {dia.strftime('%d/%m/%Y')}"
+                    print(f'{comando} (comando inteiro, intervalo {intervalo_original}): {_medir(comando, repeticoes):.3f} ms')
+    finally:
+        app.RAZAO_INTERVALO, app.DURABILIDADE = intervalo_original, durabilidade
+
+
+# Mistura de mensagens da carga sintética: (peso, tipo). Os pesos imitam o uso real,
+# com mais registros e consultas de saldo do que extratos e trocas de usuário.
+MISTURA_CARGA = [
+    (30, 'gasto_natural'), (7, 'vr'), (6, 'va'), (3, 'credito'), (4, 'entrada'),
+    (6, 'direto'), (15, 'saldo'), (8, 'extrato'), (6, 'resumo'), (2, 'total'),
+    (5, 'conta_fixa'), (4, 'troca'), (2, 'desfazer'), (2, 'extrato_mais'),
+]
+
+LUGARES_CARGA = ['mercado', 'padaria', 'farmácia', 'uber', 'ifood', 'posto', 'restaurante', 'cinema', 'academia', 'feira']
+
+MODELOS_CARGA = {
+    'gasto_natural': ['gastei {valor} reais no {lugar}', 'paguei {valor} na {lugar}',
+                      'comprei remédio, foi {valor} reais', 'gastei {valor} no {lugar} hoje'],
+    'vr': ['usei o VR, {valor} reais no {lugar}', 'gastei {valor} com VR na lanchonete', 'vr {valor} {lugar}'],
+    'va': ['usei o VA, {valor} no mercado', 'gastei {valor} com VA no supermercado', 'va {valor} feira'],
+    'credito': ['creditaram 600 no VR', 'caiu 400 no VA', '+vr 300', '+va 250'],
+    'entrada': ['recebi meu salário de {valor}', 'entrou {valor} do freelance', 'entrada {valor} salario'],
+    'direto': ['gasto {valor} {lugar}'],
+    'saldo': ['saldo'],
+    'extrato': ['extrato'],
+    'resumo': ['resumo'],
+    'total': ['total'],
+    'conta_fixa': ['conta fixa {valor} {dia} {lugar}', 'contas fixas', 'pagar conta 1'],
+    'troca': ['usuario casa', 'usuario trabalho', 'usuario {proprio}'],
+    'desfazer': ['desfazer'],
+    'extrato_mais': ['extrato mais'],
+}
+
+
+def remetentes_carga(usuarios):
+    """Números dos remetentes da carga e os usuários que cada um herda na primeira mensagem"""
+    remetentes = [f'whatsapp:+5511970{u:06d}' for u in range(usuarios)]
+    nomes = ['Principal'] + [r.replace('whatsapp:', '') for r in remetentes[1:]]
+    return remetentes, nomes
+
+
+def gerar_mensagens(quantidade, remetentes, nomes, semente=42):
+    """Sequência reprodutível de (remetente, mensagem, tipo) com a mistura de MISTURA_CARGA.
+    
+    A mesma semente gera sempre as mesmas mensagens, na mesma ordem, para qualquer commit.
+    """
+    sorteio = random.Random(semente)
+    pesos = [peso for peso, _ in MISTURA_CARGA]
+    tipos = [tipo for _, tipo in MISTURA_CARGA]
+    for _ in range(quantidade):
+        indice = sorteio.randrange(len(remetentes))
+        tipo = sorteio.choices(tipos, pesos)[0]
+        modelo = sorteio.choice(MODELOS_CARGA[tipo])
+        texto = modelo.format(
+            valor=f'{sorteio.randint(2, 150)},{sorteio.randint(0, 99):02d}',
+            lugar=sorteio.choice(LUGARES_CARGA),
+            dia=sorteio.randint(1, 28),
+            proprio=nomes[indice],
+        )
+        yield remetentes[indice], texto, tipo
+
+
+def _pico_rss_mb():
+    """Maior RSS do processo até agora, em MB (None sem o módulo resource)"""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB; macOS, em bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _estatisticas(latencias, duracao=None):
+    """p50/p99/média/máximo em ms e, com a duração, vazão em msg/s"""
+    resumo = {
+        'mensagens': len(latencias),
+        'p50_ms': round(_percentil(latencias, 0.5) * 1000, 3),
+        'p99_ms': round(_percentil(latencias, 0.99) * 1000, 3),
+        'media_ms': round(sum(latencias) / len(latencias) * 1000, 3),
+        'max_ms': round(max(latencias) * 1000, 3),
+    }
+    if duracao is not None:
+        resumo['msg_s'] = round(len(latencias) / duracao, 1)
+    return resumo
+
+
+def _rodar_carga(alvo, parametros):
+    """Roda a carga inteira num processo novo, para o pico de RSS ser só deste alvo"""
+    with tempfile.TemporaryDirectory() as pasta:
+        preparar_ambiente(pasta)
+        app.RESPOSTA_ASSINCRONA = False
+        remetentes, nomes = remetentes_carga(parametros['usuarios'])
+        gerar_historico(parametros['historico'], usuarios=nomes)
+        # Fixa o usuário de cada remetente e dá saldo aos vales antes de medir
+        for remetente in remetentes:
+            app.processar_mensagem('+vr 2000', remetente)
+            app.processar_mensagem('+va 2000', remetente)
+        rss_preparo = _pico_rss_mb()
+
+        cliente = app.app.test_client()
+        if alvo == 'processar_mensagem':
+            def enviar(remetente, texto):
+                app.processar_mensagem(texto, remetente)
+        elif alvo == '/teste':
+            def enviar(remetente, texto):
+                resposta = cliente.post('/teste', json={'mensagem': texto, 'remetente': remetente})
+                assert resposta.status_code == 200, (texto, resposta.status_code)
+        else:
+            def enviar(remetente, texto):
+                resposta = cliente.post('/whatsapp', data={'Body': texto, 'From': remetente})
+                assert resposta.status_code == 200, (texto, resposta.status_code)
+
+        latencias = []
+        por_tipo = {}
+        mensagens = gerar_mensagens(parametros['mensagens'], remetentes, nomes, parametros['semente'])
+        inicio = time.perf_counter()
+        for remetente, texto, tipo in mensagens:
+            antes = time.perf_counter()
+            enviar(remetente, texto)
+            latencia = time.perf_counter() - antes
+            latencias.append(latencia)
+            por_tipo.setdefault(tipo, []).append(latencia)
+        duracao = time.perf_counter() - inicio
+
+        # Saldos finais de todos os usuários: iguais em todos os alvos, já que a carga é a mesma
+        dados = app.carregar_dados()
+        saldos = {
+            nome: [round(usuario[campo], 2) for campo in ('saldo', 'vr', 'va')]
+            for nome, usuario in sorted(dados['usuarios'].items())
+        }
+        # Compactação em andamento precisa terminar antes de a pasta sumir
+        app.encerrar()
+    resultado = _estatisticas(latencias, duracao)
+    resultado.update({
+        'duracao_s': round(duracao, 3),
+        'rss_preparo_mb': rss_preparo,
+        'rss_pico_mb': _pico_rss_mb(),
+        'por_tipo': {tipo: _estatisticas(valores) for tipo, valores in sorted(por_tipo.items())},
+    })
+    return resultado, saldos
+
+
+def _commit_atual():
+    """Hash curto do commit do app e se há alterações fora dele"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PASTA_APP,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        alterado = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PASTA_APP,
+                                  capture_output=True, text=True, check=True).stdout.strip() != ''
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, alterado
+
+
+def cenario_carga(usuarios=20, historico=2000, mensagens=2000, semente=42, saida=None):
+    """Carga sintética reprodutível no processar_mensagem e nas rotas /teste e /whatsapp; grava JSON"""
+    print(f'== carga: {mensagens} mensagens, {usuarios} usuários, histórico de {historico} ==')
+    print(f"{'alvo':>20} {'msg/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8}")
+    parametros = {'usuarios': usuarios, 'historico': historico, 'mensagens': mensagens, 'semente': semente}
+    contexto = multiprocessing.get_context('spawn')
+    resultados = {}
+    saldos_por_alvo = {}
+    for alvo in ('processar_mensagem', '/teste', '/whatsapp'):
+        with contexto.Pool(1) as processo:
+            resultados[alvo], saldos_por_alvo[alvo] = processo.apply(_rodar_carga, (alvo, parametros))
+        medida = resultados[alvo]
+        print(f"{alvo:>20} {medida['msg_s']:>8.0f} {medida['p50_ms']:>8.2f} {medida['p99_ms']:>8.2f} "
+              f"{medida['rss_pico_mb'] if medida['rss_pico_mb'] is not None else '-':>8}")
+    # Mesma carga, mesmos saldos: os alvos diferem só no caminho até o processar_mensagem
+    referencia = saldos_por_alvo['processar_mensagem']
+    assert all(saldos == referencia for saldos in saldos_por_alvo.values())
+
+    commit, alterado = _commit_atual()
+    relatorio = {
+        'commit': commit,
+        'alterado': alterado,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'configuracao': {
+            'backend': app.STORAGE_BACKEND,
+            'durabilidade': app.DURABILIDADE,
+            'formato_snapshot': app.FORMATO_SNAPSHOT,
+            'metricas': app.METRICAS,
+            'compactar_apos': app.COMPACTAR_APOS,
+        },
+        'parametros': parametros,
+        'resultados': resultados,
+    }
+    if saida is None:
+        carimbo = datetime.now().strftime('%Y%m%d-%H%M%S')
+        saida = os.path.join(PASTA_APP, 'resultados_benchmark', f"carga-{commit or 'sem-git'}-{carimbo}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    print(f'resultado gravado em {saida}')
+    return relatorio
+
+
+def comparar_resultados(antes, depois):
+    """Compara dois JSON do cenário carga, alvo a alvo"""
+    with open(antes, encoding='utf-8') as f:
+        anterior = json.load(f)
+    with open(depois, encoding='utf-8') as f:
+        atual = json.load(f)
+    print(f"== comparação: {anterior['commit']} -> {atual['commit']} ==")
+    if anterior['parametros'] != atual['parametros']:
+        print(f"atenção: parâmetros diferentes {anterior['parametros']} vs {atual['parametros']}")
+    print(f"{'alvo':>20} {'medida':>12} {'antes':>10} {'depois':>10} {'variação':>9}")
+    for alvo, medidas in atual['resultados'].items():
+        base = anterior['resultados'].get(alvo)
+        if base is None:
+            continue
+        for medida in ('msg_s', 'p50_ms', 'p99_ms', 'rss_pico_mb'):
+            if base.get(medida) is None or medidas.get(medida) is None:
+                continue
+            variacao = (medidas[medida] / base[medida] - 1) * 100 if base[medida] else 0.0
+            print(f'{alvo:>20} {medida:>12} {base[medida]:>10.2f} {medidas[medida]:>10.2f} {variacao:>+8.1f}%')
+
+
+CENARIOS = {
+    'escrita': cenario_escrita,
+    'compactacao': cenario_compactacao,
+    'leitura': cenario_leitura,
+    'concorrencia': cenario_concorrencia,
+    'backends': cenario_backends,
+    'parser': cenario_parser,
+    'extrator': cenario_extrator,
+    'agregados': cenario_agregados,
+    'virada': cenario_virada,
+    'extrato': cenario_extrato,
+    'servidor': cenario_servidor,
+    'assincrono': cenario_assincrono,
+    'durabilidade': cenario_durabilidade,
+    'codificacao': cenario_codificacao,
+    'dinheiro': cenario_dinheiro,
+    'importacao': cenario_importacao,
+    'metricas': cenario_metricas,
+    'repetidas': cenario_repetidas,
+    'agenda': cenario_agenda,
+    'particoes': cenario_particoes,
+    'busca': cenario_busca,
+    'periodos': cenario_periodos,
+    'categorias': cenario_categorias,
+    'lote': cenario_lote,
+    'razao': cenario_razao,
+    'carga': cenario_carga,
+}
+
+def _opcoes(argumentos):
+    """--chave=valor da linha de comando como parâmetros do cenário (números viram int)"""
+    opcoes = {}
+    for argumento in argumentos:
+        chave, _, valor = argumento[2:].partition('=')
+        opcoes[chave] = int(valor) if valor.isdigit() else valor
+    return opcoes
+
+
+if __name__ == '__main__':
+    escolhidos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    opcoes = _opcoes(a for a in sys.argv[1:] if a.startswith('--'))
+    if escolhidos[:1] == ['comparar']:
+        comparar_resultados(*escolhidos[1:3])
+        sys.exit()
+    for nome in escolhidos or list(CENARIOS):
+        CENARIOS[nome](**opcoes)
+        print(flush=True)
@@ -0,0 +1,16 @@
+"""Fixtures compartilhadas pelos testes (python -m pytest)"""
+import pytest
+
+import whatsapp_financas as app
+from benchmark import preparar_ambiente
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    """Dados do app numa pasta temporária; o armazenamento escolhido volta ao original no fim"""
+    backend = app.STORAGE_BACKEND
+    preparar_ambiente(str(tmp_path))
+    app._sqlite.conexao = None
+    yield str(tmp_path)
+    app.STORAGE_BACKEND = backend
+    app._sqlite.conexao = None
@@ -0,0 +1,33 @@
+"""Configuração do gunicorn para produção
+
+Uso:
+    gunicorn -c gunicorn.conf.py whatsapp_financas:app
+
+Cada worker é um processo com seus próprios dados residentes; as travas por
+usuário valem entre processos, então vários workers podem gravar ao mesmo tempo.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Um processo por CPU: cada processo a mais precisa reaplicar o diário gravado pelos
+# outros, então passar disso só ajuda se houver CPU sobrando. As threads atendem
+# enquanto outra mensagem espera o disco.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# O Twilio desiste do webhook em 15 s
+timeout = 15
+# No SIGTERM, os workers terminam as mensagens em andamento antes de sair
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+
+
+def worker_exit(server, worker):
+    """Grava o que estiver pendente (compactação, diário, WAL) antes do worker sair"""
+    import whatsapp_financas
+    whatsapp_financas.encerrar()
@@ -0,0 +1,82 @@
+"""Agenda das contas fixas com o relógio simulado (python -m pytest)"""
+import multiprocessing
+from datetime import date, timedelta
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import preparar_ambiente, gerar_contas_fixas
+
+
+def _cadastrar_conta(pasta, texto):
+    """Outro processo cadastrando uma conta fixa"""
+    preparar_ambiente(pasta)
+    app.relogio_agenda = lambda: date(2026, 1, 1)
+    app.processar_mensagem(texto, 'whatsapp:+5511666')
+
+
+@pytest.fixture
+def agenda(pasta, monkeypatch):
+    """Agenda lançando as contas vencidas, com o relógio em 05/01/2026"""
+    monkeypatch.setattr(app, 'AGENDA_MODO', 'debitar')
+    monkeypatch.setattr(app, 'AGENDA_RECUPERAR', True)
+    monkeypatch.setattr(app, 'relogio_agenda', lambda: date(2026, 1, 5))
+    app.marcar_contas_alteradas()
+    yield pasta
+    app.marcar_contas_alteradas()
+
+
+def _lancadas(nome='Principal'):
+    usuario = app.carregar_dados()['usuarios'][nome]
+    return [t for t in usuario['transacoes'] if t['categoria'] == 'conta_fixa']
+
+
+@pytest.mark.parametrize('armazenamento', ['json', 'sqlite', 'particoes'])
+def test_cada_conta_uma_vez_por_mes(agenda, armazenamento, usuarios=20, por_usuario=2):
+    """Dois meses, vários ciclos por dia: cada conta (também as do formato antigo, sem
+    vencimento) é lançada uma vez em cada mês"""
+    app.STORAGE_BACKEND = armazenamento
+    inicio = date(2026, 1, 1)
+    gerar_contas_fixas(usuarios, por_usuario, inicio)
+    if armazenamento == 'sqlite':
+        app.importar_json_para_sqlite()
+    elif armazenamento == 'particoes':
+        app.importar_json_para_particoes()
+
+    lancadas = 0
+    for n in range(59):
+        for _ in range(3):
+            lancadas += len(app.executar_agenda(inicio + timedelta(days=n)))
+    assert lancadas == usuarios * por_usuario * 2
+    total = sum(1 for usuario in app.carregar_dados()['usuarios'].values()
+                for t in usuario['transacoes'] if t['categoria'] == 'conta_fixa')
+    assert total == usuarios * por_usuario * 2
+
+
+@pytest.mark.parametrize('recuperar, esperado', [(True, 4 + 2 + 1), (False, 1)])
+def test_vencimentos_perdidos_com_o_servico_parado(agenda, monkeypatch, recuperar, esperado):
+    """Parado de 5/jan a 15/abr: com recuperação lança os meses perdidos; sem, pula para o próximo"""
+    monkeypatch.setattr(app, 'AGENDA_RECUPERAR', recuperar)
+    app.processar_mensagem('conta fixa 100 10 aluguel')
+    app.processar_mensagem('conta fixa 80 20 escola')
+    app.processar_mensagem('pagar conta 2')
+    app.executar_agenda(date(2026, 4, 15))
+    # 'escola' paga à mão em janeiro: sai de fev, mar (e abril ainda não venceu)
+    assert len(_lancadas()) == esperado
+    usuario = app.carregar_dados()['usuarios']['Principal']
+    assert [c['vencimento'] for c in usuario['contas_fixas']] == ['2026-05-10', '2026-04-20']
+    # O ciclo seguinte, no mesmo dia, não lança de novo
+    assert app.executar_agenda(date(2026, 4, 15)) == []
+
+
+def test_conta_cadastrada_em_outro_processo(agenda):
+    """A conta entra no índice pelo diário, sem reconstruir tudo, e é lançada no vencimento"""
+    app.executar_agenda(date(2026, 1, 1))
+    filho = multiprocessing.get_context('spawn').Process(target=_cadastrar_conta, args=(agenda, 'conta fixa 40 3 internet'))
+    filho.start()
+    filho.join()
+    assert filho.exitcode == 0
+    assert len(app.executar_agenda(date(2026, 1, 2))) == 0
+    assert app._agenda['tudo'] is False
+    assert len(app.executar_agenda(date(2026, 1, 3))) == 1
+    assert len(app.executar_agenda(date(2026, 1, 3))) == 0
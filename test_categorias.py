@@ -0,0 +1,57 @@
+"""Categorização dos gastos (python -m pytest)"""
+import os
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import CASOS_CATEGORIA, categoria_linear
+
+
+@pytest.mark.parametrize('descricao, esperada', CASOS_CATEGORIA, ids=[d for d, _ in CASOS_CATEGORIA])
+def test_regras(descricao, esperada):
+    """A expressão mais longa ganha ('mercado livre' de 'mercado'), com o plural simples
+    ('remédios'); a árvore acha o mesmo que a varredura de todas as expressões"""
+    assert app.categoria_das_regras(descricao) == esperada
+    assert categoria_linear(descricao) == esperada
+
+
+def test_categoria_ensina_a_descricao(pasta):
+    """'categoria lazer' corrige o último gasto, grava só a troca no diário e vale para os próximos"""
+    app.STORAGE_BACKEND = 'json'
+    app.processar_mensagem('entrada 1000 aporte')
+    for i in range(200):
+        app.processar_mensagem(f'gastei {i % 9 + 1} no uber {i}')
+    assert 'Alimentação' in app.processar_mensagem('paguei 30 na padaria santa tereza')
+    tamanho = os.path.getsize(app.JOURNAL_FILE)
+    assert 'Categoria corrigida' in app.processar_mensagem('categoria lazer')
+    assert os.path.getsize(app.JOURNAL_FILE) - tamanho < 4096
+    assert 'Lazer' in app.processar_mensagem('paguei 12 na padaria santa tereza')
+    # As regras continuam valendo para as outras descrições
+    assert 'Alimentação' in app.processar_mensagem('paguei 8 na padaria')
+
+    app._cache['dados'] = None
+    dados = app.carregar_dados()
+    assert not app.verificar_totais(dados)
+    gastos = [t['categoria'] for t in dados['usuarios']['Principal']['transacoes'][-3:]]
+    assert gastos == ['lazer', 'lazer', 'alimentacao']
+
+
+def test_categoria_desconhecida(pasta):
+    app.processar_mensagem('paguei 30 na padaria')
+    assert 'Categoria desconhecida' in app.processar_mensagem('categoria xyz')
+
+
+def test_aprendidas_descarta_a_usada_ha_mais_tempo(monkeypatch):
+    """Acima de CATEGORIAS_APRENDIDAS sai a usada há mais tempo; usar uma descrição que já caiu
+    na metade mais antiga a traz de volta"""
+    monkeypatch.setattr(app, 'CATEGORIAS_APRENDIDAS', 4)
+    monkeypatch.setattr(app, '_METADE_CACHE', 2)
+    usuario = app.novo_usuario()
+    for descricao in ('bar do ze', 'loja azul', 'feira livre', 'oficina do joao'):
+        app.aprender_categoria(usuario, descricao, 'lazer')
+    assert app.categorizar(usuario, 'gasto', 'bar do ze') == 'lazer'
+
+    app.aprender_categoria(usuario, 'posto shell', 'lazer')
+    assert set(usuario['categorias_aprendidas']['mapa']) == {'bar ze', 'feira livre', 'oficina joao', 'posto shell'}
+    # A esquecida volta para as regras
+    assert app.categorizar(usuario, 'gasto', 'loja azul') == 'compras'
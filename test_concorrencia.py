@@ -0,0 +1,46 @@
+"""Webhooks intercalados de vários processos (python -m pytest)"""
+import multiprocessing
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import _disparar_webhooks
+
+
+# Poucos remetentes com muitas mensagens, e muitos remetentes novos criados enquanto outro
+# processo compacta (a releitura completa não pode perder o usuário que ainda não foi gravado)
+@pytest.mark.parametrize('remetentes_por_processo, mensagens, compactar_apos',
+                         [(4, 40, 20), (12, 6, 5)], ids=['longas', 'remetentes-novos'])
+def test_webhooks_intercalados_sem_saldo_divergente(pasta, remetentes_por_processo, mensagens, compactar_apos,
+                                                    processos=3):
+    """Cada remetente alterna entrada e gasto em sua thread; relido do disco, o saldo e o
+    histórico de todos batem com o que foi mandado"""
+    grupos = [
+        [f'whatsapp:+55119{p:02d}{r:04d}' for r in range(remetentes_por_processo)]
+        for p in range(processos)
+    ]
+    # O primeiro remetente herda o usuário Principal; grava isso antes da carga
+    app.processar_mensagem('usuario Principal', 'whatsapp:+5500000000000')
+
+    contexto = multiprocessing.get_context('spawn')
+    # Compacta a cada poucos registros para as compactações também disputarem com as gravações
+    filhos = [contexto.Process(target=_disparar_webhooks, args=(pasta, grupo, mensagens, compactar_apos))
+              for grupo in grupos]
+    for filho in filhos:
+        filho.start()
+    for filho in filhos:
+        filho.join()
+    assert [filho.exitcode for filho in filhos] == [0] * processos
+
+    # Reconstrói do disco (snapshot + diário) e confere cada remetente
+    app._cache['dados'] = None
+    dados = app.carregar_dados()
+    esperado = (mensagens + 1) // 2 * 3 - mensagens // 2 * 1.5
+    divergentes = {}
+    for grupo in grupos:
+        for remetente in grupo:
+            usuario = dados['usuarios'][dados['remetentes'][remetente]]
+            if abs(usuario['saldo'] - esperado) > 1e-6 or len(usuario['transacoes']) != mensagens:
+                divergentes[remetente] = (usuario['saldo'], len(usuario['transacoes']))
+    assert divergentes == {}
+    assert not app.verificar_totais(dados)
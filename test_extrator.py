@@ -0,0 +1,15 @@
+"""Testes do extrator de valor e descrição (python -m pytest)"""
+import pytest
+
+import whatsapp_financas as app
+from benchmark import AMOSTRAS_EXTRATOR
+
+
+@pytest.mark.parametrize('texto, esperado', AMOSTRAS_EXTRATOR, ids=[texto for texto, _ in AMOSTRAS_EXTRATOR])
+def test_mensagens_reais(texto, esperado):
+    assert app.extrair_valor_e_descricao(texto) == esperado
+
+
+@pytest.mark.parametrize('texto', ['gastei 0,001 no mercado', 'paguei 0 reais'])
+def test_valor_zerado_nao_e_lancamento(texto):
+    assert app.extrair_valor_e_descricao(texto) == (None, None)
@@ -0,0 +1,117 @@
+"""Injeção de falhas no armazenamento (python -m pytest)"""
+import multiprocessing
+import random
+import signal
+import time
+import os
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import preparar_ambiente
+
+
+# Função de cada armazenamento que grava de fato (onde a falha do comando é injetada)
+GRAVACAO_ARMAZENAMENTO = {'json': '_diferenca', 'sqlite': '_salvar_sqlite', 'particoes': '_gravar_particao'}
+
+
+def _gravar_sem_parar(pasta, backend, compactar_apos):
+    """Processo filho: grava 'entrada 1 xN' até ser morto"""
+    preparar_ambiente(pasta)
+    app.STORAGE_BACKEND = backend
+    app.COMPACTAR_APOS = compactar_apos
+    i = len(app.obter_dados_usuario(app.carregar_dados())['transacoes'])
+    while True:
+        app.processar_mensagem(f'entrada 1 x{i}')
+        i += 1
+
+
+def _conferir_gravado(backend):
+    """Relê do disco e confere que o estado é um prefixo íntegro das gravações"""
+    app.STORAGE_BACKEND = backend
+    app._cache['dados'] = None
+    app._sqlite.conexao = None
+    dados = app.carregar_dados()
+    usuario = app.obter_dados_usuario(dados)
+    descricoes = [t['descricao'] for t in usuario['transacoes']]
+    assert descricoes == [f'x{i}' for i in range(len(descricoes))], 'histórico fora de ordem ou com buracos'
+    assert abs(usuario['saldo'] - len(descricoes)) < 1e-6, (usuario['saldo'], len(descricoes))
+    assert not app.verificar_totais(dados)
+    return len(descricoes)
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='sem SIGKILL nesta plataforma')
+@pytest.mark.parametrize('armazenamento', ['json', 'sqlite'])
+def test_sigkill_durante_gravacoes(pasta, armazenamento, rodadas=6):
+    """Mata o processo no meio das gravações (e das compactações): fica sempre um prefixo íntegro"""
+    aleatorio = random.Random(11)
+    contexto = multiprocessing.get_context('spawn')
+    gravadas = 0
+    for _ in range(rodadas):
+        # Compacta a cada 20 registros para a morte cair também no meio de uma compactação
+        filho = contexto.Process(target=_gravar_sem_parar, args=(pasta, armazenamento, 20))
+        filho.start()
+        time.sleep(aleatorio.uniform(0.5, 1.5))
+        os.kill(filho.pid, signal.SIGKILL)
+        filho.join()
+        gravadas = _conferir_gravado(armazenamento)
+    assert gravadas > 0
+
+
+def test_linha_cortada_no_diario(pasta):
+    """Linha cortada no fim do diário (queda no meio do write) é descartada"""
+    app.STORAGE_BACKEND = 'json'
+    for i in range(5):
+        app.processar_mensagem(f'entrada 1 x{i}')
+    with open(app.JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"n":999999,"u":{"Principal":{"t":[{"tipo"')
+    assert _conferir_gravado('json') == 5
+
+
+@pytest.mark.parametrize('onde', [None, 'contabilizar'], ids=['gravacao', 'antes-de-salvar'])
+@pytest.mark.parametrize('armazenamento', list(GRAVACAO_ARMAZENAMENTO))
+def test_comando_que_falha(pasta, armazenamento, onde, monkeypatch):
+    """Falha no meio de um comando (na gravação ou antes de salvar_dados, com o evento do razão
+    já anotado), depois a repetição da entrega pelo Twilio: no disco fica só a repetição, uma vez"""
+    app.STORAGE_BACKEND = armazenamento
+    remetente = 'whatsapp:+5511900000001'
+    app.processar_entrega('entrada 100', remetente, 'S1')
+
+    def falhar(*args, **kwargs):
+        raise OSError('disco cheio')
+
+    with monkeypatch.context() as injecao:
+        injecao.setattr(app, onde or GRAVACAO_ARMAZENAMENTO[armazenamento], falhar)
+        with pytest.raises(OSError):
+            app.processar_entrega('gastei 30 no mercado', remetente, 'S2')
+    # Os eventos do razão anotados pelo comando que falhou não ficam na fila da thread
+    assert app._eventos_pendentes() == []
+    app.processar_entrega('gastei 30 no mercado', remetente, 'S2')
+
+    # Como um processo novo: só o que está no disco
+    app._cache['dados'] = None
+    app._sqlite.conexao = None
+    app._particoes.update(dados=None, assinatura=None, meta=None, usuarios={}, contas=0)
+    dados = app.carregar_dados()
+    usuario = app.obter_dados_usuario(dados, remetente)
+    mercado = [t for t in usuario['transacoes'] if 'mercado' in t['descricao']]
+    assert (usuario['saldo'], len(mercado)) == (70.0, 1)
+    assert not app.verificar_totais(dados) and not app.verificar_saldos(dados)
+    # O evento do comando que falhou não vai para o razão com a gravação seguinte
+    assert not app.verificar_razao(dados)
+    eventos = [e for e in app._ler_eventos(app.usuario_do_remetente(dados, remetente), 0, usuario['razao']['posicao'])
+               if e['evento'] == 'lancamento' and 'mercado' in e['transacoes'][0]['descricao']]
+    assert len(eventos) == 1
+
+
+def test_commit_em_grupo_sem_espera_quando_sozinho(pasta, monkeypatch):
+    """Com DURABILIDADE='lote', uma gravação sem outras em andamento não espera a janela"""
+    monkeypatch.setattr(app, 'STORAGE_BACKEND', 'json')
+    monkeypatch.setattr(app, 'DURABILIDADE', 'lote')
+    monkeypatch.setattr(app, 'JANELA_LOTE_MS', 1000)
+    app.processar_mensagem('entrada 10 x')
+    inicio = time.monotonic()
+    for _ in range(3):
+        app.processar_mensagem('gasto 1 x')
+    assert time.monotonic() - inicio < 1
+    assert app._lote['sincronizados'] == app._lote['escritos'] and app._lote['gravando'] == 0
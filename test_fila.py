@@ -0,0 +1,84 @@
+"""Modo assíncrono com um envio falso no lugar do Twilio (python -m pytest)"""
+import threading
+import time
+
+import pytest
+
+import whatsapp_financas as app
+
+
+ORIGEM = 'whatsapp:+14155238886'
+
+
+@pytest.fixture
+def enviadas(pasta, monkeypatch):
+    """Troca o envio pelo Twilio por um que guarda as respostas por destino; zera as métricas da fila"""
+    recebidas = {}
+    lock = threading.Lock()
+
+    def enviar_falso(destino, origem, texto):
+        assert origem == ORIGEM
+        with lock:
+            recebidas.setdefault(destino, []).append(texto)
+
+    monkeypatch.setattr(app, 'enviar_resposta', enviar_falso)
+    app._fila.update(pendentes=0, processadas=0, falhas=0, atraso_total=0.0, atraso_maximo=0.0)
+    yield recebidas
+    app._esvaziar_fila(10)
+
+
+def _esperar_fila(limite=30):
+    fim = time.monotonic() + limite
+    while app.metricas_fila()['pendentes']:
+        assert time.monotonic() < fim, app.metricas_fila()
+        time.sleep(0.01)
+    return app.metricas_fila()
+
+
+def _saldo(texto):
+    return float(texto.rsplit('R$ ', 1)[1].split()[0])
+
+
+def test_respostas_em_ordem_por_remetente(enviadas, remetentes=8, mensagens=30):
+    """Mensagens de vários remetentes intercaladas na fila: cada um recebe as respostas na
+    ordem em que mandou, e os saldos finais batem"""
+    grupo = [f'whatsapp:+55117{r:04d}' for r in range(remetentes)]
+    for i in range(mensagens):
+        for remetente in grupo:
+            corpo = 'entrada 3 salario' if i % 2 == 0 else 'gasto 1 lanche'
+            app.enfileirar(corpo, remetente, ORIGEM, f'{remetente}-{i}')
+
+    metricas = _esperar_fila()
+    assert (metricas['pendentes'], metricas['processadas'], metricas['falhas']) == (0, remetentes * mensagens, 0)
+    esperados = [3 * ((i + 2) // 2) - (i + 1) // 2 for i in range(mensagens)]
+    dados = app.carregar_dados()
+    for remetente in grupo:
+        assert [_saldo(texto) for texto in enviadas[remetente]] == esperados
+        assert dados['usuarios'][dados['remetentes'][remetente]]['saldo'] == esperados[-1]
+
+
+def test_falha_no_envio_entra_nas_metricas(enviadas, monkeypatch, mensagens=5):
+    """Envio que falha para um remetente não trava a fila dos outros e é contado em 'falhas'"""
+    enviar = app.enviar_resposta
+
+    def enviar_ou_falhar(destino, origem, texto):
+        if destino == 'whatsapp:+5511000000002':
+            raise ConnectionError('Twilio fora do ar')
+        enviar(destino, origem, texto)
+
+    monkeypatch.setattr(app, 'enviar_resposta', enviar_ou_falhar)
+    for i in range(mensagens):
+        for remetente in ('whatsapp:+5511000000001', 'whatsapp:+5511000000002'):
+            app.enfileirar('entrada 1 x', remetente, ORIGEM, f'{remetente}-{i}')
+
+    metricas = _esperar_fila()
+    assert (metricas['pendentes'], metricas['processadas'], metricas['falhas']) == (0, 2 * mensagens, mensagens)
+    assert [_saldo(texto) for texto in enviadas['whatsapp:+5511000000001']] == [float(i) for i in range(1, mensagens + 1)]
+    assert 'whatsapp:+5511000000002' not in enviadas
+
+
+def test_fila_so_para_pedidos_locais(pasta):
+    """/fila mostra as métricas como o /metrics: só para a própria máquina"""
+    cliente = app.app.test_client()
+    assert cliente.get('/fila').status_code == 200
+    assert cliente.get('/fila', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 403
@@ -0,0 +1,64 @@
+"""Importação de extratos e o endpoint /importar (python -m pytest)"""
+import io
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import gerar_extratos
+
+
+@pytest.mark.parametrize('armazenamento, formato', [
+    ('json', 'csv'), ('json', 'ofx'), ('sqlite', 'csv'), ('particoes', 'csv'),
+])
+def test_reimportar_nao_duplica(pasta, armazenamento, formato, linhas=500):
+    app.STORAGE_BACKEND = armazenamento
+    csv_caminho, ofx_caminho, soma = gerar_extratos(pasta, linhas)
+    caminho = ofx_caminho if formato == 'ofx' else csv_caminho
+    for esperado in (linhas, 0):
+        with open(caminho, 'rb') as f:
+            resultado = app.importar_extrato(f, 'Principal')
+        assert resultado['importadas'] == esperado
+        dados = app.carregar_dados()
+        assert app.centavos(dados['usuarios']['Principal']['saldo']) == soma
+        assert not app.verificar_saldos(dados) and not app.verificar_totais(dados)
+
+
+EXTRATO = 'Data,Descrição,Valor\n01/02/2024,Padaria,"-12,50"\n01/02/2024,Padaria,"-12,50"\n'.encode('cp1252')
+
+
+def _importar(cliente, corpo=EXTRATO, **opcoes):
+    return cliente.post('/importar', data={'usuario': 'Ana', 'arquivo': (io.BytesIO(corpo), 'e.csv')}, **opcoes)
+
+
+def test_endpoint_importa_uma_vez(pasta):
+    cliente = app.app.test_client()
+    for esperado in (2, 0):
+        resposta = _importar(cliente)
+        assert resposta.status_code == 200 and resposta.json['importadas'] == esperado
+    assert app.carregar_dados()['usuarios']['Ana']['saldo'] == -25.0
+    resposta = cliente.post('/importar', data={'arquivo': (io.BytesIO(b'x;y\n1;2\n'), 'e.csv')})
+    assert resposta.status_code == 400
+
+
+def test_endpoint_recusa_pedido_de_fora(pasta):
+    cliente = app.app.test_client()
+    resposta = _importar(cliente, environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert resposta.status_code == 403
+    assert 'Ana' not in app.carregar_dados()['usuarios']
+
+
+def test_endpoint_com_token(pasta, monkeypatch):
+    monkeypatch.setattr(app, 'IMPORTAR_TOKEN', 'segredo')
+    cliente = app.app.test_client()
+    de_fora = {'REMOTE_ADDR': '203.0.113.7'}
+    assert _importar(cliente).status_code == 403
+    assert _importar(cliente, environ_base=de_fora, headers={'Authorization': 'Bearer errado'}).status_code == 403
+    resposta = _importar(cliente, environ_base=de_fora, headers={'Authorization': 'Bearer segredo'})
+    assert resposta.status_code == 200 and resposta.json['importadas'] == 2
+
+
+def test_endpoint_limita_o_tamanho(pasta):
+    cliente = app.app.test_client()
+    grande = EXTRATO + b'01/02/2024,Padaria,"-1,00"\n' * (app.app.config['MAX_CONTENT_LENGTH'] // 20)
+    assert _importar(cliente, grande).status_code == 413
+    assert 'Ana' not in app.carregar_dados()['usuarios']
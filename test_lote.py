@@ -0,0 +1,56 @@
+"""Lançamentos em lote: uma mensagem com um lançamento por linha (python -m pytest)"""
+import pytest
+
+import whatsapp_financas as app
+from benchmark import LINHAS_LOTE
+
+
+def _relido():
+    """Usuário Principal relido do disco, depois de conferir saldos e totais"""
+    app._cache['dados'] = None
+    app._sqlite.conexao = None
+    dados = app.carregar_dados()
+    assert not app.verificar_totais(dados) and not app.verificar_saldos(dados)
+    usuario = dados['usuarios']['Principal']
+    return usuario['saldo'], usuario['vr'], usuario['va'], app.quantidade_transacoes(usuario)
+
+
+@pytest.mark.parametrize('armazenamento', ['json', 'sqlite', 'particoes'])
+def test_lote_igual_a_mensagens_separadas(pasta, armazenamento):
+    """O lote grava o mesmo que as linhas mandadas uma a uma"""
+    app.STORAGE_BACKEND = armazenamento
+    linhas = [LINHAS_LOTE[i % len(LINHAS_LOTE)].format(v=i % 9 + 1) for i in range(20)]
+    saldos = {}
+    for modo in ('mensagens', 'lote'):
+        app.processar_mensagem('zerar')
+        app.processar_mensagem('entrada 1000 aporte')
+        app.processar_mensagem('+vr 100')
+        app.processar_mensagem('+va 100')
+        if modo == 'lote':
+            assert '20 lançamentos registrados' in app.processar_mensagem('\n'.join(linhas))
+        else:
+            for linha in linhas:
+                app.processar_mensagem(linha)
+        saldos[modo] = _relido()
+    assert saldos['mensagens'] == saldos['lote']
+
+
+def test_vale_conferido_com_o_saldo_corrente_do_lote(pasta):
+    """Um crédito antes do gasto no mesmo lote vale; o gasto que passa do saldo corrente barra o lote"""
+    app.processar_mensagem('entrada 100 aporte')
+    resposta = app.processar_mensagem('+vr 10\nvr 6 almoço\nusei VR 5 jantar')
+    assert 'Saldo insuficiente no VR na linha 3' in resposta
+    assert 'Disponível nesse ponto: R$ 4.00' in resposta and 'Nada foi registrado' in resposta
+    assert _relido() == (100.0, 0.0, 0.0, 1)
+
+    assert 'Saldo insuficiente no VA na linha 2' in app.processar_mensagem('gastei 5 pão\nva 1 feira')
+    assert '3 lançamentos registrados' in app.processar_mensagem('+va 20\nva 15 feira\ngastei 5 pão')
+    assert _relido() == (95.0, 0.0, 5.0, 4)
+
+
+def test_linha_invalida_nao_registra_nada(pasta):
+    """Uma linha que não é lançamento barra o lote inteiro, com o número da linha"""
+    app.processar_mensagem('entrada 100 aporte')
+    resposta = app.processar_mensagem('gastei 5 pão\nbla bla\ngastei 3 uber')
+    assert 'Linha 2: bla bla' in resposta and 'Nada foi registrado' in resposta
+    assert _relido() == (100.0, 0.0, 0.0, 1)
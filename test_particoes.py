@@ -0,0 +1,53 @@
+"""Armazenamento em partições, um arquivo por usuário (python -m pytest)"""
+import os
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import gerar_historico, _reiniciar_processo
+
+
+@pytest.fixture
+def particoes(pasta):
+    app.STORAGE_BACKEND = 'particoes'
+    return pasta
+
+
+def test_so_o_usuario_da_mensagem_e_lido(particoes, usuarios=50, historico=20):
+    gerar_historico(historico, ['Principal'] + [f'U{n}' for n in range(usuarios - 1)])
+    app.importar_json_para_particoes()
+    _reiniciar_processo()
+    for _ in range(5):
+        app.processar_mensagem('gasto 1 café')
+    assert list(app.carregar_dados()['usuarios'].residentes) == ['Principal']
+
+    # Relido do disco por um processo novo, o usuário tem os lançamentos de agora
+    _reiniciar_processo()
+    dados = app.carregar_dados()
+    assert len(dados['usuarios']['Principal']['transacoes']) == historico + 5
+    assert list(dados['usuarios'].residentes) == ['Principal']
+    assert len(dados['usuarios']) == usuarios
+
+
+def test_comandos_com_varios_usuarios(particoes):
+    """usuario, limpar tudo e zerar mexem em mais de uma partição"""
+    app.processar_mensagem('gasto 10 almoço', 'whatsapp:+5511111')
+    app.processar_mensagem('usuario maria', 'whatsapp:+5511111')
+    app.processar_mensagem('gasto 20 uber', 'whatsapp:+5511111')
+    app.processar_mensagem('entrada 300 pix', 'whatsapp:+5511222')
+    app.processar_mensagem('conta fixa 50 10 internet', 'whatsapp:+5511222')
+    app.processar_mensagem('limpar tudo', 'whatsapp:+5511222')
+    _reiniciar_processo()
+    dados = app.carregar_dados()
+    assert dict(dados['remetentes']) == {'whatsapp:+5511111': 'Maria', 'whatsapp:+5511222': '+5511222'}
+    assert [(u['saldo'], len(u['transacoes']), len(u['contas_fixas'])) for u in dados['usuarios'].values()] == [
+        (-10, 1, 0), (-20, 1, 0), (0, 0, 0)]
+    # Uma pasta por usuário, com o nome escapado
+    pastas = sorted(os.path.basename(app._pasta_particao(nome)) for nome in ('Principal', 'Maria', '+5511222'))
+    assert sorted(os.listdir(app.PARTICOES_DIR)) == pastas + ['contas.log', 'indice.json']
+
+    app.processar_mensagem('zerar', 'whatsapp:+5511111')
+    _reiniciar_processo()
+    dados = app.carregar_dados()
+    assert list(dados['usuarios']) == ['Principal'] and not dados['remetentes']
+    assert sorted(os.listdir(app.PARTICOES_DIR)) == ['Principal', 'contas.log', 'indice.json']
@@ -0,0 +1,135 @@
+"""Livro-razão: desfazer, saldo em uma data e verificar_razao (python -m pytest)"""
+from datetime import datetime, date, timedelta
+
+import pytest
+
+import whatsapp_financas as app
+from benchmark import gerar_razao, _reiniciar_processo
+
+
+ARMAZENAMENTOS = ['json', 'sqlite', 'particoes']
+
+
+@pytest.fixture(params=ARMAZENAMENTOS)
+def armazenamento(request, pasta):
+    app.STORAGE_BACKEND = request.param
+    return request.param
+
+
+def _relido():
+    """Usuário Principal como um processo novo o lê do disco; confere saldos, totais e razão"""
+    _reiniciar_processo()
+    app._sqlite.conexao = None
+    dados = app.carregar_dados()
+    assert not app.verificar_saldos(dados) and not app.verificar_totais(dados)
+    assert app.verificar_razao(dados) == []
+    return dados['usuarios']['Principal']
+
+
+def _saldo_em(dia):
+    resposta = app.processar_mensagem(f"saldo em {dia.strftime('%d/%m/%Y')}")
+    assert 'SALDOS EM' in resposta, resposta
+    return float(resposta.split('Saldo Geral:* R$ ')[1].split()[0])
+
+
+def test_desfazer_as_ultimas(armazenamento):
+    for mensagem in ('entrada 100 salario', 'gasto 10 a', 'gasto 20 b', 'gasto 30 c'):
+        app.processar_mensagem(mensagem)
+    assert 'desfeita' in app.processar_mensagem('desfazer 2')
+    assert 'de 1 a 20' in app.processar_mensagem('desfazer 21')
+    assert 'de 1 a 20' in app.processar_mensagem('desfazer 0')
+    usuario = _relido()
+    assert [t['descricao'] for t in usuario['transacoes']] == ['entrada salario', 'a']
+    assert usuario['saldo'] == 90
+
+
+def test_desfazer_pelo_termo_no_meio_do_historico(armazenamento):
+    for mensagem in ('entrada 1000 salario', 'gasto 50 uber centro', 'gasto 20 padaria', 'gasto 15 uber volta',
+                     'gasto 10 cafe'):
+        app.processar_mensagem(mensagem)
+    # A mais recente com o termo, no meio do histórico
+    assert 'uber volta' in app.processar_mensagem('desfazer uber')
+    assert 'Nenhuma transação com' in app.processar_mensagem('desfazer cinema')
+    usuario = _relido()
+    assert [t['descricao'] for t in usuario['transacoes']] == ['entrada salario', 'uber centro', 'padaria', 'cafe']
+    assert usuario['saldo'] == 920
+    # A busca já não encontra a transação desfeita
+    assert 'uber volta' not in app.processar_mensagem('buscar uber')
+    assert 'uber centro' in app.processar_mensagem('desfazer uber')
+    assert [t['descricao'] for t in _relido()['transacoes']] == ['entrada salario', 'padaria', 'cafe']
+
+
+@pytest.mark.parametrize('comando', ['desfazer 1', 'desfazer internet'])
+def test_desfazer_pagamento_reabre_a_conta_fixa(armazenamento, comando):
+    app.processar_mensagem('entrada 500 salario')
+    app.processar_mensagem('conta fixa 100 10 internet')
+    app.processar_mensagem('pagar conta 1')
+    mes = date.today().strftime('%Y-%m')
+    assert _relido()['contas_fixas'][0]['pago_ate'] == mes
+    app.processar_mensagem(comando)
+    usuario = _relido()
+    assert usuario['contas_fixas'][0]['pago_ate'] != mes
+    assert usuario['saldo'] == 500
+    # Paga de novo no mesmo mês, volta a constar como paga
+    assert 'Pagamento registrado' in app.processar_mensagem('pagar conta 1')
+    usuario = _relido()
+    assert usuario['saldo'] == 400 and usuario['contas_fixas'][0]['pago_ate'] == mes
+
+
+@pytest.mark.parametrize('intervalo', [10, 0])
+def test_saldo_em_antes_e_depois_de_um_instantaneo(pasta, monkeypatch, intervalo, eventos=95):
+    """Consultas logo antes, em cima e logo depois de cada instantâneo batem com os saldos
+    calculados à parte, reaplicando no máximo RAZAO_INTERVALO eventos"""
+    monkeypatch.setattr(app, 'RAZAO_INTERVALO', intervalo)
+    dados = app.carregar_dados()
+    usuario = dados['usuarios'].setdefault('Principal', app.novo_usuario())
+    minutos, esperados = gerar_razao(usuario, eventos)
+    app.salvar_dados(dados)
+    assert app.verificar_razao(dados) == []
+
+    app._razao['instantaneos'].clear()
+    consultas = [minutos[0] - 1] + [minutos[k] + d for k in range(9, eventos, 10) for d in (-1, 0, 1)]
+    for minuto in consultas:
+        saldos, reaplicados = app.saldos_em('Principal', usuario, minuto)
+        i = app.bisect_right(minutos, minuto)
+        assert saldos == ({campo: app.reais(v) for campo, v in esperados[i - 1].items()} if i else None)
+        if intervalo:
+            assert reaplicados <= intervalo
+
+
+def test_saldo_em_depois_de_limpar_tudo(pasta, monkeypatch):
+    """limpar tudo não se desfaz, mas o razão continua com os saldos dos dias anteriores"""
+    ontem = datetime.now() - timedelta(days=1)
+
+    class Ontem(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.combine(ontem.date(), datetime.min.time().replace(hour=12))
+
+    with monkeypatch.context() as relogio:
+        relogio.setattr(app, 'datetime', Ontem)
+        app.processar_mensagem('entrada 100 salario')
+        app.processar_mensagem('gasto 30 mercado')
+    assert 'Não dá para desfazer' in app.processar_mensagem('limpar tudo')
+
+    assert _saldo_em(ontem) == 70
+    assert _saldo_em(date.today()) == 0
+    usuario = _relido()
+    assert usuario['saldo'] == 0 and not usuario['transacoes']
+    assert 'Sem registros' in app.processar_mensagem(f"saldo em {(ontem - timedelta(days=1)).strftime('%d/%m/%Y')}")
+
+
+def test_saldo_em_data_futura(pasta):
+    app.processar_mensagem('entrada 100 salario')
+    amanha = date.today() + timedelta(days=1)
+    assert 'ainda não chegou' in app.processar_mensagem(f"saldo em {amanha.strftime('%d/%m/%Y')}")
+    assert _saldo_em(date.today()) == 100
+
+
+def test_verificar_razao_aponta_saldo_divergente(armazenamento):
+    app.processar_mensagem('entrada 100 salario')
+    app.processar_mensagem('gasto 40 mercado')
+    _relido()
+    dados = app.carregar_dados()
+    dados['usuarios']['Principal']['saldo'] = 99.0
+    assert app.verificar_razao(dados) == [('Principal', 'saldo', 60.0, 99.0)]
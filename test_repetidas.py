@@ -0,0 +1,79 @@
+"""Entregas repetidas do webhook (mesmo MessageSid) (python -m pytest)"""
+import multiprocessing
+import threading
+import time
+
+import whatsapp_financas as app
+from benchmark import preparar_ambiente
+
+
+def _entregar_duas_vezes(pasta, remetente, quantidade):
+    """Carga de um processo: entrega as mesmas mensagens (mesmos MessageSid) que o outro processo"""
+    preparar_ambiente(pasta)
+    cliente = app.app.test_client()
+    for i in range(quantidade):
+        resposta = cliente.post('/whatsapp', data={'Body': 'gasto 1 café', 'From': remetente, 'MessageSid': f'SM{i:032d}'})
+        assert resposta.status_code == 200
+
+
+FORMULARIO = {'Body': 'gastei 50 no mercado', 'From': 'whatsapp:+5511999', 'MessageSid': 'SMlento'}
+
+
+def test_repeticao_durante_a_gravacao(pasta, monkeypatch):
+    """Repetições que chegam enquanto a original ainda grava recebem a mesma resposta, sem
+    lançar de novo"""
+    cliente = app.app.test_client()
+    salvar = app.salvar_dados
+
+    def salvar_devagar(dados):
+        time.sleep(0.2)
+        salvar(dados)
+
+    monkeypatch.setattr(app, 'salvar_dados', salvar_devagar)
+    respostas = []
+    entregas = [threading.Thread(target=lambda: respostas.append(cliente.post('/whatsapp', data=FORMULARIO).data))
+                for _ in range(3)]
+    for thread in entregas:
+        thread.start()
+        time.sleep(0.05)
+    for thread in entregas:
+        thread.join()
+    assert len(respostas) == 3 and len(set(respostas)) == 1
+    usuario = app.carregar_dados()['usuarios']['Principal']
+    assert len(usuario['transacoes']) == 1 and usuario['saldo'] == -50
+
+
+def test_repeticao_depois_de_reiniciar(pasta):
+    """A memória some no reinício, mas o DEDUP_ARQUIVO continua valendo"""
+    cliente = app.app.test_client()
+    primeira = cliente.post('/whatsapp', data=FORMULARIO).data
+    app._entregas.update(respostas=app.OrderedDict(), inode=None, posicao=0, linhas=0)
+    assert cliente.post('/whatsapp', data=FORMULARIO).data == primeira
+    assert len(app.carregar_dados()['usuarios']['Principal']['transacoes']) == 1
+
+
+def test_dois_processos_com_as_mesmas_entregas(pasta, quantidade=200):
+    contexto = multiprocessing.get_context('spawn')
+    filhos = [contexto.Process(target=_entregar_duas_vezes, args=(pasta, 'whatsapp:+5511888', quantidade))
+              for _ in range(2)]
+    for filho in filhos:
+        filho.start()
+    for filho in filhos:
+        filho.join()
+    assert [filho.exitcode for filho in filhos] == [0, 0]
+    app._cache['dados'] = None
+    usuario = app.carregar_dados()['usuarios']['Principal']
+    assert len(usuario['transacoes']) == quantidade and usuario['saldo'] == -quantidade
+
+
+def test_limite_de_respostas_guardadas(pasta, monkeypatch):
+    """Com DEDUP_MAXIMO=100: até 100 respostas em memória e o arquivo limpo antes de passar de 201 linhas"""
+    monkeypatch.setattr(app, 'DEDUP_MAXIMO', 100)
+    for i in range(1000):
+        app.processar_mensagem('saldo', 'whatsapp:+5511777', f'SMlimite{i}')
+    with open(app.DEDUP_ARQUIVO, encoding='utf-8') as f:
+        linhas = sum(1 for _ in f)
+    assert len(app._entregas['respostas']) <= 100 and linhas <= 201
+    # As mais recentes continuam respondidas pelo que foi guardado
+    assert app.resposta_registrada('SMlimite999') is not None
+    assert app.resposta_registrada('SMlimite0') is None
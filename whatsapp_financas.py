@@ -0,0 +1,5100 @@
+from flask import Flask, request
+from twilio.twiml.messaging_response import MessagingResponse
+from contextlib import contextmanager, ExitStack
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from functools import lru_cache, wraps
+from bisect import bisect_left, bisect_right, insort
+from array import array
+from operator import itemgetter
+from itertools import islice
+from datetime import datetime, date, timedelta
+from urllib.parse import quote
+import threading
+import queue
+import time
+import hashlib
+import hmac
+import heapq
+import calendar
+import unicodedata
+import struct
+import zlib
+import shutil
+import signal
+import sqlite3
+import json
+import csv
+import io
+import re
+import sys
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: as travas valem só entre threads do mesmo processo
+    fcntl = None
+
+app = Flask(__name__)
+
+# Arquivo para armazenar dados (snapshot completo)
+DATA_FILE = 'financas_data.json'
+# Diário com uma linha compacta por alteração feita desde o último snapshot
+JOURNAL_FILE = 'financas_journal.jsonl'
+# Pasta com os arquivos de trava compartilhados entre processos
+LOCK_DIR = 'financas_locks'
+# Armazenamento: 'json' (snapshot + diário), 'sqlite' ou 'particoes' (um arquivo por usuário)
+STORAGE_BACKEND = os.environ.get('FINANCAS_BACKEND', 'json')
+# Banco usado quando STORAGE_BACKEND = 'sqlite'
+SQLITE_FILE = os.environ.get('FINANCAS_SQLITE', 'financas.db')
+# Pasta usada quando STORAGE_BACKEND = 'particoes': índice de usuários + uma partição por usuário
+PARTICOES_DIR = os.environ.get('FINANCAS_PARTICOES', 'financas_usuarios')
+# Pasta com os meses fechados, uma partição por usuário e mês
+ARCHIVE_DIR = os.environ.get('FINANCAS_ARQUIVO', 'financas_arquivo')
+# Tamanho máximo de uma mensagem do WhatsApp (Twilio) e páginas enviadas por resposta do extrato
+LIMITE_MENSAGEM = 1600
+PAGINAS_POR_RESPOSTA = int(os.environ.get('PAGINAS_POR_RESPOSTA', 1))
+# Modo assíncrono do webhook: responde na hora e envia a resposta depois, pela API do Twilio
+RESPOSTA_ASSINCRONA = os.environ.get('RESPOSTA_ASSINCRONA') == '1'
+TRABALHADORES_FILA = int(os.environ.get('TRABALHADORES_FILA', 4))
+# Durabilidade das gravações: 'sempre' (fsync a cada mensagem), 'lote' (gravações que chegam
+# juntas dividem um fsync, esperando até JANELA_LOTE_MS se há outras a caminho) ou 'os' (fica no
+# cache do sistema). O fsync em lote cobre só o diário; o razão (RAZAO_DIR) só vai ao disco com 'sempre'
+DURABILIDADE = os.environ.get('DURABILIDADE', 'lote')
+JANELA_LOTE_MS = float(os.environ.get('JANELA_LOTE_MS', 2))
+# Formato do snapshot: 'json' (legível, o de sempre) ou 'compacto' (binário em colunas)
+FORMATO_SNAPSHOT = os.environ.get('FORMATO_SNAPSHOT', 'json')
+COMPRIMIR_SNAPSHOT = os.environ.get('COMPRIMIR_SNAPSHOT', '1') == '1'
+# Histogramas de tempo por etapa e contadores por comando (GET /metrics); PERFIL_AMOSTRAGEM=1
+# liga o profiler por amostragem desde o início (também dá para ligar depois, em POST /perfil)
+METRICAS = os.environ.get('METRICAS', '1') == '1'
+PERFIL_AMOSTRAGEM = os.environ.get('PERFIL_AMOSTRAGEM') == '1'
+# /metrics e /perfil só respondem a pedidos da própria máquina, a menos que METRICAS_LOCAL=0
+METRICAS_LOCAL = os.environ.get('METRICAS_LOCAL', '1') == '1'
+# Quantidade de registros no diário que dispara a compactação em segundo plano
+COMPACTAR_APOS = int(os.environ.get('COMPACTAR_APOS', 500))
+# Entregas repetidas do webhook (mesmo MessageSid) recebem a resposta guardada: por DEDUP_TTL
+# segundos (0 desliga), no máximo DEDUP_MAXIMO respostas, mantidas em DEDUP_ARQUIVO entre
+# reinícios e entre processos ('' guarda só em memória)
+DEDUP_TTL = float(os.environ.get('DEDUP_TTL', 86400))
+DEDUP_MAXIMO = int(os.environ.get('DEDUP_MAXIMO', 10000))
+DEDUP_ARQUIVO = os.environ.get('DEDUP_ARQUIVO', 'financas_mensagens.jsonl')
+# Agenda das contas fixas: AGENDA=1 liga a thread que, a cada AGENDA_INTERVALO segundos, lança
+# (AGENDA_MODO='debitar') ou lembra (AGENDA_MODO='lembrete') as contas vencidas. Com
+# AGENDA_RECUPERAR=0, os vencimentos perdidos com o serviço parado são pulados em vez de
+# processados. Os lembretes saem pelo número do Twilio em TWILIO_NUMERO
+AGENDA = os.environ.get('AGENDA') == '1'
+AGENDA_INTERVALO = float(os.environ.get('AGENDA_INTERVALO', 60))
+AGENDA_MODO = os.environ.get('AGENDA_MODO', 'lembrete')
+AGENDA_RECUPERAR = os.environ.get('AGENDA_RECUPERAR', '1') == '1'
+TWILIO_NUMERO = os.environ.get('TWILIO_NUMERO', '')
+# Índices do histórico em memória (busca por termo e por data) dos INDICE_USUARIOS usuários
+# (e meses fechados) consultados mais recentemente
+INDICE_USUARIOS = int(os.environ.get('INDICE_USUARIOS', 1000))
+# Livro-razão: eventos de saldo de cada usuário (lançamentos, estornos, ajustes), nunca apagados,
+# com um instantâneo dos saldos a cada RAZAO_INTERVALO eventos para consultar saldos passados (0: sem)
+RAZAO_DIR = os.environ.get('FINANCAS_RAZAO', 'financas_razao')
+RAZAO_INTERVALO = int(os.environ.get('RAZAO_INTERVALO', 100))
+# Quantas descrições corrigidas ('categoria ...') cada usuário guarda para categorizar os próximos gastos
+CATEGORIAS_APRENDIDAS = int(os.environ.get('CATEGORIAS_APRENDIDAS', 200))
+# POST /importar grava no histórico de qualquer usuário: só aceita pedidos da própria máquina ou,
+# com IMPORTAR_TOKEN, os que trazem 'Authorization: Bearer <token>'. Nenhum pedido passa de
+# TAMANHO_MAXIMO_MB (o extrato vem inteiro no corpo)
+IMPORTAR_TOKEN = os.environ.get('IMPORTAR_TOKEN', '')
+TAMANHO_MAXIMO_MB = float(os.environ.get('TAMANHO_MAXIMO_MB', 20))
+app.config['MAX_CONTENT_LENGTH'] = int(TAMANHO_MAXIMO_MB * 2 ** 20)
+
+# Estado da persistência: o que já está gravado (snapshot + diário)
+_persistido = {'seq': 0, 'meta': {}, 'remetentes': {}, 'usuarios': {}}
+_diario = {'registros': 0, 'compactando': False, 'thread': None}
+# Commit em grupo: registros gravados e já confirmados em disco por fsync (contagem deste processo);
+# 'gravando' conta as threads entre entrar em salvar_dados e acrescentar o registro ao diário
+_lote = {'escritos': 0, 'sincronizados': 0, 'sincronizando': False, 'gravando': 0, 'condicao': threading.Condition()}
+# Dados residentes em memória; só são relidos do disco se os arquivos mudarem por fora
+_cache = {'dados': None, 'assinatura': None, 'posicao': 0}
+# Uma trava por chave (remetente, usuário, armazenamento)
+_travas = {}
+_lock_travas = threading.Lock()
+_travadas = threading.local()
+
+@contextmanager
+def trava(chave):
+    """Trava exclusiva por chave, entre threads e (com fcntl) entre processos"""
+    with _lock_travas:
+        lock = _travas.setdefault(chave, threading.Lock())
+    
+    chaves = _chaves_travadas()
+    with lock:
+        chaves.add(chave)
+        try:
+            if fcntl is None:
+                yield
+                return
+            
+            os.makedirs(LOCK_DIR, exist_ok=True)
+            nome = hashlib.sha1(chave.encode('utf-8')).hexdigest() + '.lock'
+            with open(os.path.join(LOCK_DIR, nome), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        finally:
+            chaves.discard(chave)
+
+def _chaves_travadas():
+    """Chaves travadas pela thread atual"""
+    if not hasattr(_travadas, 'chaves'):
+        _travadas.chaves = set()
+    return _travadas.chaves
+
+def novo_usuario():
+    """Retorna a estrutura vazia de um usuário"""
+    return {
+        'saldo': 0,
+        'vr': 0,
+        'va': 0,
+        'transacoes': [],
+        'contas_fixas': [],
+        'totais': {},
+        'saldos_iniciais': {'saldo': 0, 'vr': 0, 'va': 0}
+    }
+
+def dados_vazios():
+    """Retorna a estrutura inicial dos dados"""
+    return {
+        'usuario_atual': 'Principal',
+        'usuarios': {
+            'Principal': novo_usuario()
+        },
+        'remetentes': {},
+        'mes_atual': datetime.now().strftime('%Y-%m')
+    }
+
+# ===== MÉTRICAS =====
+
+# Limites (segundos) dos baldes dos histogramas de tempo por etapa
+BALDES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Contadores deste processo: {etapa: [contagem por balde..., acima do último]}, somas e comandos
+_metricas = {'lock': threading.Lock(), 'etapas': {}, 'somas': {}, 'comandos': {}}
+# Profiler por amostragem: pilhas recolhidas ({pilha: amostras}) e a thread que as recolhe
+_perfil = {'ligado': False, 'intervalo': 0.01, 'thread': None, 'pilhas': {}, 'amostras': 0}
+
+def observar(etapa, segundos):
+    """Conta uma duração no histograma da etapa"""
+    if not METRICAS:
+        return
+    balde = bisect_left(BALDES_LATENCIA, segundos)
+    with _metricas['lock']:
+        contagens = _metricas['etapas'].get(etapa)
+        if contagens is None:
+            contagens = _metricas['etapas'][etapa] = [0] * (len(BALDES_LATENCIA) + 1)
+            _metricas['somas'][etapa] = 0.0
+        contagens[balde] += 1
+        _metricas['somas'][etapa] += segundos
+
+def cronometrar(etapa):
+    """Decorador: mede cada chamada da função no histograma da etapa"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def medida(*args, **kwargs):
+            if not METRICAS:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                observar(etapa, time.perf_counter() - inicio)
+        return medida
+    return decorador
+
+def contar_comando(nome):
+    """Soma um no contador do comando"""
+    if METRICAS:
+        with _metricas['lock']:
+            _metricas['comandos'][nome] = _metricas['comandos'].get(nome, 0) + 1
+
+def _rotulo(valor):
+    """Valor de rótulo no formato texto do Prometheus (escapa \\, " e quebra de linha)"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _tamanhos_arquivos():
+    """Bytes ocupados por arquivo de dados do armazenamento em uso"""
+    if STORAGE_BACKEND == 'sqlite':
+        caminhos = {'sqlite': SQLITE_FILE, 'sqlite_wal': SQLITE_FILE + '-wal'}
+    elif STORAGE_BACKEND == 'particoes':
+        caminhos = {'indice': os.path.join(PARTICOES_DIR, 'indice.json')}
+    else:
+        caminhos = {'snapshot': DATA_FILE, 'diario': JOURNAL_FILE}
+    return {arquivo: os.path.getsize(caminho) for arquivo, caminho in caminhos.items()
+            if os.path.exists(caminho)}
+
+def texto_metricas():
+    """Métricas deste processo no formato texto do Prometheus (version 0.0.4)"""
+    with _metricas['lock']:
+        etapas = {etapa: list(contagens) for etapa, contagens in _metricas['etapas'].items()}
+        somas = dict(_metricas['somas'])
+        comandos = dict(_metricas['comandos'])
+    
+    linhas = ['# HELP financas_etapa_segundos Tempo gasto em cada etapa do processamento das mensagens',
+              '# TYPE financas_etapa_segundos histogram']
+    for etapa, contagens in sorted(etapas.items()):
+        acumulado = 0
+        for limite, contagem in zip(BALDES_LATENCIA + ('+Inf',), contagens):
+            acumulado += contagem
+            linhas.append(f'financas_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+        linhas.append(f'financas_etapa_segundos_sum{{etapa="{etapa}"}} {somas[etapa]:.6f}')
+        linhas.append(f'financas_etapa_segundos_count{{etapa="{etapa}"}} {acumulado}')
+    
+    linhas += ['# HELP financas_comandos_total Mensagens atendidas por comando',
+               '# TYPE financas_comandos_total counter']
+    for nome, quantidade in sorted(comandos.items()):
+        linhas.append(f'financas_comandos_total{{comando="{_rotulo(nome)}"}} {quantidade}')
+    
+    linhas += ['# HELP financas_arquivo_bytes Tamanho dos arquivos de dados',
+               '# TYPE financas_arquivo_bytes gauge']
+    for arquivo, tamanho in _tamanhos_arquivos().items():
+        linhas.append(f'financas_arquivo_bytes{{arquivo="{arquivo}"}} {tamanho}')
+    
+    linhas += ['# HELP financas_transacoes Transações no histórico ativo de cada usuário',
+               '# TYPE financas_transacoes gauge']
+    for nome, usuario in sorted(cabecalhos_usuarios(carregar_dados()), key=itemgetter(0)):
+        # Pelos totais, sem contar o histórico (dados antigos sem totais: tamanho da lista)
+        quantidade = quantidade_transacoes(usuario) if 'totais' in usuario else len(usuario.get('transacoes', ()))
+        linhas.append(f'financas_transacoes{{usuario="{_rotulo(nome)}"}} {quantidade}')
+    
+    fila = metricas_fila()
+    linhas += ['# HELP financas_fila_pendentes Mensagens esperando na fila do modo assíncrono',
+               '# TYPE financas_fila_pendentes gauge',
+               f"financas_fila_pendentes {fila['pendentes']}",
+               '# HELP financas_fila_processadas_total Mensagens processadas pela fila',
+               '# TYPE financas_fila_processadas_total counter',
+               f"financas_fila_processadas_total {fila['processadas']}",
+               '# HELP financas_fila_falhas_total Mensagens da fila que falharam',
+               '# TYPE financas_fila_falhas_total counter',
+               f"financas_fila_falhas_total {fila['falhas']}",
+               '# HELP financas_fila_atraso_maximo_segundos Maior atraso entre receber e responder',
+               '# TYPE financas_fila_atraso_maximo_segundos gauge',
+               f"financas_fila_atraso_maximo_segundos {fila['atraso_maximo']:.6f}"]
+    return '\n'.join(linhas) + '\n'
+
+def _amostrar():
+    """Thread do profiler: a cada intervalo guarda a pilha de cada thread (exceto a própria)"""
+    propria = threading.get_ident()
+    while _perfil['ligado']:
+        for ident, quadro in sys._current_frames().items():
+            if ident == propria:
+                continue
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{quadro.f_lineno})')
+                quadro = quadro.f_back
+            chave = ';'.join(reversed(pilha))
+            _perfil['pilhas'][chave] = _perfil['pilhas'].get(chave, 0) + 1
+        _perfil['amostras'] += 1
+        time.sleep(_perfil['intervalo'])
+
+def ligar_perfil(intervalo=0.01):
+    """Liga o profiler por amostragem (sem reiniciar o processo) e zera o que foi recolhido"""
+    desligar_perfil()
+    _perfil.update(ligado=True, intervalo=intervalo, pilhas={}, amostras=0)
+    _perfil['thread'] = threading.Thread(target=_amostrar, daemon=True)
+    _perfil['thread'].start()
+
+def desligar_perfil():
+    """Para o profiler; o que foi recolhido continua disponível em perfil_coletado()"""
+    _perfil['ligado'] = False
+    if _perfil['thread'] is not None:
+        _perfil['thread'].join()
+        _perfil['thread'] = None
+
+def perfil_coletado():
+    """Pilhas recolhidas no formato 'colapsado' (uma por linha: f1;f2;f3 amostras), para flame graphs"""
+    pilhas = dict(_perfil['pilhas'])
+    return ''.join(f'{pilha} {amostras}\n' for pilha, amostras in sorted(pilhas.items(), key=lambda p: -p[1]))
+
+if PERFIL_AMOSTRAGEM:
+    ligar_perfil()
+
+# ===== FORMATO COMPACTO DO SNAPSHOT =====
+
+# Snapshot compacto: cabeçalho JSON pequeno + um bloco binário por usuário com as transações
+# em colunas (tipo e categoria como índices, valor em centavos, data em minutos desde 1970)
+MAGICO_COMPACTO = b'FIN1'
+_ORDINAL_1970 = date(1970, 1, 1).toordinal()
+_SEPARADOR_DESCRICAO = '\x00'
+# Campos que a transação original não tinha (chave reservada dentro dos extras)
+_AUSENTES = '\x00ausentes'
+_CONJUNTO_CAMPOS = {'tipo', 'valor', 'descricao', 'data', 'categoria'}
+
+_DIA_COMPACTO = re.compile(r'(\d\d)/(\d\d)/(\d{4})')
+_HORARIO_COMPACTO = re.compile(r' ([01]\d|2[0-3]):([0-5]\d)')
+_HORARIOS = [f' {minuto // 60:02d}:{minuto % 60:02d}' for minuto in range(1440)]
+
+def _dia_da_data(texto):
+    """'%d/%m/%Y' -> dias desde 01/01/1970 (None se não couber exatamente nesse formato)"""
+    encontrado = _DIA_COMPACTO.fullmatch(texto)
+    if not encontrado:
+        return None
+    dia, mes, ano = map(int, encontrado.groups())
+    try:
+        dias = date(ano, mes, dia).toordinal() - _ORDINAL_1970
+    except ValueError:
+        return None
+    return dias if dias >= 0 else None
+
+def _minuto_do_horario(texto):
+    """' %H:%M' -> minutos desde a meia-noite"""
+    encontrado = _HORARIO_COMPACTO.fullmatch(texto)
+    return int(encontrado[1]) * 60 + int(encontrado[2]) if encontrado else None
+
+def _colunas_transacoes(transacoes):
+    """Codifica as transações de um usuário num bloco binário; o que não cabe nas colunas vai em extras"""
+    tipos, categorias, extras = {}, {}, {}
+    coluna_tipo, coluna_categoria = [], []
+    centavos, minutos, descricoes = array('q'), array('i'), []
+    
+    # Muitas transações no mesmo dia e horário: cada um é interpretado uma vez só
+    dias, horarios = {}, {}
+    
+    for i, t in enumerate(transacoes):
+        extra = {}
+        if t.keys() != _CONJUNTO_CAMPOS:
+            extra = {campo: valor for campo, valor in t.items() if campo not in _CAMPOS_TRANSACAO}
+            ausentes = [campo for campo in _CAMPOS_TRANSACAO if campo not in t]
+            if ausentes:
+                extra[_AUSENTES] = ausentes
+        coluna_tipo.append(tipos.setdefault(t.get('tipo'), len(tipos)))
+        coluna_categoria.append(categorias.setdefault(t.get('categoria'), len(categorias)))
+        
+        valor = t.get('valor')
+        inteiro = round(valor * 100) if type(valor) is float and abs(valor) < 1e15 else 0
+        if inteiro / 100 != valor or type(valor) is not float:
+            extra['valor'] = valor
+        centavos.append(inteiro)
+        
+        data = t.get('data')
+        momento = None
+        if isinstance(data, str) and len(data) == 16:
+            dia = dias[data[:10]] if data[:10] in dias else dias.setdefault(data[:10], _dia_da_data(data[:10]))
+            horario = horarios[data[10:]] if data[10:] in horarios else \
+                horarios.setdefault(data[10:], _minuto_do_horario(data[10:]))
+            if dia is not None and horario is not None:
+                momento = dia * 1440 + horario
+        if momento is None:
+            extra['data'] = data
+            momento = -1
+        minutos.append(momento)
+        
+        descricao = t.get('descricao')
+        if not isinstance(descricao, str) or _SEPARADOR_DESCRICAO in descricao:
+            extra['descricao'] = descricao
+            descricao = ''
+        descricoes.append(descricao)
+        if extra:
+            extras[i] = extra
+    
+    indice = 'B' if max(len(tipos), len(categorias)) <= 256 else 'H'
+    colunas = [array(indice, coluna_tipo), array(indice, coluna_categoria), centavos, minutos]
+    if sys.byteorder == 'big':
+        for coluna in colunas:
+            coluna.byteswap()
+    bloco = b''.join(coluna.tobytes() for coluna in colunas)
+    bloco += _SEPARADOR_DESCRICAO.join(descricoes).encode('utf-8')
+    descricao_bloco = {
+        'n': len(transacoes),
+        'indice': indice,
+        'tipos': list(tipos),
+        'categorias': list(categorias),
+        'extras': extras
+    }
+    return descricao_bloco, bloco
+
+def _transacoes_das_colunas(descricao_bloco, bloco):
+    """Reconstrói a lista de transações (dicionários no formato de sempre) a partir do bloco"""
+    n = descricao_bloco['n']
+    if n == 0:
+        return []
+    tipos, categorias = descricao_bloco['tipos'], descricao_bloco['categorias']
+    
+    colunas = []
+    posicao = 0
+    for codigo in (descricao_bloco['indice'], descricao_bloco['indice'], 'q', 'i'):
+        coluna = array(codigo)
+        tamanho = coluna.itemsize * n
+        coluna.frombytes(bloco[posicao:posicao + tamanho])
+        if sys.byteorder == 'big':
+            coluna.byteswap()
+        colunas.append(coluna)
+        posicao += tamanho
+    descricoes = bloco[posicao:].decode('utf-8').split(_SEPARADOR_DESCRICAO)
+    
+    # Datas repetem muito (mesmo dia): formata cada dia uma vez só
+    dias = {}
+    transacoes = []
+    for tipo, categoria, centavos, minutos, descricao in zip(*colunas, descricoes):
+        if minutos >= 0:
+            dia, minuto = divmod(minutos, 1440)
+            prefixo = dias.get(dia)
+            if prefixo is None:
+                d = date.fromordinal(dia + _ORDINAL_1970)
+                prefixo = dias[dia] = f'{d.day:02d}/{d.month:02d}/{d.year:04d}'
+            data = prefixo + _HORARIOS[minuto]
+        else:
+            data = None
+        transacoes.append({
+            'tipo': tipos[tipo],
+            'valor': centavos / 100,
+            'descricao': descricao,
+            'data': data,
+            'categoria': categorias[categoria]
+        })
+    for i, extra in descricao_bloco['extras'].items():
+        transacao = transacoes[int(i)]
+        for campo in extra.pop(_AUSENTES, ()):
+            del transacao[campo]
+        transacao.update(extra)
+    return transacoes
+
+def codificar_snapshot(dados, comprimir=True):
+    """Snapshot compacto: MAGICO, flag de compressão, cabeçalho JSON e um bloco por usuário"""
+    cabecalho = {chave: valor for chave, valor in dados.items() if chave != 'usuarios'}
+    cabecalho['usuarios'] = {}
+    blocos = []
+    for nome, usuario in dados['usuarios'].items():
+        descricao_bloco, bloco = _colunas_transacoes(usuario['transacoes'])
+        if comprimir:
+            bloco = zlib.compress(bloco, 6)
+        descricao_bloco['bytes'] = len(bloco)
+        cabecalho['usuarios'][nome] = {
+            'campos': {campo: valor for campo, valor in usuario.items() if campo != 'transacoes'},
+            'bloco': descricao_bloco
+        }
+        blocos.append(bloco)
+    
+    cabecalho = json.dumps(cabecalho, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b''.join([MAGICO_COMPACTO, bytes([1 if comprimir else 0]),
+                     struct.pack('<I', len(cabecalho)), cabecalho] + blocos)
+
+def decodificar_snapshot(conteudo):
+    """Inverso de codificar_snapshot: devolve os dados no formato de sempre"""
+    comprimido = conteudo[4] == 1
+    tamanho, = struct.unpack_from('<I', conteudo, 5)
+    posicao = 9 + tamanho
+    dados = json.loads(conteudo[9:posicao].decode('utf-8'))
+    
+    usuarios = {}
+    for nome, usuario in dados['usuarios'].items():
+        descricao_bloco = usuario['bloco']
+        bloco = conteudo[posicao:posicao + descricao_bloco['bytes']]
+        posicao += descricao_bloco['bytes']
+        if comprimido:
+            bloco = zlib.decompress(bloco)
+        usuarios[nome] = usuario['campos']
+        usuarios[nome]['transacoes'] = _transacoes_das_colunas(descricao_bloco, bloco)
+    dados['usuarios'] = usuarios
+    return dados
+
+def _ler_snapshot():
+    """Lê o snapshot (JSON no formato original ou compacto) e garante a estrutura completa"""
+    if not os.path.exists(DATA_FILE):
+        return dados_vazios()
+    
+    with open(DATA_FILE, 'rb') as f:
+        conteudo = f.read()
+    if conteudo.startswith(MAGICO_COMPACTO):
+        dados = decodificar_snapshot(conteudo)
+    else:
+        dados = json.loads(conteudo.decode('utf-8'))
+    # Garantir estrutura completa
+    if 'usuario_atual' not in dados:
+        dados['usuario_atual'] = 'Principal'
+    if 'usuarios' not in dados:
+        dados['usuarios'] = {
+            'Principal': {
+                'saldo': dados.get('saldo', 0),
+                'vr': dados.get('vr', 0),
+                'va': dados.get('va', 0),
+                'transacoes': dados.get('transacoes', []),
+                'contas_fixas': []
+            }
+        }
+    if 'remetentes' not in dados:
+        dados['remetentes'] = {}
+    if 'mes_atual' not in dados:
+        dados['mes_atual'] = datetime.now().strftime('%Y-%m')
+    return dados
+
+def _aplicar_registro(dados, registro):
+    """Reaplica um registro do diário sobre os dados"""
+    dados.update(registro.get('m', {}))
+    for remetente, nome in registro.get('r', {}).items():
+        if nome is None:
+            dados['remetentes'].pop(remetente, None)
+        else:
+            dados['remetentes'][remetente] = nome
+    
+    for nome, mudanca in registro.get('u', {}).items():
+        if mudanca is None or 'contas_fixas' in mudanca.get('h', {}):
+            marcar_contas_alteradas(nome)
+        if mudanca is None:
+            dados['usuarios'].pop(nome, None)
+            continue
+        usuario = dados['usuarios'].setdefault(nome, novo_usuario())
+        if 'T' in mudanca:
+            usuario['transacoes'] = mudanca['T']
+        if mudanca.get('p'):
+            del usuario['transacoes'][-mudanca['p']:]
+        if 'x' in mudanca:
+            del usuario['transacoes'][mudanca['x']]
+        usuario['transacoes'].extend(mudanca.get('t', []))
+        usuario.update(mudanca.get('h', {}))
+
+def _ler_diario(caminho, seq, inicio=0):
+    """Lê os registros do diário posteriores a seq a partir da posição inicio.
+    
+    Retorna os registros e a posição final. Uma linha final incompleta (queda
+    durante a escrita) é descartada do arquivo.
+    """
+    registros = []
+    if not os.path.exists(caminho):
+        return registros, 0
+    
+    with open(caminho, 'rb+') as f:
+        f.seek(inicio)
+        valido = inicio
+        for linha in f:
+            if not linha.endswith(b'\n'):
+                break
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            valido += len(linha)
+            if registro['n'] > seq:
+                registros.append(registro)
+        f.truncate(valido)
+    return registros, valido
+
+def _assinatura_usuario(usuario, transacoes=None):
+    """Resumo barato de um usuário: campos pequenos serializados + ponta da lista de transações"""
+    lista = usuario['transacoes']
+    if transacoes is None:
+        transacoes = lista
+    return {
+        'campos': {
+            campo: json.dumps(valor, sort_keys=True)
+            for campo, valor in list(usuario.items()) if campo != 'transacoes'
+        },
+        'usuario': usuario,
+        'lista': lista,
+        'n': len(transacoes),
+        'ultima': transacoes[-1] if transacoes else None,
+        'penultima': transacoes[-2] if len(transacoes) > 1 else None
+    }
+
+class HistoricoSemUma(list):
+    """Histórico com uma transação tirada do meio (desfazer_transacao).
+    
+    Lembra de que lista veio e de que posição, para o diário e as partições gravarem só a
+    remoção em vez do histórico inteiro.
+    """
+    
+    def __init__(self, origem, posicao):
+        super().__init__(origem[:posicao])
+        self.extend(islice(origem, posicao + 1, None))
+        if isinstance(origem, HistoricoSemUma):
+            # A lista anterior deixou de ser o histórico: não segura a dela na memória
+            origem.origem = None
+        self.origem = origem
+        self.posicao = posicao
+        self.tamanho = len(origem)
+        self.ultima = origem[-1] if origem else None
+
+def _removida_do_persistido(transacoes, anterior):
+    """Posição tirada se `transacoes` é o histórico gravado (`anterior`) sem uma transação;
+    None se não for"""
+    if (isinstance(transacoes, HistoricoSemUma) and transacoes.origem is anterior['lista']
+            and transacoes.tamanho == anterior['n'] and transacoes.ultima is anterior['ultima']):
+        return transacoes.posicao
+    return None
+
+def _marcar_meta(dados):
+    """Guarda a assinatura dos campos globais (fora usuários e remetentes)"""
+    _persistido['meta'] = {
+        chave: json.dumps(valor, sort_keys=True)
+        for chave, valor in list(dados.items()) if chave not in ('usuarios', 'remetentes')
+    }
+    _persistido['remetentes'] = dict(dados['remetentes'])
+
+def _marcar_registro(dados, registro, assinaturas=None):
+    """Atualiza as assinaturas só com o que um registro gravou"""
+    _persistido['seq'] = registro['n']
+    for chave, valor in registro.get('m', {}).items():
+        _persistido['meta'][chave] = json.dumps(valor, sort_keys=True)
+    for remetente, nome in registro.get('r', {}).items():
+        if nome is None:
+            _persistido['remetentes'].pop(remetente, None)
+        else:
+            _persistido['remetentes'][remetente] = nome
+    
+    if assinaturas is None:
+        assinaturas = {
+            nome: _assinatura_usuario(dados['usuarios'][nome]) if nome in dados['usuarios'] else None
+            for nome in registro.get('u', {})
+        }
+    for nome, assinatura in assinaturas.items():
+        if assinatura is None:
+            _persistido['usuarios'].pop(nome, None)
+        else:
+            _persistido['usuarios'][nome] = assinatura
+
+def _mesmo_que_persistido(nome, usuario):
+    """Indica se um usuário lido do disco está igual ao que este processo já conhecia"""
+    anterior = _persistido['usuarios'].get(nome)
+    if anterior is None:
+        return False
+    atual = _assinatura_usuario(usuario)
+    return (atual['campos'] == anterior['campos'] and atual['n'] == anterior['n']
+            and atual['ultima'] == anterior['ultima'])
+
+def _diferenca(dados, nomes=None):
+    """Calcula o registro do diário com o que mudou desde a última gravação.
+    
+    Considera só os usuários em nomes (os travados pela thread que grava),
+    além de usuários criados, substituídos ou removidos. O custo é proporcional ao número de
+    usuários e de transações novas, não ao tamanho do histórico.
+    
+    Retorna o registro e as novas assinaturas dos usuários incluídos nele.
+    """
+    registro = {}
+    assinaturas = {}
+    
+    meta = {}
+    for chave, valor in list(dados.items()):
+        if chave in ('usuarios', 'remetentes'):
+            continue
+        if _persistido['meta'].get(chave) != json.dumps(valor, sort_keys=True):
+            meta[chave] = valor
+    if meta:
+        registro['m'] = meta
+    
+    remetentes = {
+        remetente: nome for remetente, nome in list(dados['remetentes'].items())
+        if _persistido['remetentes'].get(remetente) != nome
+    }
+    for remetente in _persistido['remetentes']:
+        if remetente not in dados['remetentes']:
+            remetentes[remetente] = None
+    if remetentes:
+        registro['r'] = remetentes
+    
+    usuarios = {}
+    for nome in _persistido['usuarios']:
+        if nome not in dados['usuarios']:
+            usuarios[nome] = None
+            assinaturas[nome] = None
+    
+    for nome, usuario in list(dados['usuarios'].items()):
+        anterior = _persistido['usuarios'].get(nome)
+        if (anterior is not None and usuario is anterior['usuario']
+                and nomes is not None and nome not in nomes):
+            continue
+        
+        transacoes = usuario['transacoes']
+        mudanca = {}
+        
+        if anterior is None:
+            # Usuário novo pode estar sendo alterado por outra thread: usa uma cópia
+            transacoes = list(transacoes)
+            mudanca['T'] = transacoes
+        elif transacoes is anterior['lista']:
+            n = anterior['n']
+            if len(transacoes) >= n and (n == 0 or transacoes[n - 1] is anterior['ultima']):
+                if len(transacoes) > n:
+                    mudanca['t'] = transacoes[n:]
+            elif len(transacoes) < n:
+                mudanca['p'] = n - len(transacoes)
+            elif n > 1 and transacoes[n - 2] is anterior['penultima']:
+                # Só a última foi trocada (ex.: categoria corrigida): tira e acrescenta de novo
+                mudanca['p'] = 1
+                mudanca['t'] = transacoes[n - 1:]
+            else:
+                mudanca['T'] = transacoes
+        elif _removida_do_persistido(transacoes, anterior) is not None:
+            # Uma transação tirada do meio (desfazer): só a posição, mais o que veio depois
+            n = anterior['n'] - 1
+            mudanca['x'] = transacoes.posicao
+            if len(transacoes) > n:
+                mudanca['t'] = transacoes[n:]
+        else:
+            mudanca['T'] = transacoes
+        
+        assinatura = _assinatura_usuario(usuario, transacoes)
+        campos = anterior['campos'] if anterior else {}
+        cabecalho = {
+            campo: json.loads(valor) for campo, valor in assinatura['campos'].items()
+            if campos.get(campo) != valor
+        }
+        if cabecalho:
+            mudanca['h'] = cabecalho
+        
+        if mudanca:
+            usuarios[nome] = mudanca
+            assinaturas[nome] = assinatura
+    
+    if usuarios:
+        registro['u'] = usuarios
+    return registro, assinaturas
+
+def _assinatura_arquivos():
+    """Inode, mtime e tamanho do snapshot e do diário, para detectar alterações externas"""
+    assinatura = []
+    for caminho in (DATA_FILE, JOURNAL_FILE):
+        try:
+            info = os.stat(caminho)
+            assinatura.append((caminho, info.st_ino, info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            assinatura.append((caminho, None, None, None))
+    return tuple(assinatura)
+
+def _ler_estado_json():
+    """Monta o estado completo a partir do snapshot + diário.
+    
+    Retorna os dados, a última sequência aplicada, quantos registros do diário
+    foram aplicados e a posição final no diário.
+    """
+    dados = _ler_snapshot()
+    seq = dados.pop('_seq', 0)
+    
+    # Um diário .old só existe durante (ou após uma queda na) compactação
+    antigos, _ = _ler_diario(JOURNAL_FILE + '.old', seq)
+    registros, posicao = _ler_diario(JOURNAL_FILE, seq)
+    for registro in antigos + registros:
+        _aplicar_registro(dados, registro)
+        seq = registro['n']
+    return dados, seq, len(antigos) + len(registros), posicao
+
+def _recarregar(dados):
+    """Relê snapshot + diário e mescla no objeto residente.
+    
+    Usuários que não mudaram no disco são mantidos como estão, preservando
+    alterações em andamento de outras threads (que seguram a trava do usuário).
+    """
+    novo, seq, quantidade, posicao = _ler_estado_json()
+    marcar_contas_alteradas()
+    
+    if not dados:
+        _persistido['usuarios'] = {}
+    usuarios = dados.setdefault('usuarios', {})
+    # Remetentes e usuários criados por um comando em andamento ainda não foram gravados:
+    # continuam residentes para a gravação desse comando levá-los ao diário
+    pendentes = {
+        remetente: nome for remetente, nome in list(dados.get('remetentes', {}).items())
+        if remetente not in _persistido['remetentes'] and remetente not in novo['remetentes']
+    }
+    for chave in list(dados):
+        if chave != 'usuarios' and chave not in novo:
+            del dados[chave]
+    for chave, valor in novo.items():
+        if chave != 'usuarios':
+            dados[chave] = valor
+    dados['remetentes'].update(pendentes)
+    
+    for nome in list(usuarios):
+        if nome not in novo['usuarios'] and nome in _persistido['usuarios']:
+            del usuarios[nome]
+            _persistido['usuarios'].pop(nome, None)
+    for nome, usuario in novo['usuarios'].items():
+        if nome not in usuarios:
+            usuarios[nome] = usuario
+        elif _mesmo_que_persistido(nome, usuario):
+            continue
+        else:
+            usuarios[nome].clear()
+            usuarios[nome].update(usuario)
+        _persistido['usuarios'][nome] = _assinatura_usuario(usuarios[nome])
+    
+    _persistido['seq'] = seq
+    _marcar_meta(dados)
+    for remetente in pendentes:
+        del _persistido['remetentes'][remetente]
+    _diario['registros'] = quantidade
+    return posicao
+
+def _sincronizar():
+    """Traz os dados residentes para o estado do disco (chamar com a trava de armazenamento)"""
+    dados = _cache['dados']
+    assinatura = _assinatura_arquivos()
+    if dados is not None and assinatura == _cache['assinatura']:
+        return dados
+    
+    anterior = _cache['assinatura']
+    if (dados is not None and anterior is not None and assinatura[0] == anterior[0] and assinatura[1][1] == anterior[1][1]
+            and assinatura[1][3] >= _cache['posicao']):
+        # Outro processo só acrescentou registros ao diário: aplica apenas o final
+        registros, posicao = _ler_diario(JOURNAL_FILE, _persistido['seq'], _cache['posicao'])
+        for registro in registros:
+            _aplicar_registro(dados, registro)
+            _marcar_registro(dados, registro)
+        _diario['registros'] += len(registros)
+    else:
+        if dados is None:
+            dados = {}
+        posicao = _recarregar(dados)
+    
+    _cache['dados'] = dados
+    _cache['assinatura'] = _assinatura_arquivos()
+    _cache['posicao'] = posicao
+    return dados
+
+@cronometrar('carregar_dados')
+def carregar_dados():
+    """Retorna os dados residentes em memória.
+    
+    O snapshot e o diário só são lidos (e a estrutura migrada) na primeira
+    chamada; depois, só o que outro processo gravou é reaplicado.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        return _carregar_sqlite()
+    if STORAGE_BACKEND == 'particoes':
+        return _carregar_particoes()
+    
+    with trava('armazenamento'):
+        dados = _sincronizar()
+        pendente = os.path.exists(JOURNAL_FILE + '.old') and not _diario['compactando']
+        if pendente:
+            _diario['compactando'] = True
+    
+    if pendente:
+        _compactar()
+    return dados
+
+def descartar_alteracoes(nome):
+    """Esquece nos dados residentes o que um comando que falhou deixou pela metade no
+    usuário: a próxima leitura volta ao que está gravado (chamar com a trava do usuário)"""
+    if STORAGE_BACKEND == 'sqlite':
+        # _carregar_sqlite já desfaz a transação aberta a cada leitura
+        return
+    if STORAGE_BACKEND == 'particoes':
+        # Só a partição do usuário: o próximo acesso a relê do disco
+        with _particoes['lock']:
+            if _particoes['dados'] is not None:
+                _particoes['dados']['usuarios'].residentes.pop(nome, None)
+            _particoes['usuarios'].pop(nome, None)
+        return
+    with trava('armazenamento'):
+        _cache['dados'] = _cache['assinatura'] = None
+
+def usuario_do_remetente(dados, remetente=None):
+    """Nome do usuário selecionado por quem enviou a mensagem.
+    
+    Sem remetente (endpoint de teste) vale o usuário atual global. O primeiro
+    número a escrever herda esse usuário; os seguintes ganham um usuário próprio.
+    """
+    if not remetente:
+        return dados['usuario_atual']
+    
+    sessoes = dados['remetentes']
+    if remetente not in sessoes:
+        sessoes[remetente] = remetente.replace('whatsapp:', '') if sessoes else dados['usuario_atual']
+    return sessoes[remetente]
+
+def obter_dados_usuario(dados, remetente=None):
+    """Retorna os dados do usuário selecionado pelo remetente"""
+    usuario = usuario_do_remetente(dados, remetente)
+    return dados['usuarios'].setdefault(usuario, novo_usuario())
+
+@cronometrar('salvar_dados')
+def salvar_dados(dados):
+    """Acrescenta ao diário um registro compacto com as alterações (write-through)"""
+    _gravar_razao(dados)
+    if STORAGE_BACKEND == 'sqlite':
+        return _salvar_sqlite(dados)
+    if STORAGE_BACKEND == 'particoes':
+        return _salvar_particoes(dados)
+    
+    with _gravacao_em_andamento(), trava('armazenamento'):
+        # Reaplica antes o que outros processos gravaram, para a sequência seguir global
+        _sincronizar()
+        nomes = {chave[len('usuario:'):] for chave in _chaves_travadas() if chave.startswith('usuario:')}
+        diferenca, assinaturas = _diferenca(dados, nomes or None)
+        if not diferenca:
+            return
+        
+        registro = {'n': _persistido['seq'] + 1, **diferenca}
+        linha = json.dumps(registro, ensure_ascii=False, separators=(',', ':'))
+        with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+            f.write(linha + '\n')
+            posicao = f.tell()
+            if DURABILIDADE == 'sempre':
+                f.flush()
+                os.fsync(f.fileno())
+        _lote['escritos'] += 1
+        escrito = _lote['escritos']
+        
+        _cache['assinatura'] = _assinatura_arquivos()
+        _cache['posicao'] = posicao
+        _marcar_registro(dados, registro, assinaturas)
+        _diario['registros'] += 1
+        if dados is not _cache['dados']:
+            # Os residentes foram descartados (comando que falhou em outra thread) durante
+            # este comando: a próxima leitura relê tudo, já com este registro
+            _cache['dados'] = _cache['assinatura'] = None
+        
+        compactar = _diario['registros'] >= COMPACTAR_APOS and not _diario['compactando']
+        if compactar:
+            _diario['compactando'] = True
+    
+    if compactar:
+        _diario['thread'] = threading.Thread(target=_compactar, daemon=True)
+        _diario['thread'].start()
+    
+    if DURABILIDADE == 'lote':
+        _confirmar_lote(escrito)
+
+@contextmanager
+def _gravacao_em_andamento():
+    """Conta a thread em _lote['gravando'] enquanto ela prepara e acrescenta o registro"""
+    with _lote['condicao']:
+        _lote['gravando'] += 1
+    try:
+        yield
+    finally:
+        with _lote['condicao']:
+            _lote['gravando'] -= 1
+
+def _confirmar_lote(escrito):
+    """Commit em grupo: só retorna depois de um fsync do diário que cubra o registro `escrito`.
+    
+    A primeira thread a chegar vira a líder e faz um único fsync por todas; as demais só
+    esperam. A líder só espera JANELA_LOTE_MS para juntar as gravações seguintes se outras
+    threads estão gravando agora; sozinha, sincroniza na hora.
+    """
+    condicao = _lote['condicao']
+    with condicao:
+        while _lote['sincronizados'] < escrito:
+            if _lote['sincronizando']:
+                condicao.wait()
+                continue
+            
+            _lote['sincronizando'] = True
+            alvo = None
+            juntar = _lote['gravando'] > 0
+            condicao.release()
+            try:
+                if juntar:
+                    time.sleep(JANELA_LOTE_MS / 1000)
+                with trava('armazenamento'):
+                    # Registros de um diário já rotacionado foram sincronizados na rotação
+                    alvo = _lote['escritos']
+                    f = open(JOURNAL_FILE, 'a', encoding='utf-8') if os.path.exists(JOURNAL_FILE) else None
+                if f is not None:
+                    with f:
+                        os.fsync(f.fileno())
+            finally:
+                condicao.acquire()
+                _lote['sincronizando'] = False
+                if alvo is not None:
+                    _lote['sincronizados'] = max(_lote['sincronizados'], alvo)
+                condicao.notify_all()
+
+def _fsync_pasta(caminho):
+    """Garante em disco a troca de nome feita na pasta do arquivo (POSIX)"""
+    if DURABILIDADE == 'os' or os.name != 'posix':
+        return
+    descritor = os.open(os.path.dirname(os.path.abspath(caminho)), os.O_RDONLY)
+    try:
+        os.fsync(descritor)
+    finally:
+        os.close(descritor)
+
+def _compactar():
+    """Grava um novo snapshot e descarta o diário já incorporado a ele"""
+    antigo = JOURNAL_FILE + '.old'
+    
+    try:
+        # Só um processo compacta por vez; os outros seguem gravando no diário
+        with trava('compactacao'):
+            _gravar_snapshot(antigo)
+    finally:
+        _diario['compactando'] = False
+
+def _copia_persistida():
+    """Monta, a partir das assinaturas, o estado exatamente como está no disco.
+    
+    Alterações em andamento de outras threads ficam de fora: elas ainda vão
+    para o diário com sequência maior que a do snapshot.
+    """
+    copia = {chave: json.loads(valor) for chave, valor in _persistido['meta'].items()}
+    copia['remetentes'] = dict(_persistido['remetentes'])
+    copia['usuarios'] = {}
+    for nome, assinatura in _persistido['usuarios'].items():
+        usuario = {campo: json.loads(valor) for campo, valor in assinatura['campos'].items()}
+        lista, n = assinatura['lista'], assinatura['n']
+        if len(lista) >= n and (n == 0 or lista[n - 1] is assinatura['ultima']):
+            usuario['transacoes'] = lista[:n]
+        else:
+            # 'apagar ultima' ou troca de categoria em andamento já mexeu na última transação
+            usuario['transacoes'] = lista[:n - 1] + [assinatura['ultima']]
+        copia['usuarios'][nome] = usuario
+    copia['_seq'] = _persistido['seq']
+    return copia
+
+def _gravar_snapshot(antigo):
+    """Rotaciona o diário, grava o snapshot em arquivo temporário e o troca de lugar"""
+    with trava('armazenamento'):
+        _sincronizar()
+        copia = _copia_persistida()
+        if os.path.exists(JOURNAL_FILE):
+            if os.path.exists(antigo):
+                # Compactação anterior interrompida: junta os dois diários
+                with open(JOURNAL_FILE, 'r', encoding='utf-8') as origem, \
+                        open(antigo, 'a', encoding='utf-8') as destino:
+                    destino.write(origem.read())
+                    if DURABILIDADE != 'os':
+                        destino.flush()
+                        os.fsync(destino.fileno())
+                os.remove(JOURNAL_FILE)
+            else:
+                if DURABILIDADE != 'os':
+                    # O commit em grupo sincroniza só o diário atual: garante o que sai dele
+                    with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                        os.fsync(f.fileno())
+                os.replace(JOURNAL_FILE, antigo)
+        _cache['assinatura'] = _assinatura_arquivos()
+        _cache['posicao'] = 0
+        _diario['registros'] = 0
+    
+    temporario = DATA_FILE + '.tmp'
+    with open(temporario, 'wb') as f:
+        if FORMATO_SNAPSHOT == 'compacto':
+            f.write(codificar_snapshot(copia, COMPRIMIR_SNAPSHOT))
+        else:
+            f.write(json.dumps(copia, indent=2, ensure_ascii=False).encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+    
+    with trava('armazenamento'):
+        # Reaplica o que outros processos gravaram enquanto o snapshot era escrito
+        _sincronizar()
+        os.replace(temporario, DATA_FILE)
+        _fsync_pasta(DATA_FILE)
+        if os.path.exists(antigo):
+            os.remove(antigo)
+        _cache['assinatura'] = _assinatura_arquivos()
+
+def encerrar(espera=30):
+    """Deixa o estado em disco antes de o processo sair.
+    
+    Espera a compactação em andamento, força o diário para o disco e, no
+    SQLite, incorpora o WAL ao banco. Chamado pelo gunicorn ao encerrar cada
+    worker e no fim do servidor de desenvolvimento.
+    """
+    # Responde o que ainda está na fila do modo assíncrono
+    _esvaziar_fila(espera)
+    desligar_agenda(espera)
+    
+    compactacao = _diario['thread']
+    if compactacao is not None and compactacao.is_alive():
+        compactacao.join(espera)
+    
+    if STORAGE_BACKEND == 'sqlite':
+        conexao = getattr(_sqlite, 'conexao', None)
+        if conexao is not None:
+            conexao.close()
+            _sqlite.conexao = None
+        if os.path.exists(SQLITE_FILE):
+            with sqlite3.connect(SQLITE_FILE, timeout=30) as conexao:
+                conexao.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conexao.close()
+    elif os.path.exists(JOURNAL_FILE):
+        with trava('armazenamento'):
+            with open(JOURNAL_FILE, 'a', encoding='utf-8') as f:
+                os.fsync(f.fileno())
+
+# ===== ARMAZENAMENTO SQLITE =====
+
+_ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS remetentes (
+    remetente TEXT PRIMARY KEY,
+    usuario TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usuarios (
+    nome TEXT PRIMARY KEY,
+    cabecalho TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transacoes (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    valor REAL NOT NULL,
+    descricao TEXT,
+    data TEXT,
+    momento TEXT NOT NULL,
+    categoria TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_momento ON transacoes (usuario, momento);
+CREATE INDEX IF NOT EXISTS idx_transacoes_usuario_tipo ON transacoes (usuario, tipo, valor);
+"""
+
+_CAMPOS_TRANSACAO = ('tipo', 'valor', 'descricao', 'data', 'categoria')
+_COLUNAS_TRANSACAO = 'tipo, valor, descricao, data, categoria, extra'
+_INSERT_TRANSACAO = ('INSERT INTO transacoes (usuario, tipo, valor, descricao, data, momento, categoria, extra) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+
+# Uma conexão por thread, reaproveitada entre mensagens
+_sqlite = threading.local()
+
+def _conexao_sqlite():
+    """Retorna a conexão SQLite da thread atual (WAL, esquema criado na primeira vez)"""
+    conexao = getattr(_sqlite, 'conexao', None)
+    if conexao is None or _sqlite.caminho != SQLITE_FILE:
+        conexao = sqlite3.connect(SQLITE_FILE, timeout=30, cached_statements=256)
+        conexao.execute('PRAGMA journal_mode=WAL')
+        # 'sempre': fsync a cada commit; 'lote': no checkpoint do WAL; 'os': nunca
+        conexao.execute('PRAGMA synchronous=' + {'sempre': 'FULL', 'lote': 'NORMAL'}.get(DURABILIDADE, 'OFF'))
+        conexao.executescript(_ESQUEMA_SQLITE)
+        _sqlite.conexao = conexao
+        _sqlite.caminho = SQLITE_FILE
+    return conexao
+
+def _momento(data):
+    """Converte a data '%d/%m/%Y %H:%M' para uma forma ordenável ('%Y-%m-%d %H:%M')"""
+    try:
+        return datetime.strptime(data, '%d/%m/%Y %H:%M').strftime('%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return ''
+
+def _linha_transacao(usuario, transacao):
+    """Parâmetros do INSERT de uma transação; campos fora do padrão vão em extra"""
+    extra = {campo: valor for campo, valor in transacao.items() if campo not in _CAMPOS_TRANSACAO}
+    return (usuario, transacao['tipo'], transacao['valor'], transacao.get('descricao'),
+            transacao.get('data'), _momento(transacao.get('data')), transacao.get('categoria'),
+            json.dumps(extra, ensure_ascii=False) if extra else None)
+
+def _transacao_da_linha(linha):
+    """Converte uma linha do SELECT de volta para o dicionário de transação"""
+    transacao = dict(zip(_CAMPOS_TRANSACAO, linha[:5]))
+    if linha[5]:
+        transacao.update(json.loads(linha[5]))
+    return transacao
+
+class TransacoesSQLite:
+    """Lista de transações de um usuário guardada no SQLite.
+    
+    Imita as operações de lista usadas pelos comandos (append, pop, len,
+    fatias do fim, iteração) sem trazer o histórico inteiro para a memória.
+    As escritas entram na transação aberta da conexão e são confirmadas por
+    salvar_dados.
+    """
+    
+    def __init__(self, conexao, usuario):
+        self.conexao = conexao
+        self.usuario = usuario
+    
+    def __len__(self):
+        return self.conexao.execute(
+            'SELECT COUNT(*) FROM transacoes WHERE usuario = ?', (self.usuario,)
+        ).fetchone()[0]
+    
+    def __bool__(self):
+        return self.conexao.execute(
+            'SELECT EXISTS (SELECT 1 FROM transacoes WHERE usuario = ?)', (self.usuario,)
+        ).fetchone()[0] == 1
+    
+    def _consultar(self, ordem, limite=-1, pular=0):
+        cursor = self.conexao.execute(
+            f'SELECT {_COLUNAS_TRANSACAO} FROM transacoes WHERE usuario = ? '
+            f'ORDER BY momento {ordem}, id {ordem} LIMIT ? OFFSET ?',
+            (self.usuario, limite, pular)
+        )
+        return map(_transacao_da_linha, cursor)
+    
+    def recentes(self, pular, quantidade):
+        """Transações da mais nova para a mais antiga, pulando as `pular` mais novas (LIMIT/OFFSET)"""
+        return list(self._consultar('DESC', quantidade, pular))
+    
+    def __iter__(self):
+        return self._consultar('ASC')
+    
+    def __reversed__(self):
+        return self._consultar('DESC')
+    
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            # Fatia do fim (ex.: [-10:]) vira um LIMIT; as demais carregam a lista
+            if indice.start is not None and indice.start < 0 and indice.stop is None and indice.step is None:
+                return list(self._consultar('DESC', -indice.start))[::-1]
+            return list(self)[indice]
+        if indice < 0:
+            ultimas = list(self._consultar('DESC', -indice))
+            if len(ultimas) < -indice:
+                raise IndexError('índice fora da lista de transações')
+            return ultimas[-1]
+        return list(self)[indice]
+    
+    def append(self, transacao):
+        self.conexao.execute(_INSERT_TRANSACAO, _linha_transacao(self.usuario, transacao))
+    
+    def extend(self, transacoes):
+        # executemany consome o iterável aos poucos: o lote não precisa caber na memória
+        self.conexao.executemany(_INSERT_TRANSACAO, (_linha_transacao(self.usuario, t) for t in transacoes))
+    
+    def quantidade_iguais(self, transacao):
+        """Quantas transações do usuário têm a mesma data, valor e descrição (usa o índice por momento)"""
+        return self.conexao.execute(
+            'SELECT COUNT(*) FROM transacoes WHERE usuario = ? AND momento = ? AND tipo = ? '
+            'AND valor = ? AND descricao = ?',
+            (self.usuario, _momento(transacao['data']), transacao['tipo'], transacao['valor'],
+             transacao['descricao'])
+        ).fetchone()[0]
+    
+    def pop(self):
+        linha = self.conexao.execute(
+            f'SELECT id, {_COLUNAS_TRANSACAO} FROM transacoes WHERE usuario = ? '
+            'ORDER BY momento DESC, id DESC LIMIT 1',
+            (self.usuario,)
+        ).fetchone()
+        if linha is None:
+            raise IndexError('pop de lista de transações vazia')
+        self.conexao.execute('DELETE FROM transacoes WHERE id = ?', (linha[0],))
+        return _transacao_da_linha(linha[1:])
+    
+    def remover(self, posicao):
+        """Tira a transação da posição dada (contada do início), apagando só a linha dela"""
+        linha = self.conexao.execute(
+            f'SELECT id, {_COLUNAS_TRANSACAO} FROM transacoes WHERE usuario = ? '
+            'ORDER BY momento DESC, id DESC LIMIT 1 OFFSET ?',
+            (self.usuario, len(self) - 1 - posicao)
+        ).fetchone()
+        if linha is None or posicao < 0:
+            raise IndexError('índice fora da lista de transações')
+        self.conexao.execute('DELETE FROM transacoes WHERE id = ?', (linha[0],))
+        return _transacao_da_linha(linha[1:])
+    
+    def centavos_por_tipo(self):
+        """(tipo, soma em centavos) de todo o histórico, numa consulta agregada"""
+        return self.conexao.execute(
+            'SELECT tipo, SUM(CAST(ROUND(valor * 100) AS INTEGER)) FROM transacoes '
+            'WHERE usuario = ? GROUP BY tipo',
+            (self.usuario,)
+        ).fetchall()
+    
+    def totais_por_mes(self):
+        """(mês, tipo, categoria, quantidade, soma) via consulta agregada, para recalcular os totais"""
+        return self.conexao.execute(
+            'SELECT substr(momento, 1, 7), tipo, categoria, COUNT(*), '
+            'SUM(CAST(ROUND(valor * 100) AS INTEGER)) / 100.0 FROM transacoes '
+            'WHERE usuario = ? GROUP BY 1, 2, 3',
+            (self.usuario,)
+        ).fetchall()
+
+class UsuariosSQLite(MutableMapping):
+    """Usuários do banco lidos sob demanda: só o cabeçalho de quem é acessado é consultado
+    (pela chave) e decodificado, e a mensagem não paga pelo número de usuários.
+    
+    Guarda o cabeçalho lido de cada um para _salvar_sqlite regravar só os que mudaram.
+    """
+    
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.residentes = {}
+        self.carregados = {}
+        self.removidos = set()
+    
+    def __getitem__(self, nome):
+        usuario = self.residentes.get(nome)
+        if usuario is not None:
+            return usuario
+        if nome in self.removidos:
+            raise KeyError(nome)
+        linha = self.conexao.execute('SELECT cabecalho FROM usuarios WHERE nome = ?', (nome,)).fetchone()
+        if linha is None:
+            raise KeyError(nome)
+        usuario = json.loads(linha[0])
+        self.carregados[nome] = _cabecalho_sqlite(usuario)
+        usuario['transacoes'] = TransacoesSQLite(self.conexao, nome)
+        self.residentes[nome] = usuario
+        return usuario
+    
+    def __setitem__(self, nome, usuario):
+        self.residentes[nome] = usuario
+        self.removidos.discard(nome)
+    
+    def __delitem__(self, nome):
+        self[nome]
+        del self.residentes[nome]
+        self.removidos.add(nome)
+    
+    def __iter__(self):
+        nomes = dict.fromkeys(nome for nome, in self.conexao.execute('SELECT nome FROM usuarios'))
+        nomes.update(dict.fromkeys(self.residentes))
+        return iter([nome for nome in nomes if nome not in self.removidos])
+    
+    def __len__(self):
+        return len(list(iter(self)))
+
+class RemetentesSQLite(MutableMapping):
+    """Mapa remetente -> usuário do banco, consultado pela chave sob demanda; anota os
+    remetentes alterados para _salvar_sqlite gravar só eles"""
+    
+    def __init__(self, conexao):
+        self.conexao = conexao
+        # remetente -> usuário (None: não existe ou foi removido)
+        self.lidos = {}
+        self.alterados = set()
+    
+    def __getitem__(self, remetente):
+        if remetente not in self.lidos:
+            linha = self.conexao.execute(
+                'SELECT usuario FROM remetentes WHERE remetente = ?', (remetente,)
+            ).fetchone()
+            self.lidos[remetente] = linha[0] if linha else None
+        nome = self.lidos[remetente]
+        if nome is None:
+            raise KeyError(remetente)
+        return nome
+    
+    def __setitem__(self, remetente, nome):
+        self.lidos[remetente] = nome
+        self.alterados.add(remetente)
+    
+    def __delitem__(self, remetente):
+        self[remetente]
+        self.lidos[remetente] = None
+        self.alterados.add(remetente)
+    
+    def __iter__(self):
+        remetentes = dict.fromkeys(r for r, in self.conexao.execute('SELECT remetente FROM remetentes'))
+        remetentes.update(dict.fromkeys(self.lidos))
+        return iter([r for r in remetentes if self.lidos.get(r, r) is not None])
+    
+    def __len__(self):
+        return len(list(iter(self)))
+
+def _carregar_sqlite():
+    """Monta os dados a partir do banco: só a meta é lida agora; usuários e remetentes são
+    consultados sob demanda e as transações ficam no banco (TransacoesSQLite)"""
+    conexao = _conexao_sqlite()
+    # Descarta escritas de uma mensagem anterior que não chegou a salvar
+    conexao.rollback()
+    
+    dados = dados_vazios()
+    for chave, valor in conexao.execute('SELECT chave, valor FROM meta'):
+        dados[chave] = json.loads(valor)
+    dados['usuarios'] = UsuariosSQLite(conexao)
+    dados['remetentes'] = RemetentesSQLite(conexao)
+    
+    _sqlite.carregado = {chave: valor for chave, valor in dados.items() if chave not in ('usuarios', 'remetentes')}
+    return dados
+
+def _cabecalho_sqlite(usuario):
+    """Campos do usuário fora as transações, serializados para a tabela usuarios"""
+    return json.dumps(
+        {campo: valor for campo, valor in usuario.items() if campo != 'transacoes'},
+        ensure_ascii=False, sort_keys=True
+    )
+
+def _salvar_sqlite(dados):
+    """Grava no banco só o que mudou desde _carregar_sqlite e confirma a transação.
+    
+    Com usuários e remetentes do banco, só os acessados são comparados; dicionários comuns
+    (zerar) substituem as tabelas.
+    """
+    conexao = _conexao_sqlite()
+    meta = getattr(_sqlite, 'carregado', None) or {}
+    usuarios, remetentes = dados['usuarios'], dados['remetentes']
+    
+    with conexao:
+        for chave, valor in dados.items():
+            if chave not in ('usuarios', 'remetentes') and meta.get(chave) != valor:
+                conexao.execute('INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)',
+                                (chave, json.dumps(valor, ensure_ascii=False)))
+        
+        if isinstance(remetentes, RemetentesSQLite):
+            for remetente in remetentes.alterados:
+                if remetentes.lidos[remetente] is None:
+                    conexao.execute('DELETE FROM remetentes WHERE remetente = ?', (remetente,))
+                else:
+                    conexao.execute('INSERT OR REPLACE INTO remetentes (remetente, usuario) VALUES (?, ?)',
+                                    (remetente, remetentes.lidos[remetente]))
+        else:
+            conexao.execute('DELETE FROM remetentes')
+            conexao.executemany('INSERT INTO remetentes (remetente, usuario) VALUES (?, ?)', list(remetentes.items()))
+        
+        if isinstance(usuarios, UsuariosSQLite):
+            removidos, alterados, carregados = usuarios.removidos, usuarios.residentes, usuarios.carregados
+        else:
+            removidos = {nome for nome, in conexao.execute('SELECT nome FROM usuarios')} - usuarios.keys()
+            alterados, carregados = usuarios, {}
+        for nome in removidos:
+            conexao.execute('DELETE FROM usuarios WHERE nome = ?', (nome,))
+            conexao.execute('DELETE FROM transacoes WHERE usuario = ?', (nome,))
+        
+        cabecalhos = {}
+        for nome, usuario in alterados.items():
+            cabecalhos[nome] = cabecalho = _cabecalho_sqlite(usuario)
+            if carregados.get(nome) != cabecalho:
+                conexao.execute('INSERT OR REPLACE INTO usuarios (nome, cabecalho) VALUES (?, ?)',
+                                (nome, cabecalho))
+            transacoes = usuario['transacoes']
+            if not isinstance(transacoes, TransacoesSQLite) or transacoes.usuario != nome:
+                # Lista substituída (usuário novo, histórico apagado, virada de mês)
+                conexao.execute('DELETE FROM transacoes WHERE usuario = ?', (nome,))
+                conexao.executemany(_INSERT_TRANSACAO, [_linha_transacao(nome, t) for t in transacoes])
+                usuario['transacoes'] = TransacoesSQLite(conexao, nome)
+    
+    _sqlite.carregado = {chave: valor for chave, valor in dados.items() if chave not in ('usuarios', 'remetentes')}
+    if isinstance(remetentes, RemetentesSQLite):
+        remetentes.alterados.clear()
+    if isinstance(usuarios, UsuariosSQLite):
+        usuarios.removidos.clear()
+        usuarios.carregados.update(cabecalhos)
+
+def importar_json_para_sqlite():
+    """Importa para SQLITE_FILE o estado do financas_data.json (+ diário, se houver)"""
+    dados, _, _, _ = _ler_estado_json()
+    conexao = _conexao_sqlite()
+    with conexao:
+        for tabela in ('meta', 'remetentes', 'usuarios', 'transacoes'):
+            conexao.execute(f'DELETE FROM {tabela}')
+        conexao.executemany(
+            'INSERT INTO meta (chave, valor) VALUES (?, ?)',
+            [(chave, json.dumps(valor, ensure_ascii=False)) for chave, valor in dados.items()
+             if chave not in ('usuarios', 'remetentes')]
+        )
+        conexao.executemany('INSERT INTO remetentes (remetente, usuario) VALUES (?, ?)',
+                            list(dados['remetentes'].items()))
+        for nome, usuario in dados['usuarios'].items():
+            conexao.execute('INSERT INTO usuarios (nome, cabecalho) VALUES (?, ?)',
+                            (nome, _cabecalho_sqlite(usuario)))
+            conexao.executemany(_INSERT_TRANSACAO,
+                                (_linha_transacao(nome, t) for t in usuario['transacoes']))
+    return {nome: len(usuario['transacoes']) for nome, usuario in dados['usuarios'].items()}
+
+# ===== ARMAZENAMENTO EM PARTIÇÕES =====
+
+# Estado das partições neste processo: dados residentes, assinatura do índice lido, meta
+# gravada por último e, por usuário, o que já está no disco (assinatura dos arquivos,
+# lista e ponta das transações, cabeçalho e contas fixas serializados, bytes válidos do
+# histórico). 'contas' é até onde o registro de contas fixas alteradas já foi lido.
+_particoes = {'lock': threading.Lock(), 'dados': None, 'assinatura': None, 'meta': None, 'usuarios': {}, 'contas': 0}
+
+class RemetentesParticionados(dict):
+    """Mapa remetente -> usuário que anota as chaves alteradas, para o índice regravar só elas"""
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.alterados = set()
+    
+    def __setitem__(self, remetente, nome):
+        super().__setitem__(remetente, nome)
+        self.alterados.add(remetente)
+    
+    def __delitem__(self, remetente):
+        super().__delitem__(remetente)
+        self.alterados.add(remetente)
+    
+    def pop(self, remetente, *padrao):
+        self.alterados.add(remetente)
+        return super().pop(remetente, *padrao)
+
+class UsuariosParticionados(MutableMapping):
+    """Usuários das partições: os nomes vêm do índice e cada usuário só é lido do disco
+    (cabeçalho + transações) no primeiro acesso; depois fica residente e só é relido se
+    outro processo mudar os arquivos dele.
+    """
+    
+    def __init__(self, nomes=()):
+        self.nomes = dict.fromkeys(nomes)
+        self.residentes = {}
+        self.criados = set()
+        self.removidos = set()
+    
+    def __getitem__(self, nome):
+        if nome not in self.nomes:
+            raise KeyError(nome)
+        usuario = self.residentes.get(nome)
+        persistido = _particoes['usuarios'].get(nome)
+        if usuario is None or (persistido is not None and
+                               _assinatura_particao(nome) != persistido['assinatura']):
+            usuario = self.residentes[nome] = _ler_particao(nome, usuario)
+        return usuario
+    
+    def __setitem__(self, nome, usuario):
+        self.nomes[nome] = None
+        self.residentes[nome] = usuario
+        self.criados.add(nome)
+        self.removidos.discard(nome)
+    
+    def __delitem__(self, nome):
+        del self.nomes[nome]
+        self.residentes.pop(nome, None)
+        self.criados.discard(nome)
+        self.removidos.add(nome)
+    
+    def __contains__(self, nome):
+        return nome in self.nomes
+    
+    def __iter__(self):
+        return iter(list(self.nomes))
+    
+    def __len__(self):
+        return len(self.nomes)
+    
+    def cabecalhos(self):
+        """(nome, cabeçalho) de cada usuário, lendo só o cabeçalho dos que não estão residentes"""
+        for nome in list(self.nomes):
+            if nome in self.residentes:
+                yield nome, self[nome]
+                continue
+            try:
+                with open(os.path.join(_pasta_particao(nome), 'cabecalho.json'), encoding='utf-8') as f:
+                    yield nome, json.load(f)
+            except FileNotFoundError:
+                continue
+
+def cabecalhos_usuarios(dados):
+    """(nome, dados do usuário) de todos os usuários para saldos e contas fixas; nas
+    partições, só os cabeçalhos (sem ler o histórico de quem não está residente)"""
+    usuarios = dados['usuarios']
+    if isinstance(usuarios, UsuariosParticionados):
+        return list(usuarios.cabecalhos())
+    return list(usuarios.items())
+
+def _pasta_particao(nome):
+    """Pasta da partição de um usuário (nome escapado para o sistema de arquivos)"""
+    return os.path.join(PARTICOES_DIR, quote(nome, safe=''))
+
+def _assinatura_particao(nome):
+    """Inode, mtime e tamanho do cabeçalho e do histórico de um usuário"""
+    pasta = _pasta_particao(nome)
+    assinatura = []
+    for arquivo in ('cabecalho.json', 'transacoes.jsonl'):
+        try:
+            info = os.stat(os.path.join(pasta, arquivo))
+            assinatura.append((info.st_ino, info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            assinatura.append(None)
+    return tuple(assinatura)
+
+def _ler_linhas_transacoes(caminho, inicio=0):
+    """Transações do histórico a partir do byte inicio e a posição final válida.
+    
+    Uma última linha incompleta (queda durante a escrita) fica de fora; a próxima
+    gravação escreve por cima dela.
+    """
+    try:
+        with open(caminho, 'rb') as f:
+            f.seek(inicio)
+            bloco = f.read()
+    except FileNotFoundError:
+        return [], 0
+    fim = bloco.rfind(b'\n') + 1
+    return [json.loads(linha) for linha in bloco[:fim].splitlines()], inicio + fim
+
+def _ler_particao(nome, usuario=None):
+    """Lê (ou relê, no próprio objeto residente) a partição de um usuário.
+    
+    Se outro processo só acrescentou transações, lê apenas o final do histórico.
+    """
+    pasta = _pasta_particao(nome)
+    assinatura = _assinatura_particao(nome)
+    anterior = _particoes['usuarios'].get(nome)
+    try:
+        with open(os.path.join(pasta, 'cabecalho.json'), encoding='utf-8') as f:
+            cabecalho = json.load(f)
+    except FileNotFoundError:
+        cabecalho = {campo: valor for campo, valor in novo_usuario().items() if campo != 'transacoes'}
+    
+    caminho = os.path.join(pasta, 'transacoes.jsonl')
+    historico = assinatura[1]
+    if (usuario is not None and anterior is not None and anterior['assinatura'][1] is not None
+            and historico is not None and historico[0] == anterior['assinatura'][1][0]
+            and historico[2] >= anterior['posicao'] and usuario.get('transacoes') is anterior['lista']
+            and len(anterior['lista']) == anterior['n'] and _ultima_confere(caminho, anterior)):
+        transacoes = anterior['lista']
+        novas, posicao = _ler_linhas_transacoes(caminho, anterior['posicao'])
+        transacoes.extend(novas)
+    else:
+        transacoes, posicao = _ler_linhas_transacoes(caminho)
+    
+    if usuario is None:
+        usuario = {}
+    usuario.clear()
+    usuario.update(cabecalho)
+    usuario['transacoes'] = transacoes
+    _particoes['usuarios'][nome] = {
+        'assinatura': assinatura,
+        'lista': transacoes,
+        'n': len(transacoes),
+        'ultima': transacoes[-1] if transacoes else None,
+        'penultima': transacoes[-2] if len(transacoes) > 1 else None,
+        'cabecalho': json.dumps(cabecalho, ensure_ascii=False, sort_keys=True),
+        'contas': json.dumps(cabecalho.get('contas_fixas', []), ensure_ascii=False, sort_keys=True),
+        'posicao': posicao,
+    }
+    return usuario
+
+def _inicio_das_ultimas(caminho, fim, quantidade):
+    """Byte onde começam as `quantidade` últimas linhas antes de fim (lendo de trás para frente)"""
+    corte = fim
+    with open(caminho, 'rb') as f:
+        for _ in range(quantidade):
+            busca = corte - 1
+            while True:
+                inicio = max(0, busca - 4096)
+                f.seek(inicio)
+                quebra = f.read(busca - inicio).rfind(b'\n')
+                if quebra >= 0:
+                    corte = inicio + quebra + 1
+                    break
+                if inicio == 0:
+                    corte = 0
+                    break
+                busca = inicio
+    return corte
+
+def _ultima_confere(caminho, anterior):
+    """Indica se a linha que termina na posição gravada ainda é a última transação conhecida
+    (outro processo pode ter desfeito ou trocado a última antes de acrescentar outras)"""
+    if not anterior['n']:
+        return True
+    inicio = _inicio_das_ultimas(caminho, anterior['posicao'], 1)
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        linha = f.read(anterior['posicao'] - inicio)
+    return linha == _linhas_json([anterior['ultima']])
+
+def _linhas_json(transacoes):
+    """Transações no formato do histórico: um JSON compacto por linha"""
+    return b''.join(
+        json.dumps(t, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n' for t in transacoes
+    )
+
+def _gravar_particao(nome, usuario):
+    """Grava só o que mudou na partição do usuário (chamar com a trava dele).
+    
+    Transações novas são acrescentadas ao fim do histórico e as desfeitas são cortadas
+    dele (a última trocada é cortada e acrescentada de novo; uma tirada do meio, cortada
+    com as seguintes, que voltam); o histórico só é reescrito se a lista foi substituída. O cabeçalho (saldos,
+    contas fixas, totais) é regravado inteiro, e só se mudou.
+    """
+    pasta = _pasta_particao(nome)
+    os.makedirs(pasta, exist_ok=True)
+    anterior = _particoes['usuarios'].get(nome)
+    sincronizar = DURABILIDADE != 'os'
+    caminho = os.path.join(pasta, 'transacoes.jsonl')
+    transacoes = usuario['transacoes']
+    n = anterior['n'] if anterior else 0
+    
+    # Quantas transações do histórico gravado continuam valendo
+    mantidas = None
+    if anterior is not None and transacoes is anterior['lista']:
+        if len(transacoes) >= n and (n == 0 or transacoes[n - 1] is anterior['ultima']):
+            mantidas = n
+        elif len(transacoes) < n:
+            mantidas = len(transacoes)
+        elif n > 1 and transacoes[n - 2] is anterior['penultima']:
+            mantidas = n - 1
+    elif anterior is not None and _removida_do_persistido(transacoes, anterior) is not None:
+        # Uma transação tirada do meio (desfazer): reescreve só dela em diante
+        mantidas = transacoes.posicao
+    
+    if mantidas is not None:
+        posicao = anterior['posicao']
+        if mantidas < n:
+            posicao = _inicio_das_ultimas(caminho, posicao, n - mantidas)
+        if len(transacoes) > mantidas or posicao != anterior['posicao']:
+            with open(caminho, 'r+b' if os.path.exists(caminho) else 'wb') as f:
+                # Grava a partir do fim válido: uma linha incompleta de uma queda é sobrescrita
+                f.seek(posicao)
+                f.write(_linhas_json(transacoes[mantidas:]))
+                posicao = f.tell()
+                f.truncate()
+                if sincronizar:
+                    os.fsync(f.fileno())
+    else:
+        # Lista substituída (usuário novo, histórico apagado, virada de mês)
+        temporario = caminho + '.tmp'
+        with open(temporario, 'wb') as f:
+            f.write(_linhas_json(transacoes))
+            posicao = f.tell()
+            if sincronizar:
+                os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    
+    cabecalho = {campo: valor for campo, valor in usuario.items() if campo != 'transacoes'}
+    texto = json.dumps(cabecalho, ensure_ascii=False, sort_keys=True)
+    contas = json.dumps(cabecalho.get('contas_fixas', []), ensure_ascii=False, sort_keys=True)
+    if anterior is None or texto != anterior['cabecalho']:
+        _gravar_json_atomico(os.path.join(pasta, 'cabecalho.json'), cabecalho, sincronizar)
+    if anterior is None or contas != anterior['contas']:
+        # A agenda de outros processos reindexa este usuário
+        with open(os.path.join(PARTICOES_DIR, 'contas.log'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(nome, ensure_ascii=False) + '\n')
+    
+    _particoes['usuarios'][nome] = {
+        'assinatura': _assinatura_particao(nome),
+        'lista': transacoes,
+        'n': len(transacoes),
+        'ultima': transacoes[-1] if transacoes else None,
+        'penultima': transacoes[-2] if len(transacoes) > 1 else None,
+        'cabecalho': texto,
+        'contas': contas,
+        'posicao': posicao,
+    }
+
+def _meta_particoes(dados):
+    """Campos globais (fora usuários e remetentes)"""
+    return {chave: valor for chave, valor in dados.items() if chave not in ('usuarios', 'remetentes')}
+
+def _ler_indice():
+    """Índice das partições: meta, remetentes e nomes dos usuários (None se ainda não existe)"""
+    try:
+        with open(os.path.join(PARTICOES_DIR, 'indice.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _assinatura_indice():
+    try:
+        info = os.stat(os.path.join(PARTICOES_DIR, 'indice.json'))
+        return (info.st_ino, info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        return None
+
+def _mesclar_indice(dados, indice):
+    """Traz para os dados residentes o que outros processos gravaram no índice, sem perder
+    os remetentes e usuários criados aqui e ainda não gravados"""
+    dados.update(indice['meta'])
+    remetentes = dados['remetentes']
+    locais = {r: remetentes[r] for r in remetentes.alterados if r in remetentes}
+    removidos = {r for r in remetentes.alterados if r not in remetentes}
+    dict.clear(remetentes)
+    dict.update(remetentes, indice['remetentes'])
+    dict.update(remetentes, locais)
+    for remetente in removidos:
+        dict.pop(remetente, None)
+    
+    usuarios = dados['usuarios']
+    nomes = dict.fromkeys(n for n in indice['usuarios'] if n not in usuarios.removidos)
+    nomes.update(dict.fromkeys(usuarios.criados))
+    for nome in list(usuarios.residentes):
+        if nome not in nomes:
+            del usuarios.residentes[nome]
+            _particoes['usuarios'].pop(nome, None)
+    usuarios.nomes = nomes
+    _particoes['meta'] = json.dumps(indice['meta'], sort_keys=True)
+
+def _carregar_particoes():
+    """Dados das partições: só o índice é relido, e só quando outro processo o mudou"""
+    with _particoes['lock']:
+        dados = _particoes['dados']
+        assinatura = _assinatura_indice()
+        if dados is not None and assinatura == _particoes['assinatura']:
+            return dados
+        indice = _ler_indice() or {'meta': _meta_particoes(dados_vazios()), 'remetentes': {}, 'usuarios': []}
+        if dados is None:
+            dados = {'usuarios': UsuariosParticionados(), 'remetentes': RemetentesParticionados()}
+        _mesclar_indice(dados, indice)
+        _particoes['dados'] = dados
+        _particoes['assinatura'] = assinatura
+    return dados
+
+def _gravar_indice(dados):
+    """Regrava o índice com o que mudou aqui (remetentes, usuários criados/removidos, meta),
+    por cima do que outros processos já gravaram nele"""
+    usuarios, remetentes = dados['usuarios'], dados['remetentes']
+    with trava('indice'), _particoes['lock']:
+        indice = _ler_indice() or {'meta': {}, 'remetentes': {}, 'usuarios': []}
+        alterados = set(remetentes.alterados)
+        for remetente in alterados:
+            if remetente in remetentes:
+                indice['remetentes'][remetente] = remetentes[remetente]
+            else:
+                indice['remetentes'].pop(remetente, None)
+        criados, removidos = set(usuarios.criados), set(usuarios.removidos)
+        existentes = set(indice['usuarios'])
+        indice['usuarios'] = [n for n in indice['usuarios'] if n not in removidos]
+        indice['usuarios'] += [n for n in usuarios.nomes if n in criados and n not in existentes]
+        indice['meta'] = _meta_particoes(dados)
+        os.makedirs(PARTICOES_DIR, exist_ok=True)
+        _gravar_json_atomico(os.path.join(PARTICOES_DIR, 'indice.json'), indice, DURABILIDADE != 'os')
+        remetentes.alterados -= alterados
+        usuarios.criados -= criados
+        usuarios.removidos -= removidos
+        _mesclar_indice(dados, indice)
+        _particoes['assinatura'] = _assinatura_indice()
+
+def _substituir_particoes(dados):
+    """Regrava todas as partições a partir de dados com dicionários comuns (zerar, importação)"""
+    with trava('indice'):
+        if os.path.isdir(PARTICOES_DIR):
+            for entrada in os.listdir(PARTICOES_DIR):
+                caminho = os.path.join(PARTICOES_DIR, entrada)
+                if os.path.isdir(caminho):
+                    shutil.rmtree(caminho, ignore_errors=True)
+        _particoes['usuarios'].clear()
+        usuarios = UsuariosParticionados()
+        for nome, usuario in dados['usuarios'].items():
+            _gravar_particao(nome, usuario)
+            usuarios.nomes[nome] = None
+            usuarios.residentes[nome] = usuario
+        remetentes = RemetentesParticionados(dados['remetentes'])
+        dados['usuarios'], dados['remetentes'] = usuarios, remetentes
+        os.makedirs(PARTICOES_DIR, exist_ok=True)
+        indice = {'meta': _meta_particoes(dados), 'remetentes': dict(remetentes), 'usuarios': list(usuarios.nomes)}
+        _gravar_json_atomico(os.path.join(PARTICOES_DIR, 'indice.json'), indice, DURABILIDADE != 'os')
+        with _particoes['lock']:
+            _particoes['dados'] = dados
+            _particoes['assinatura'] = _assinatura_indice()
+            _particoes['meta'] = json.dumps(indice['meta'], sort_keys=True)
+        # Todas as contas fixas mudaram: recomeça o registro (a agenda de cada processo reindexa tudo)
+        with open(os.path.join(PARTICOES_DIR, 'contas.log'), 'w', encoding='utf-8'):
+            pass
+    marcar_contas_alteradas()
+
+def _salvar_particoes(dados):
+    """Grava as partições dos usuários travados pela thread (ou de todos os residentes, sem
+    trava) e, se mudou, o índice. Nada de outros usuários é lido ou regravado."""
+    usuarios = dados['usuarios']
+    if not isinstance(usuarios, UsuariosParticionados) or not isinstance(dados['remetentes'], RemetentesParticionados):
+        _substituir_particoes(dados)
+        return
+    
+    nomes = {chave[len('usuario:'):] for chave in _chaves_travadas() if chave.startswith('usuario:')}
+    for nome in (nomes | usuarios.criados) if nomes else list(usuarios.residentes):
+        usuario = usuarios.residentes.get(nome)
+        if usuario is not None:
+            _gravar_particao(nome, usuario)
+    for nome in list(usuarios.removidos):
+        shutil.rmtree(_pasta_particao(nome), ignore_errors=True)
+        _particoes['usuarios'].pop(nome, None)
+    
+    if (dados['remetentes'].alterados or usuarios.criados or usuarios.removidos
+            or json.dumps(_meta_particoes(dados), sort_keys=True) != _particoes['meta']):
+        _gravar_indice(dados)
+
+def contas_alteradas_particoes():
+    """Usuários cujas contas fixas mudaram desde a última leitura do registro de alterações.
+    
+    None se o registro foi recomeçado (partições substituídas): aí tudo mudou.
+    """
+    caminho = os.path.join(PARTICOES_DIR, 'contas.log')
+    try:
+        tamanho = os.path.getsize(caminho)
+    except FileNotFoundError:
+        return set()
+    if tamanho < _particoes['contas']:
+        _particoes['contas'] = 0
+        return None
+    with open(caminho, 'rb') as f:
+        f.seek(_particoes['contas'])
+        bloco = f.read(tamanho - _particoes['contas'])
+    fim = bloco.rfind(b'\n') + 1
+    _particoes['contas'] += fim
+    return {json.loads(linha) for linha in bloco[:fim].splitlines()}
+
+def importar_json_para_particoes():
+    """Grava em PARTICOES_DIR o estado do financas_data.json (+ diário, se houver)"""
+    dados, _, _, _ = _ler_estado_json()
+    for usuario in dados['usuarios'].values():
+        totais_do_usuario(usuario)
+        saldos_iniciais(usuario)
+    quantidades = {nome: len(usuario['transacoes']) for nome, usuario in dados['usuarios'].items()}
+    _substituir_particoes(dados)
+    return quantidades
+
+# ===== DINHEIRO =====
+
+# Os valores continuam gravados em reais (compatível com os dados existentes), sempre com no
+# máximo duas casas: toda conta é feita em centavos inteiros, então não acumula erro de float
+_NUMERO_DIGITADO = re.compile(r'([+-]?)(\d*)(?:\.(\d*))?')
+
+def centavos(valor):
+    """Reais -> centavos inteiros (12.34 -> 1234)"""
+    return round(valor * 100)
+
+def reais(quantia):
+    """Centavos inteiros -> reais (1234 -> 12.34)"""
+    return quantia / 100
+
+def ler_centavos(numero):
+    """Texto com ponto decimal -> centavos, sem passar por float ("12.345" -> 1235)"""
+    encontrado = _NUMERO_DIGITADO.fullmatch(numero.strip())
+    if not encontrado or not (encontrado[2] or encontrado[3]):
+        raise ValueError(f'valor inválido: {numero!r}')
+    sinal, inteiro, fracao = encontrado[1], encontrado[2] or '0', encontrado[3] or ''
+    quantia = int(inteiro) * 100 + int((fracao + '00')[:2])
+    # Terceira casa em diante: arredonda para o centavo mais próximo
+    if fracao[2:3] >= '5':
+        quantia += 1
+    return -quantia if sinal == '-' else quantia
+
+def ler_valor(texto):
+    """Valor digitado num comando direto ("50", "12,5") -> reais com duas casas"""
+    quantia = ler_centavos(texto.replace(',', '.'))
+    # "0,001" arredonda para zero: lançaria um R$ 0.00
+    if not quantia:
+        raise ValueError(f'valor zerado: {texto!r}')
+    return reais(quantia)
+
+def aplicar_efeito(saldos, transacao, sinal=1):
+    """Aplica (sinal 1) ou desfaz (sinal -1) nos saldos o efeito de uma transação"""
+    if transacao['tipo'] in _EFEITO_TIPO:
+        campo, sinal_tipo = _EFEITO_TIPO[transacao['tipo']]
+        saldos[campo] = reais(centavos(saldos[campo]) + sinal * sinal_tipo * centavos(transacao['valor']))
+
+def efeitos_do_historico(transacoes):
+    """Efeito somado de todas as transações em cada saldo, em centavos ({'saldo', 'vr', 'va'})"""
+    if isinstance(transacoes, TransacoesSQLite):
+        somas = dict(transacoes.centavos_por_tipo())
+    else:
+        # Uma passada só, somando centavos inteiros por tipo
+        somas = dict.fromkeys(_EFEITO_TIPO, 0)
+        for tipo, valor in zip(map(itemgetter('tipo'), transacoes), map(itemgetter('valor'), transacoes)):
+            if tipo in somas:
+                somas[tipo] += round(valor * 100)
+    efeitos = {'saldo': 0, 'vr': 0, 'va': 0}
+    for tipo, (campo, sinal) in _EFEITO_TIPO.items():
+        efeitos[campo] += sinal * somas.get(tipo, 0)
+    return efeitos
+
+def saldos_iniciais(usuario_dados):
+    """Saldos antes da primeira transação do histórico ativo.
+    
+    Para dados antigos, que não os têm, são deduzidos dos saldos atuais e dos
+    totais (os saldos de agora são tomados como certos).
+    """
+    if 'saldos_iniciais' not in usuario_dados:
+        efeitos = {'saldo': 0, 'vr': 0, 'va': 0}
+        for contadores in totais_do_usuario(usuario_dados).values():
+            for tipo, (_, soma) in contadores['tipo'].items():
+                if tipo in _EFEITO_TIPO:
+                    campo, sinal = _EFEITO_TIPO[tipo]
+                    efeitos[campo] += sinal * centavos(soma)
+        usuario_dados['saldos_iniciais'] = {
+            campo: reais(centavos(usuario_dados[campo]) - efeitos[campo]) for campo in efeitos
+        }
+    return usuario_dados['saldos_iniciais']
+
+def verificar_saldos(dados, corrigir=False):
+    """Confere os saldos guardados com saldos iniciais + efeito do histórico, em lote.
+    
+    Retorna a lista de divergências (usuário, campo, esperado, guardado); com
+    corrigir=True os saldos divergentes recebem o valor recalculado.
+    """
+    divergencias = []
+    for nome, usuario in list(dados['usuarios'].items()):
+        iniciais = saldos_iniciais(usuario)
+        efeitos = efeitos_do_historico(usuario['transacoes'])
+        corretos = {}
+        for campo, efeito in efeitos.items():
+            esperado = centavos(iniciais[campo]) + efeito
+            corretos[campo] = reais(esperado)
+            if esperado != centavos(usuario[campo]) or usuario[campo] != reais(esperado):
+                divergencias.append((nome, campo, reais(esperado), usuario[campo]))
+        if corrigir and any(d[0] == nome for d in divergencias):
+            registrar_evento(usuario, 'saldos', saldos=corretos)
+            usuario.update(corretos)
+    return divergencias
+
+# ===== TOTAIS INCREMENTAIS =====
+
+def _mes_da_data(data):
+    """'%d/%m/%Y %H:%M' -> '%Y-%m' ('' se a data não estiver nesse formato)"""
+    if isinstance(data, str) and len(data) >= 10 and data[2] == '/' and data[5] == '/':
+        return f'{data[6:10]}-{data[3:5]}'
+    return ''
+
+# Grupos dos totais de cada mês: por tipo, por categoria e por categoria só dos gastos
+GRUPOS_TOTAIS = ('tipo', 'categoria', 'gastos')
+
+def _acumular(totais, mes, tipo, categoria, quantidade, soma):
+    """Soma quantidade/valor no contador do mês por tipo e por categoria (remove os zerados)"""
+    contadores = totais.setdefault(mes, {grupo: {} for grupo in GRUPOS_TOTAIS})
+    grupos = [('tipo', tipo), ('categoria', categoria or '')]
+    if 'gasto' in tipo:
+        grupos.append(('gastos', categoria or ''))
+    for grupo, chave in grupos:
+        anterior = contadores[grupo].get(chave, (0, 0))
+        if anterior[0] + quantidade:
+            contadores[grupo][chave] = [anterior[0] + quantidade, reais(centavos(anterior[1]) + centavos(soma))]
+        else:
+            contadores[grupo].pop(chave, None)
+    if not contadores['tipo']:
+        del totais[mes]
+
+def recalcular_totais(transacoes):
+    """Reconstrói os totais por mês/tipo/categoria a partir do histórico"""
+    totais = {}
+    if isinstance(transacoes, TransacoesSQLite):
+        for mes, tipo, categoria, quantidade, soma in transacoes.totais_por_mes():
+            _acumular(totais, mes, tipo, categoria, quantidade, soma)
+        return totais
+    for t in transacoes:
+        _acumular(totais, _mes_da_data(t.get('data')), t['tipo'], t.get('categoria'), 1, t['valor'])
+    return totais
+
+def totais_do_usuario(usuario_dados):
+    """Totais mantidos junto do usuário; calculados uma vez para dados antigos que não os têm
+    (ou que ainda não têm os totais dos gastos por categoria)"""
+    totais = usuario_dados.get('totais')
+    if totais is None or any('gastos' not in contadores for contadores in totais.values()):
+        usuario_dados['totais'] = recalcular_totais(usuario_dados['transacoes'])
+    return usuario_dados['totais']
+
+def contabilizar(usuario_dados, transacao, sinal=1):
+    """Atualiza os totais com uma transação incluída (sinal 1) ou removida (sinal -1)"""
+    _acumular(totais_do_usuario(usuario_dados), _mes_da_data(transacao.get('data')),
+              transacao['tipo'], transacao.get('categoria'), sinal, sinal * transacao['valor'])
+
+def limpar_transacoes(usuario_dados):
+    """Apaga o histórico do usuário junto com os totais (os saldos atuais viram os iniciais)"""
+    usuario_dados['transacoes'] = []
+    usuario_dados['totais'] = {}
+    usuario_dados['saldos_iniciais'] = {campo: usuario_dados[campo] for campo in ('saldo', 'vr', 'va')}
+
+def totais_por_tipo(usuario_dados, mes=None):
+    """Quantidade e soma por tipo de transação ({tipo: (quantidade, soma)}), sem varrer o histórico"""
+    totais = {}
+    for mes_totais, contadores in list(totais_do_usuario(usuario_dados).items()):
+        if mes is not None and mes_totais != mes:
+            continue
+        for tipo, (quantidade, soma) in contadores['tipo'].items():
+            anterior = totais.get(tipo, (0, 0))
+            totais[tipo] = (anterior[0] + quantidade, reais(centavos(anterior[1]) + centavos(soma)))
+    return totais
+
+def totais_por_categoria(usuario_dados, mes=None):
+    """Quantidade e soma dos gastos por categoria ({categoria: (quantidade, soma)}), sem varrer o histórico"""
+    totais = {}
+    for mes_totais, contadores in list(totais_do_usuario(usuario_dados).items()):
+        if mes is not None and mes_totais != mes:
+            continue
+        for categoria, (quantidade, soma) in contadores['gastos'].items():
+            anterior = totais.get(categoria, (0, 0))
+            totais[categoria] = (anterior[0] + quantidade, reais(centavos(anterior[1]) + centavos(soma)))
+    return totais
+
+def quantidade_transacoes(usuario_dados):
+    """Quantidade de transações do usuário, pelos totais (sem contar a lista)"""
+    return sum(quantidade for quantidade, _ in totais_por_tipo(usuario_dados).values())
+
+def verificar_totais(dados, corrigir=False):
+    """Compara os totais guardados com os recalculados do histórico.
+    
+    Retorna a lista de divergências (usuário, mês, grupo, chave, esperado, guardado);
+    com corrigir=True substitui os totais divergentes pelos recalculados.
+    """
+    divergencias = []
+    for nome, usuario in list(dados['usuarios'].items()):
+        esperado = recalcular_totais(usuario['transacoes'])
+        guardado = usuario.get('totais', {})
+        for mes in sorted(esperado.keys() | guardado.keys()):
+            for grupo in GRUPOS_TOTAIS:
+                contadores_esperados = esperado.get(mes, {}).get(grupo, {})
+                contadores_guardados = guardado.get(mes, {}).get(grupo, {})
+                for chave in sorted(contadores_esperados.keys() | contadores_guardados.keys()):
+                    certo = contadores_esperados.get(chave, [0, 0])
+                    atual = contadores_guardados.get(chave, [0, 0])
+                    if certo[0] != atual[0] or centavos(certo[1]) != centavos(atual[1]):
+                        divergencias.append((nome, mes, grupo, chave, tuple(certo), tuple(atual)))
+        if corrigir and any(d[0] == nome for d in divergencias):
+            usuario['totais'] = esperado
+    return divergencias
+
+# ===== LIVRO-RAZÃO =====
+
+# Cada usuário tem em RAZAO_DIR/<nome>/eventos.jsonl um evento por linha, só acrescentados:
+#   lancamento / estorno: transações que entraram / saíram do histórico (efeito + / -)
+#   ajuste: efeito somado nos saldos (ex.: extrato importado)
+#   saldos: saldos absolutos (abertura do razão, 'limpar tudo', correção)
+# e em instantaneos.jsonl os saldos depois de cada RAZAO_INTERVALO eventos, com a posição
+# do evento seguinte. O cabeçalho do usuário guarda em 'razao' o que já está gravado
+# (seq, bytes dos dois arquivos e os saldos pelo razão): o que passar disso é resto de
+# uma queda e é sobrescrito. 'limpar tudo' e 'zerar' não apagam o razão.
+# Instantâneos lidos de cada usuário: nome -> {'inode', 'lidos': bytes, 'momentos': [...], 'lista': [...]}
+_razao = {'lock': threading.Lock(), 'instantaneos': OrderedDict()}
+
+def _eventos_pendentes():
+    """Eventos desta thread ainda não gravados: [(usuário, evento)]; salvar_dados os grava"""
+    if not hasattr(_travadas, 'eventos'):
+        _travadas.eventos = []
+    return _travadas.eventos
+
+def registrar_evento(usuario_dados, evento, **campos):
+    """Anota um evento do razão (chamar antes de mexer nos saldos).
+    
+    No primeiro evento de um usuário sem razão, anota antes a abertura com os saldos atuais.
+    """
+    pendentes = _eventos_pendentes()
+    agora = datetime.now().strftime('%d/%m/%Y %H:%M')
+    if 'razao' not in usuario_dados:
+        usuario_dados['razao'] = {'seq': 0, 'posicao': None, 'instantaneos': None, 'saldos': None}
+        pendentes.append((usuario_dados, {'em': agora, 'evento': 'saldos', 'saldos': {
+            campo: usuario_dados[campo] for campo in ('saldo', 'vr', 'va')}}))
+    pendentes.append((usuario_dados, {'em': agora, 'evento': evento, **campos}))
+
+def _aplicar_evento(saldos, evento):
+    """Aplica um evento do razão nos saldos em centavos ({'saldo', 'vr', 'va'})"""
+    tipo = evento['evento']
+    if tipo == 'saldos':
+        for campo, valor in evento['saldos'].items():
+            saldos[campo] = centavos(valor)
+    elif tipo == 'ajuste':
+        for campo, valor in evento['efeitos'].items():
+            saldos[campo] += centavos(valor)
+    else:
+        sinal = 1 if tipo == 'lancamento' else -1
+        for t in evento['transacoes']:
+            campo, efeito = _EFEITO_TIPO[t['tipo']]
+            saldos[campo] += sinal * efeito * centavos(t['valor'])
+
+def _pasta_razao(nome):
+    """Pasta do razão de um usuário (nome escapado para o sistema de arquivos)"""
+    return os.path.join(RAZAO_DIR, quote(nome, safe=''))
+
+def _fim_valido(caminho):
+    """(byte depois da última linha completa, seq dessa linha) de um arquivo do razão"""
+    try:
+        tamanho = os.path.getsize(caminho)
+    except FileNotFoundError:
+        return 0, 0
+    if not tamanho:
+        return 0, 0
+    with open(caminho, 'rb') as f:
+        f.seek(tamanho - 1)
+        # Uma linha incompleta no fim (queda durante a escrita) fica de fora
+        fim = tamanho if f.read(1) == b'\n' else _inicio_das_ultimas(caminho, tamanho, 1)
+        if not fim:
+            return 0, 0
+        inicio = _inicio_das_ultimas(caminho, fim, 1)
+        f.seek(inicio)
+        return fim, json.loads(f.read(fim - inicio))['seq']
+
+def _acrescentar(caminho, posicao, conteudo):
+    """Grava o conteudo (função da posição de início) em posicao, cortando o que vier depois; retorna o fim"""
+    with open(caminho, 'r+b' if os.path.exists(caminho) else 'wb') as f:
+        f.seek(posicao)
+        f.write(conteudo(posicao))
+        fim = f.tell()
+        f.truncate()
+        if DURABILIDADE == 'sempre':
+            os.fsync(f.fileno())
+    return fim
+
+def _gravar_eventos(nome, usuario, eventos):
+    """Acrescenta os eventos ao razão do usuário e, a cada RAZAO_INTERVALO, um instantâneo"""
+    razao = usuario['razao']
+    pasta = _pasta_razao(nome)
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, 'eventos.jsonl')
+    caminho_instantaneos = os.path.join(pasta, 'instantaneos.jsonl')
+    
+    confirmada = razao['posicao']
+    if confirmada is None or not os.path.exists(caminho) or confirmada > os.path.getsize(caminho):
+        if confirmada is not None:
+            # O razão perdeu o fim numa queda (DURABILIDADE != 'sempre'): recomeça dos saldos
+            # confirmados, sem os instantâneos, que podem apontar para eventos perdidos
+            eventos.insert(0, {'em': eventos[0]['em'], 'evento': 'saldos', 'saldos': razao['saldos']})
+            if os.path.exists(caminho_instantaneos):
+                os.remove(caminho_instantaneos)
+            razao['instantaneos'] = 0
+        # Razão novo ou de um usuário de mesmo nome apagado antes: continua depois do último evento
+        confirmada, razao['seq'] = _fim_valido(caminho)
+    if razao['instantaneos'] is None:
+        razao['instantaneos'] = _fim_valido(caminho_instantaneos)[0]
+    
+    saldos = {campo: centavos(valor) for campo, valor in (razao['saldos'] or {}).items()}
+    instantaneos = []
+    
+    def linhas(inicio):
+        # Numera e aplica os eventos conforme a posição em que serão gravados
+        blocos = []
+        posicao = inicio
+        for evento in eventos:
+            razao['seq'] += 1
+            bloco = json.dumps({'seq': razao['seq'], **evento}, ensure_ascii=False,
+                               separators=(',', ':')).encode('utf-8') + b'\n'
+            blocos.append(bloco)
+            posicao += len(bloco)
+            _aplicar_evento(saldos, evento)
+            if RAZAO_INTERVALO and razao['seq'] % RAZAO_INTERVALO == 0:
+                instantaneos.append({'seq': razao['seq'], 'em': evento['em'], 'posicao': posicao,
+                                     'saldos': {campo: reais(valor) for campo, valor in saldos.items()}})
+        return b''.join(blocos)
+    
+    razao['posicao'] = _acrescentar(caminho, confirmada, linhas)
+    razao['saldos'] = {campo: reais(valor) for campo, valor in saldos.items()}
+    if instantaneos:
+        conteudo = b''.join(json.dumps(i, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                            for i in instantaneos)
+        razao['instantaneos'] = _acrescentar(caminho_instantaneos, razao['instantaneos'], lambda inicio: conteudo)
+
+def _gravar_razao(dados):
+    """Grava no razão os eventos anotados por esta thread (antes dos dados, que guardam até onde foi)"""
+    pendentes = _eventos_pendentes()
+    if not pendentes:
+        return
+    _travadas.eventos = []
+    por_usuario = {}
+    for usuario, evento in pendentes:
+        por_usuario.setdefault(id(usuario), (usuario, []))[1].append(evento)
+    
+    nomes = [chave[len('usuario:'):] for chave in _chaves_travadas() if chave.startswith('usuario:')]
+    for nome in nomes:
+        usuario = dados['usuarios'].get(nome)
+        if usuario is not None and id(usuario) in por_usuario:
+            _gravar_eventos(nome, *por_usuario.pop(id(usuario)))
+    if por_usuario:
+        # Sem a trava do usuário (linha de comando): procura o nome entre todos
+        for nome, usuario in list(dados['usuarios'].items()):
+            if id(usuario) in por_usuario:
+                _gravar_eventos(nome, *por_usuario.pop(id(usuario)))
+
+def _ler_eventos(nome, inicio, fim):
+    """Eventos do razão gravados entre os bytes inicio e fim"""
+    with open(os.path.join(_pasta_razao(nome), 'eventos.jsonl'), 'rb') as f:
+        f.seek(inicio)
+        while f.tell() < fim:
+            yield json.loads(f.readline())
+
+def _instantaneos(nome, razao):
+    """(momentos, instantâneos) confirmados do razão do usuário, lendo só os novos desde a última vez"""
+    caminho = os.path.join(_pasta_razao(nome), 'instantaneos.jsonl')
+    try:
+        inode = os.stat(caminho).st_ino
+    except FileNotFoundError:
+        inode = None
+    with _razao['lock']:
+        cache = _razao['instantaneos'].pop(nome, None)
+        limite = razao['instantaneos'] or 0
+        if cache is None or cache['inode'] != inode or cache['lidos'] > limite:
+            cache = {'inode': inode, 'lidos': 0, 'momentos': [], 'lista': []}
+        if cache['lidos'] < limite:
+            with open(caminho, 'rb') as f:
+                f.seek(cache['lidos'])
+                for linha in f.read(limite - cache['lidos']).splitlines():
+                    instantaneo = json.loads(linha)
+                    cache['momentos'].append(minuto_da_data(instantaneo['em']))
+                    cache['lista'].append(instantaneo)
+            cache['lidos'] = limite
+        _razao['instantaneos'][nome] = cache
+        while len(_razao['instantaneos']) > INDICE_USUARIOS:
+            _razao['instantaneos'].popitem(last=False)
+        return cache['momentos'], cache['lista']
+
+def saldos_em(nome, usuario_dados, minuto):
+    """Saldos pelo razão depois do último evento registrado até `minuto` (minutos de minuto_da_data).
+    
+    Parte do último instantâneo anterior e reaplica no máximo RAZAO_INTERVALO eventos.
+    Retorna (saldos em reais, eventos reaplicados), ou (None, 0) se não há evento até lá.
+    """
+    razao = usuario_dados.get('razao')
+    if not razao or razao['posicao'] is None:
+        return None, 0
+    momentos, lista = _instantaneos(nome, razao)
+    i = bisect_right(momentos, minuto)
+    if i:
+        saldos = {campo: centavos(valor) for campo, valor in lista[i - 1]['saldos'].items()}
+        inicio = lista[i - 1]['posicao']
+    else:
+        saldos, inicio = None, 0
+    
+    reaplicados = 0
+    for evento in _ler_eventos(nome, inicio, razao['posicao']):
+        if minuto_da_data(evento['em']) > minuto:
+            break
+        if saldos is None:
+            saldos = {'saldo': 0, 'vr': 0, 'va': 0}
+        _aplicar_evento(saldos, evento)
+        reaplicados += 1
+    if saldos is None:
+        return None, 0
+    return {campo: reais(valor) for campo, valor in saldos.items()}, reaplicados
+
+def verificar_razao(dados):
+    """Refaz os saldos de cada usuário a partir do razão inteiro e compara com os guardados.
+    
+    Retorna a lista de divergências (usuário, campo, pelo razão, guardado).
+    """
+    divergencias = []
+    for nome, usuario in list(dados['usuarios'].items()):
+        razao = usuario.get('razao')
+        if not razao or razao['posicao'] is None:
+            continue
+        saldos = {'saldo': 0, 'vr': 0, 'va': 0}
+        for evento in _ler_eventos(nome, 0, razao['posicao']):
+            _aplicar_evento(saldos, evento)
+        for campo, valor in saldos.items():
+            if valor != centavos(usuario[campo]) or valor != centavos(razao['saldos'][campo]):
+                divergencias.append((nome, campo, reais(valor), usuario[campo]))
+    return divergencias
+
+# ===== ARQUIVO MENSAL =====
+
+def _pasta_arquivo(nome):
+    """Pasta com os meses fechados de um usuário (nome escapado para o sistema de arquivos)"""
+    return os.path.join(ARCHIVE_DIR, quote(nome, safe=''))
+
+def _gravar_json_atomico(caminho, conteudo, sincronizar=True):
+    """Grava o JSON em arquivo temporário e o troca de lugar (nunca fica pela metade)"""
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f, ensure_ascii=False)
+        if sincronizar:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+def _ler_json(caminho, padrao=None):
+    """Conteúdo do arquivo JSON, ou padrao se ele não existir"""
+    if not os.path.exists(caminho):
+        return padrao
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def meses_arquivados(nome):
+    """Meses fechados ('%Y-%m') do usuário, em ordem"""
+    pasta = _pasta_arquivo(nome)
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(arquivo[:-len('.resumo.json')] for arquivo in os.listdir(pasta)
+                  if arquivo.endswith('.resumo.json'))
+
+def resumo_arquivado(nome, mes):
+    """Resumo pré-calculado de um mês fechado (saldos no fim do mês e totais), ou None"""
+    return _ler_json(os.path.join(_pasta_arquivo(nome), f'{mes}.resumo.json'))
+
+def transacoes_arquivadas(nome, mes):
+    """Transações de um mês fechado"""
+    return _ler_json(os.path.join(_pasta_arquivo(nome), f'{mes}.json'), {'transacoes': []})['transacoes']
+
+def arquivar_meses_fechados(nome, usuario_dados, mes_atual=None):
+    """Move as transações dos meses anteriores a mes_atual para o arquivo do usuário.
+    
+    Cada mês fechado vira uma partição com as transações e outra com o resumo
+    (saldos no fim do mês e totais), gravadas antes de tirar as transações dos
+    dados ativos. Retorna os meses arquivados; quem chama salva os dados.
+    """
+    mes_atual = mes_atual or datetime.now().strftime('%Y-%m')
+    totais = totais_do_usuario(usuario_dados)
+    fechados = sorted(mes for mes in totais if mes and mes < mes_atual)
+    if not fechados:
+        return []
+    
+    por_mes = {mes: [] for mes in fechados}
+    restantes = []
+    for t in usuario_dados['transacoes']:
+        por_mes.get(_mes_da_data(t.get('data')), restantes).append(t)
+    
+    # Saldos no fim de cada mês: volta dos saldos atuais desfazendo as transações posteriores
+    saldos = {campo: usuario_dados[campo] for campo in ('saldo', 'vr', 'va')}
+    for t in restantes:
+        if _mes_da_data(t.get('data')):
+            aplicar_efeito(saldos, t, -1)
+    saldos_no_fim = {}
+    for mes in reversed(fechados):
+        saldos_no_fim[mes] = dict(saldos)
+        for t in por_mes[mes]:
+            aplicar_efeito(saldos, t, -1)
+    
+    pasta = _pasta_arquivo(nome)
+    os.makedirs(pasta, exist_ok=True)
+    for mes in fechados:
+        caminho = os.path.join(pasta, f'{mes}.json')
+        transacoes = por_mes[mes]
+        anteriores = _ler_json(caminho, {'transacoes': []})['transacoes']
+        if anteriores:
+            # Mês já arquivado (ex.: queda entre arquivar e salvar): junta sem repetir
+            vistas = {json.dumps(t, sort_keys=True) for t in anteriores}
+            transacoes = anteriores + [t for t in transacoes if json.dumps(t, sort_keys=True) not in vistas]
+        _gravar_json_atomico(caminho, {'usuario': nome, 'mes': mes, 'transacoes': transacoes})
+        _gravar_json_atomico(os.path.join(pasta, f'{mes}.resumo.json'), {
+            'usuario': nome,
+            'mes': mes,
+            'saldos': saldos_no_fim[mes],
+            'totais': recalcular_totais(transacoes).get(mes, {grupo: {} for grupo in GRUPOS_TOTAIS})
+        })
+    
+    # O que sai do histórico ativo passa a fazer parte dos saldos iniciais
+    iniciais = saldos_iniciais(usuario_dados)
+    for mes in fechados:
+        for t in por_mes[mes]:
+            aplicar_efeito(iniciais, t)
+    
+    usuario_dados['transacoes'] = restantes
+    for mes in fechados:
+        del totais[mes]
+    return fechados
+
+def apagar_arquivo(nome=None):
+    """Remove os meses arquivados de um usuário (ou de todos, sem nome)"""
+    pasta = _pasta_arquivo(nome) if nome is not None else ARCHIVE_DIR
+    if os.path.isdir(pasta):
+        shutil.rmtree(pasta)
+
+def _mes_do_texto(texto):
+    """'2026-09', '09/2026' ou '9/2026' -> '2026-09' (None se não for um mês)"""
+    texto = texto.strip()
+    partes = texto.split('-') if '-' in texto else texto.split('/')[::-1]
+    if len(partes) != 2 or not all(p.isdigit() for p in partes):
+        return None
+    ano, mes = int(partes[0]), int(partes[1])
+    if ano < 1000 or not 1 <= mes <= 12:
+        return None
+    return f'{ano:04d}-{mes:02d}'
+
+# Valor em formato brasileiro ("1.234,56", "30,50", "30.50", "1,5 mil") com marcadores
+# de moeda opcionais, ou palavra descartada da descrição. Uma única varredura por mensagem.
+_TOKEN_MENSAGEM = re.compile(r'''
+    (?<![\w.,])
+    (?P<valor>
+        (?P<prefixo>r\$\s*)?
+        (?P<numero>\d{1,3}(?:\.\d{3})+(?:,\d+)?|\d+(?:[,.]\d+)?)
+        (?:\s*(?P<mil>mil)\b)?
+        (?:\s*(?P<sufixo>reais|real|r\$))?
+    )(?!\w)
+    |\b(?:gastei|usei|paguei|comprei|recebi|foi|de|no|na|em|com|reais|real)\b
+    |r\$
+''', re.IGNORECASE | re.VERBOSE)
+
+def _converter_valor(numero, mil=False):
+    """Converte o número no formato brasileiro para reais ("1.234,56" -> 1234.56)"""
+    if ',' in numero:
+        numero = numero.replace('.', '').replace(',', '.')
+    elif numero.count('.') > 1 or (numero.count('.') == 1 and len(numero.split('.')[1]) == 3):
+        # Ponto como separador de milhar ("1.234", "10.000")
+        numero = numero.replace('.', '')
+    if mil:
+        # "1,5 mil": desloca o ponto três casas antes de arredondar para o centavo
+        inteiro, _, fracao = numero.partition('.')
+        numero = f"{inteiro}{(fracao + '000')[:3]}.{fracao[3:]}"
+    return reais(ler_centavos(numero))
+
+@cronometrar('extrair_valor')
+def extrair_valor_e_descricao(texto):
+    """Extrai valor e descrição de uma mensagem em linguagem natural.
+    
+    Com vários números, prefere o primeiro marcado como dinheiro (R$, reais, mil);
+    os demais ficam na descrição ("comprei 2 pães por R$ 5" -> 5, "2 pães por").
+    """
+    valor = None
+    escolhido = None
+    descartes = []
+    for token in _TOKEN_MENSAGEM.finditer(texto):
+        if token.lastgroup is None:
+            descartes.append(token.span())
+        elif escolhido is None or not escolhido[2]:
+            prefixo, numero, mil, sufixo = token.group('prefixo', 'numero', 'mil', 'sufixo')
+            marcado = bool(prefixo or sufixo or mil)
+            if escolhido is None or marcado:
+                valor = _converter_valor(numero, mil is not None)
+                escolhido = (token.start(), token.end(), marcado)
+    
+    if not valor:
+        return None, None
+    
+    # Descrição: o texto sem o valor escolhido e sem as palavras comuns
+    descartes.append(escolhido[:2])
+    partes = []
+    posicao = 0
+    for inicio, fim in sorted(descartes):
+        partes.append(texto[posicao:inicio])
+        posicao = fim
+    partes.append(texto[posicao:])
+    descricao = ' '.join(' '.join(partes).split()).replace(' ,', ',').strip(' ,.;:-+')
+    
+    return valor, descricao if descricao else 'Sem descrição'
+
+# ===== DESPACHO DE COMANDOS =====
+
+# Comandos acionados pela mensagem exata: texto -> função
+_COMANDOS_EXATOS = {}
+# Árvores de prefixos (letra -> nó; a chave None guarda a função do comando).
+# 'sistema' é consultada antes da linguagem natural e 'direto' depois, como sempre foi.
+_PREFIXOS = {'sistema': {}, 'direto': {}}
+
+def comando(*textos):
+    """Registra uma função como o comando acionado pelas mensagens exatas em textos"""
+    def registrar(funcao):
+        for texto in textos:
+            _COMANDOS_EXATOS[texto] = funcao
+        return funcao
+    return registrar
+
+def prefixo(*prefixos, etapa='sistema'):
+    """Registra uma função como o comando das mensagens que começam com um dos prefixos"""
+    def registrar(funcao):
+        for texto in prefixos:
+            no = _PREFIXOS[etapa]
+            for letra in texto:
+                no = no.setdefault(letra, {})
+            no[None] = funcao
+        return funcao
+    return registrar
+
+def _buscar_prefixo(etapa, msg):
+    """Retorna (função, tamanho do prefixo) do prefixo registrado que casa com msg"""
+    no = _PREFIXOS[etapa]
+    encontrado = None
+    for posicao, letra in enumerate(msg, 1):
+        no = no.get(letra)
+        if no is None:
+            break
+        if None in no:
+            encontrado = (no[None], posicao)
+    return encontrado
+
+# Palavras-chave da linguagem natural, por grupo. A detecção é por substring,
+# como sempre foi ('va' também casa dentro de 'vale alimentação').
+_PALAVRAS_CHAVE = {
+    'gasto': ['gastei', 'paguei', 'comprei', 'saiu'],
+    'nao_gasto': ['vr', 'vale refeição', 'va', 'vale alimentação'],
+    'vr': ['vr', 'vale refeição', 'vale refeicao', 'vale-refeição'],
+    'va': ['va', 'vale alimentação', 'vale alimentacao', 'vale-alimentação'],
+    'credito': ['creditaram', 'creditou', 'caiu', 'recebi', 'chegou', '+'],
+    'entrada': ['recebi', 'caiu', 'entrou', 'ganhei', 'salário', 'salario'],
+}
+
+def _compilar_palavras_chave():
+    """Monta uma única regex com todas as palavras-chave e o mapa palavra -> grupos.
+    
+    A regex é um lookahead, então acha ocorrências sobrepostas; cada palavra
+    também leva os grupos das palavras que ela contém ('vale refeição' contém 'va').
+    """
+    palavras = sorted({p for lista in _PALAVRAS_CHAVE.values() for p in lista}, key=len, reverse=True)
+    grupos = {
+        palavra: frozenset(grupo for grupo, lista in _PALAVRAS_CHAVE.items()
+                           if any(p in palavra for p in lista))
+        for palavra in palavras
+    }
+    regex = re.compile('(?=(' + '|'.join(re.escape(p) for p in palavras) + '))')
+    return regex, grupos
+
+_REGEX_PALAVRAS_CHAVE, _GRUPOS_PALAVRA = _compilar_palavras_chave()
+
+def grupos_palavras_chave(msg):
+    """Grupos de palavras-chave presentes na mensagem, numa única varredura"""
+    grupos = set()
+    for palavra in _REGEX_PALAVRAS_CHAVE.findall(msg):
+        grupos |= _GRUPOS_PALAVRA[palavra]
+    return grupos
+
+# Efeito de cada tipo de transação nos saldos: (campo, sinal)
+_EFEITO_TIPO = {
+    'entrada': ('saldo', 1),
+    'gasto': ('saldo', -1),
+    'credito_vr': ('vr', 1),
+    'gasto_vr': ('vr', -1),
+    'credito_va': ('va', 1),
+    'gasto_va': ('va', -1),
+}
+
+def registrar_transacao(usuario_dados, tipo, valor, descricao, categoria):
+    """Aplica a transação no saldo correspondente e a acrescenta ao histórico"""
+    # Garante os totais (dados antigos) antes de mexer no histórico
+    totais_do_usuario(usuario_dados)
+    transacao = {
+        'tipo': tipo,
+        'valor': reais(centavos(valor)),
+        'descricao': descricao,
+        'data': datetime.now().strftime('%d/%m/%Y %H:%M'),
+        'categoria': categoria
+    }
+    registrar_evento(usuario_dados, 'lancamento', transacoes=[transacao])
+    aplicar_efeito(usuario_dados, transacao)
+    usuario_dados['transacoes'].append(transacao)
+    contabilizar(usuario_dados, transacao)
+    return transacao
+
+def registrar_lote(usuario_dados, lancamentos):
+    """Registra vários lançamentos (tipo, valor, descrição) de uma vez, com a mesma data.
+    
+    O histórico recebe todos num único extend (um registro no diário, um executemany no SQLite).
+    """
+    totais_do_usuario(usuario_dados)
+    data = datetime.now().strftime('%d/%m/%Y %H:%M')
+    novas = [{
+        'tipo': tipo,
+        'valor': reais(centavos(valor)),
+        'descricao': descricao,
+        'data': data,
+        'categoria': categorizar(usuario_dados, tipo, descricao)
+    } for tipo, valor, descricao in lancamentos]
+    registrar_evento(usuario_dados, 'lancamento', transacoes=novas)
+    for transacao in novas:
+        aplicar_efeito(usuario_dados, transacao)
+        contabilizar(usuario_dados, transacao)
+    usuario_dados['transacoes'].extend(novas)
+    return novas
+
+def _estornar(usuario_dados, transacoes):
+    """Reverte nos saldos e totais transações já tiradas do histórico, com um estorno no razão.
+    
+    Um pagamento de conta fixa desfeito volta a deixar a conta em aberto no mês dele.
+    """
+    registrar_evento(usuario_dados, 'estorno', transacoes=transacoes)
+    for transacao in transacoes:
+        contabilizar(usuario_dados, transacao, -1)
+        aplicar_efeito(usuario_dados, transacao, -1)
+        if transacao.get('categoria') == 'conta_fixa':
+            _reabrir_conta_fixa(usuario_dados, transacao)
+
+def _reabrir_conta_fixa(usuario_dados, transacao):
+    """Marca como não paga, no mês do pagamento desfeito, a conta fixa que ele quitou"""
+    mes = _mes_da_data(transacao.get('data'))
+    descricao = transacao['descricao'].removeprefix('[CONTA FIXA] ')
+    for conta in usuario_dados['contas_fixas']:
+        if conta['descricao'] == descricao and conta.get('pago_ate') == mes:
+            ano, numero = int(mes[:4]), int(mes[5:])
+            conta['pago_ate'] = f'{ano - 1}-12' if numero == 1 else f'{ano}-{numero - 1:02d}'
+            return
+
+def desfazer_ultimas_transacoes(usuario_dados, quantidade=1):
+    """Remove as `quantidade` últimas transações do histórico e reverte o efeito delas; retorna-as
+    (a mais recente primeiro)"""
+    totais_do_usuario(usuario_dados)
+    transacoes = usuario_dados['transacoes']
+    desfeitas = [transacoes.pop() for _ in range(min(quantidade, len(transacoes)))]
+    _estornar(usuario_dados, desfeitas)
+    return desfeitas
+
+def desfazer_ultima_transacao(usuario_dados):
+    """Remove a última transação do histórico e reverte o efeito dela no saldo"""
+    return desfazer_ultimas_transacoes(usuario_dados)[0]
+
+def desfazer_transacao(usuario_dados, posicao):
+    """Remove a transação na posição dada do histórico (de qualquer ponto) e reverte o efeito dela.
+    
+    No SQLite apaga só a linha dela; nos outros armazenamentos o histórico vira um
+    HistoricoSemUma, de que o diário grava só a posição e a partição só o que vem depois.
+    """
+    totais_do_usuario(usuario_dados)
+    transacoes = usuario_dados['transacoes']
+    if isinstance(transacoes, TransacoesSQLite):
+        desfeita = transacoes.remover(posicao)
+    else:
+        desfeita = transacoes[posicao]
+        usuario_dados['transacoes'] = HistoricoSemUma(transacoes, posicao)
+    _estornar(usuario_dados, [desfeita])
+    return desfeita
+
+def processar_mensagem(mensagem, remetente=None, sid=None):
+    """Processa a mensagem e retorna a resposta.
+    
+    Mensagens do mesmo remetente são processadas em ordem; as de remetentes
+    diferentes só disputam a trava do usuário que selecionaram. Com o `sid`
+    (MessageSid do Twilio), uma entrega repetida devolve a resposta já dada.
+    """
+    return processar_entrega(mensagem, remetente, sid)[0]
+
+@cronometrar('processar_mensagem')
+def processar_entrega(mensagem, remetente=None, sid=None):
+    """Como processar_mensagem, mas retorna (resposta, repetida).
+    
+    A consulta e o registro do `sid` acontecem dentro da trava do remetente:
+    uma repetição que chega enquanto a original ainda grava espera por ela
+    (também em outro processo) e recebe a mesma resposta.
+    """
+    with trava(f'remetente:{remetente}'):
+        if sid:
+            resposta = resposta_registrada(sid)
+            if resposta is not None:
+                contar_comando('repetida')
+                return resposta, True
+        nome_atual = usuario_do_remetente(carregar_dados(), remetente)
+        with trava(f'usuario:{nome_atual}'):
+            try:
+                # Recarrega já com a trava, caso outro processo tenha alterado o usuário
+                resposta = _processar_comando(carregar_dados(), mensagem, remetente)
+            except Exception:
+                # Nada do comando que falhou fica na memória para a próxima gravação levar ao disco,
+                # nem os eventos do razão que ele anotou
+                descartar_alteracoes(nome_atual)
+                _travadas.eventos = []
+                raise
+        if sid:
+            registrar_resposta(sid, resposta)
+        return resposta, False
+
+def _processar_comando(dados, mensagem, remetente):
+    """Interpreta a mensagem sobre os dados do usuário selecionado pelo remetente.
+    
+    Ordem de despacho: lote de lançamentos (mensagem com várias linhas), comando exato
+    (dicionário), prefixos de sistema, linguagem natural (uma regex de palavras-chave) e
+    prefixos de comandos diretos.
+    """
+    msg = mensagem.lower().strip()
+    
+    # Verificar se mudou de mês
+    mes_atual = datetime.now().strftime('%Y-%m')
+    if dados['mes_atual'] != mes_atual:
+        dados['mes_atual'] = mes_atual
+    
+    ctx = {
+        'dados': dados,
+        'remetente': remetente,
+        'nome_atual': usuario_do_remetente(dados, remetente),
+        'usuario_dados': obter_dados_usuario(dados, remetente),
+        'msg': msg,
+        'msg_original': mensagem.strip(),
+        'resto': ''
+    }
+    
+    # Meses fechados do usuário vão para o arquivo; os dados ativos ficam só com o mês atual
+    if arquivar_meses_fechados(ctx['nome_atual'], ctx['usuario_dados'], mes_atual):
+        salvar_dados(dados)
+    
+    inicio = time.perf_counter()
+    if '\n' in msg:
+        # Várias linhas de lançamentos: um lote só, aplicado inteiro ou recusado inteiro
+        resposta = _executar(cmd_lote, ctx, inicio)
+        if resposta:
+            return resposta
+    
+    funcao = _COMANDOS_EXATOS.get(msg)
+    if funcao:
+        return _executar(funcao, ctx, inicio)
+    
+    encontrado = _buscar_prefixo('sistema', msg)
+    if encontrado:
+        funcao, tamanho = encontrado
+        ctx['resto'] = msg[tamanho:]
+        return _executar(funcao, ctx, inicio)
+    
+    resposta = _executar(_linguagem_natural, ctx, inicio)
+    if resposta:
+        return resposta
+    
+    encontrado = _buscar_prefixo('direto', msg)
+    if encontrado:
+        funcao, tamanho = encontrado
+        ctx['resto'] = msg[tamanho:]
+        return _executar(funcao, ctx, inicio)
+    
+    observar('despacho', time.perf_counter() - inicio)
+    contar_comando('desconhecido')
+    return "❓ Comando não reconhecido.\nEnvie *ajuda* para ver os comandos disponíveis."
+
+def _executar(funcao, ctx, inicio):
+    """Roda o comando, medindo o despacho (de inicio até aqui) e o próprio comando"""
+    escolhido = time.perf_counter()
+    resposta = funcao(ctx)
+    if resposta is not None:
+        observar('despacho', escolhido - inicio)
+        observar('comando', time.perf_counter() - escolhido)
+        contar_comando(funcao.__name__.replace('cmd_', '').lstrip('_'))
+    return resposta
+
+# ===== COMANDOS DE SISTEMA =====
+
+# Comando: TROCAR USUÁRIO
+@prefixo('usuario ', 'usuário ', 'mudar para ')
+def cmd_trocar_usuario(ctx):
+    dados = ctx['dados']
+    nome_usuario = ctx['resto'].strip().title()
+    
+    if not nome_usuario:
+        return "❌ Digite o nome do usuário!\nEx: usuario Maria"
+    
+    if ctx['remetente']:
+        dados['remetentes'][ctx['remetente']] = nome_usuario
+    else:
+        dados['usuario_atual'] = nome_usuario
+    
+    if nome_usuario not in dados['usuarios']:
+        dados['usuarios'].setdefault(nome_usuario, novo_usuario())
+        salvar_dados(dados)
+        return f"✅ Usuário *{nome_usuario}* criado e selecionado!\n\n💡 Agora todas as transações serão registradas para {nome_usuario}."
+    
+    salvar_dados(dados)
+    usuario_dados = dados['usuarios'][nome_usuario]
+    return f"✅ Usuário alterado para *{nome_usuario}*\n\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}\n🍽️ VR: R$ {usuario_dados['vr']:.2f}\n🛒 VA: R$ {usuario_dados['va']:.2f}"
+
+# Comando: VER USUÁRIO ATUAL
+@comando('usuario', 'usuário', 'qual usuario', 'quem sou')
+def cmd_usuario_atual(ctx):
+    return f"👤 Usuário atual: *{ctx['nome_atual']}*\n\n💡 Para trocar: usuario [nome]\nEx: usuario Maria"
+
+# Comando: LISTAR USUÁRIOS
+@comando('usuarios', 'usuários', 'listar usuarios', 'ver usuarios')
+def cmd_listar_usuarios(ctx):
+    lista = "👥 *USUÁRIOS CADASTRADOS:*\n\n"
+    # Só os cabeçalhos: o histórico dos outros usuários não é lido
+    for nome, info in cabecalhos_usuarios(ctx['dados']):
+        atual = "✅" if nome == ctx['nome_atual'] else "  "
+        lista += f"{atual} *{nome}*\n"
+        lista += f"   💰 Saldo: R$ {info['saldo']:.2f}\n"
+        lista += f"   🍽️ VR: R$ {info['vr']:.2f}\n"
+        lista += f"   🛒 VA: R$ {info['va']:.2f}\n\n"
+    lista += "💡 Para trocar: usuario [nome]"
+    return lista
+
+# Comando: APAGAR HISTÓRICO
+@comando('apagar historico', 'apagar histórico', 'limpar historico', 'limpar histórico', 'deletar historico')
+def cmd_apagar_historico(ctx):
+    usuario_dados = ctx['usuario_dados']
+    limpar_transacoes(usuario_dados)
+    salvar_dados(ctx['dados'])
+    return f"🗑️ Histórico de transações apagado!\n\n💡 Seus saldos foram mantidos:\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}\n🍽️ VR: R$ {usuario_dados['vr']:.2f}\n🛒 VA: R$ {usuario_dados['va']:.2f}"
+
+# Comando: ADICIONAR CONTA FIXA
+@prefixo('conta fixa ', 'pagamento fixo ')
+def cmd_adicionar_conta_fixa(ctx):
+    try:
+        partes = ctx['resto'].split(' ', 2)
+        valor = ler_valor(partes[0])
+        dia = int(partes[1])
+        descricao = partes[2] if len(partes) > 2 else 'Conta fixa'
+        
+        if dia < 1 or dia > 31:
+            return "❌ Dia inválido! Use um dia entre 1 e 31."
+        
+        vencimento = proximo_vencimento(dia, relogio_agenda())
+        conta = {
+            'valor': valor,
+            'dia': dia,
+            'descricao': descricao,
+            'vencimento': vencimento.isoformat(),
+            'remetente': ctx['remetente']
+        }
+        
+        # A lista fica em ordem de dia: a numeração da listagem é a do 'pagar conta N'
+        insort(ctx['usuario_dados']['contas_fixas'], conta, key=itemgetter('dia'))
+        salvar_dados(ctx['dados'])
+        agendar_conta(ctx['nome_atual'], conta)
+        
+        return f"✅ Conta fixa cadastrada!\n💳 R$ {valor:.2f}\n📅 Todo dia {dia} (próximo: {vencimento.strftime('%d/%m/%Y')})\n📝 {descricao}\n\n💡 Use 'contas fixas' para ver todas"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\n\nUse: conta fixa [valor] [dia] [descrição]\nEx: conta fixa 150 10 aluguel"
+
+# Comando: LISTAR CONTAS FIXAS
+@comando('contas fixas', 'pagamentos fixos', 'ver contas', 'contas')
+def cmd_listar_contas_fixas(ctx):
+    usuario_dados = ctx['usuario_dados']
+    if not usuario_dados['contas_fixas']:
+        return "📋 Nenhuma conta fixa cadastrada.\n\n💡 Cadastre: conta fixa [valor] [dia] [descrição]\nEx: conta fixa 150 10 aluguel"
+    
+    contas = usuario_dados['contas_fixas']
+    if any(anterior['dia'] > conta['dia'] for anterior, conta in zip(contas, contas[1:])):
+        # Dados antigos, cadastrados fora de ordem: ordena uma vez e grava
+        contas.sort(key=itemgetter('dia'))
+        salvar_dados(ctx['dados'])
+    
+    total = sum(c['valor'] for c in contas)
+    lista = "💳 *CONTAS FIXAS DO MÊS*\n\n"
+    mes = relogio_agenda().strftime('%Y-%m')
+    
+    for i, conta in enumerate(contas, 1):
+        paga = " ✅ paga" if conta.get('pago_ate', '') >= mes else ""
+        lista += f"{i}. 📅 Dia {conta['dia']}{paga}\n"
+        lista += f"   💰 R$ {conta['valor']:.2f}\n"
+        lista += f"   📝 {conta['descricao']}\n\n"
+    
+    lista += f"📊 *Total mensal:* R$ {total:.2f}"
+    return lista
+
+# Comando: REMOVER CONTA FIXA
+@prefixo('remover conta ', 'deletar conta ')
+def cmd_remover_conta_fixa(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        numero = int(ctx['msg'].split()[-1])
+        if numero < 1 or numero > len(usuario_dados['contas_fixas']):
+            return f"❌ Conta #{numero} não encontrada!\nUse 'contas fixas' para ver a lista."
+        
+        conta_removida = usuario_dados['contas_fixas'].pop(numero - 1)
+        salvar_dados(ctx['dados'])
+        
+        return f"🗑️ Conta fixa removida!\n💳 R$ {conta_removida['valor']:.2f}\n📝 {conta_removida['descricao']}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: remover conta [número]\nEx: remover conta 1"
+
+# Comando: PAGAR CONTA FIXA
+@prefixo('pagar conta ', 'paguei conta ')
+def cmd_pagar_conta_fixa(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        numero = int(ctx['msg'].split()[-1])
+        if numero < 1 or numero > len(usuario_dados['contas_fixas']):
+            return f"❌ Conta #{numero} não encontrada!"
+        
+        conta = usuario_dados['contas_fixas'][numero - 1]
+        
+        registrar_transacao(usuario_dados, 'gasto', conta['valor'], f"[CONTA FIXA] {conta['descricao']}", 'conta_fixa')
+        # A agenda não lança nem lembra de novo a conta deste mês
+        conta['pago_ate'] = relogio_agenda().strftime('%Y-%m')
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ Pagamento registrado!\n💳 R$ {conta['valor']:.2f}\n📝 {conta['descricao']}\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: pagar conta [número]\nEx: pagar conta 1"
+
+# ===== CATEGORIAS =====
+
+# Categorias dos gastos: chave -> (emoji, nome). As quatro últimas são as de antes da
+# categorização automática: 'geral', 'vr' e 'va' ficam para o que nenhuma regra reconhece.
+CATEGORIAS = {
+    'alimentacao': ('🍔', 'Alimentação'),
+    'mercado': ('🛒', 'Mercado'),
+    'transporte': ('🚗', 'Transporte'),
+    'saude': ('💊', 'Saúde'),
+    'moradia': ('🏠', 'Moradia'),
+    'lazer': ('🎬', 'Lazer'),
+    'educacao': ('📚', 'Educação'),
+    'compras': ('🛍️', 'Compras'),
+    'beleza': ('💇', 'Beleza'),
+    'pets': ('🐾', 'Pets'),
+    'geral': ('📌', 'Geral'),
+    'vr': ('🍽️', 'Vale Refeição'),
+    'va': ('🛒', 'Vale Alimentação'),
+    'conta_fixa': ('💳', 'Contas fixas'),
+}
+
+def _sem_acento(texto):
+    """'Descrição ' -> 'descricao'"""
+    decomposto = unicodedata.normalize('NFKD', texto.strip().lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+# Regras: palavras ou expressões (sem acento) de cada categoria. Vale a expressão mais
+# longa encontrada na descrição ('mercado livre' ganha de 'mercado', 'água de coco' de 'água').
+_REGRAS_CATEGORIA = {
+    'alimentacao': ['almoco', 'jantar', 'janta', 'cafe', 'cafe da manha', 'lanche', 'padaria', 'pao', 'paes',
+                    'restaurante', 'lanchonete', 'pizza', 'pizzaria', 'hamburguer', 'hamburgueria', 'ifood',
+                    'rappi', 'marmita', 'acai', 'sorvete', 'sorveteria', 'pastel', 'salgado', 'comida',
+                    'delivery', 'refeicao', 'churrascaria', 'doceria', 'agua de coco', 'cafeteria', 'sushi'],
+    'mercado': ['mercado', 'supermercado', 'feira', 'hortifruti', 'sacolao', 'acougue', 'atacadao', 'assai',
+                'carrefour', 'pao de acucar', 'compras do mes', 'mercearia', 'emporio'],
+    'transporte': ['uber', 'taxi', 'onibus', 'metro', 'trem', 'gasolina', 'etanol', 'alcool', 'diesel',
+                   'combustivel', 'posto', 'estacionamento', 'pedagio', 'passagem', 'ipva', 'oficina',
+                   'mecanico', 'bilhete unico', 'cabify', 'patinete', 'lava jato'],
+    'saude': ['farmacia', 'remedio', 'drogaria', 'droga raia', 'drogasil', 'medico', 'consulta', 'dentista',
+              'exame', 'hospital', 'plano de saude', 'psicologo', 'terapia', 'academia', 'otica',
+              'laboratorio', 'vacina', 'fisioterapia'],
+    'moradia': ['aluguel', 'condominio', 'luz', 'energia', 'conta de luz', 'agua', 'conta de agua', 'gas',
+                'internet', 'iptu', 'faxina', 'diarista', 'reforma', 'material de construcao', 'telefone',
+                'encanador', 'eletricista', 'moveis'],
+    'lazer': ['cinema', 'netflix', 'spotify', 'show', 'teatro', 'viagem', 'hotel', 'pousada', 'ingresso',
+              'festa', 'balada', 'bar', 'cerveja', 'chopp', 'jogo', 'games', 'disney', 'hbo', 'prime video',
+              'passeio', 'parque', 'museu', 'streaming'],
+    'educacao': ['escola', 'faculdade', 'curso', 'livro', 'livros', 'livraria', 'mensalidade',
+                 'material escolar', 'apostila', 'udemy', 'ingles', 'aula', 'matricula'],
+    'compras': ['roupa', 'roupas', 'sapato', 'tenis', 'shopping', 'loja', 'presente', 'eletronico', 'celular',
+                'amazon', 'shopee', 'mercado livre', 'magalu', 'americanas', 'shein', 'calca', 'camisa'],
+    'beleza': ['barbeiro', 'barbearia', 'cabeleireiro', 'cabelo', 'salao', 'manicure', 'cosmeticos',
+               'perfume', 'maquiagem', 'depilacao'],
+    'pets': ['pet', 'petshop', 'pet shop', 'racao', 'veterinario', 'banho e tosa'],
+}
+# Palavras ignoradas na descrição (as que sobram de "usei o VA, 120 no mercado")
+_PALAVRAS_VAZIAS = frozenset(
+    'a o as os e de do da dos das no na nos nas em um uma com pro pra para por vr va vale'.split())
+# Uma descrição aprendida só volta a ser das mais recentes quando é usada depois de cair na
+# metade mais antiga do cache: o uso do dia a dia não regrava o cabeçalho do usuário
+_METADE_CACHE = max(1, CATEGORIAS_APRENDIDAS // 2)
+
+@lru_cache(maxsize=65536)
+def palavras_da_descricao(descricao):
+    """Palavras que identificam o estabelecimento ('Paguei na Padaria São João 2' -> ('padaria', 'sao', 'joao'))"""
+    return tuple(p for p in re.findall(r'[^\W\d_]+', _sem_acento(descricao)) if p not in _PALAVRAS_VAZIAS)
+
+def _compilar_regras_categoria():
+    """Árvore de palavras das regras (palavra -> nó; a chave None guarda a categoria da expressão)"""
+    arvore = {}
+    for categoria, expressoes in _REGRAS_CATEGORIA.items():
+        for expressao in expressoes:
+            no = arvore
+            for palavra in palavras_da_descricao(expressao):
+                no = no.setdefault(palavra, {})
+            no[None] = categoria
+    return arvore
+
+_ARVORE_CATEGORIAS = _compilar_regras_categoria()
+# Nome digitado em 'categoria ...' -> categoria ('saude', 'saúde', 'Saúde')
+_CATEGORIA_POR_NOME = {
+    nome: categoria for categoria, (_, rotulo) in CATEGORIAS.items() for nome in (categoria, _sem_acento(rotulo))
+}
+
+@lru_cache(maxsize=65536)
+def categoria_das_regras(descricao):
+    """Categoria da expressão mais longa das regras presente na descrição; None se nenhuma casar"""
+    palavras = palavras_da_descricao(descricao)
+    melhor, tamanho = None, 0
+    for inicio in range(len(palavras)):
+        no = _ARVORE_CATEGORIAS
+        for fim in range(inicio, len(palavras)):
+            palavra = palavras[fim]
+            proximo = no.get(palavra)
+            if proximo is None and palavra.endswith('s'):
+                # Plural simples: 'remedios', 'exames'
+                proximo = no.get(palavra[:-1])
+            if proximo is None:
+                break
+            no = proximo
+            if None in no and fim - inicio + 1 > tamanho:
+                melhor, tamanho = no[None], fim - inicio + 1
+    return melhor
+
+def _categoria_aprendida(usuario_dados, palavras):
+    """Categoria que o usuário já ensinou para a descrição (ou para o começo dela); None se não houver"""
+    aprendidas = usuario_dados.get('categorias_aprendidas')
+    if not aprendidas:
+        return None
+    mapa = aprendidas['mapa']
+    for tamanho in range(len(palavras), 0, -1):
+        chave = ' '.join(palavras[:tamanho])
+        entrada = mapa.get(chave)
+        if entrada is not None:
+            if aprendidas['uso'] - entrada[1] >= _METADE_CACHE:
+                # Usada de novo depois de envelhecer: volta a ser das mais recentes
+                aprendidas['uso'] += 1
+                entrada[1] = aprendidas['uso']
+            return entrada[0]
+    return None
+
+def categorizar(usuario_dados, tipo, descricao):
+    """Categoria de uma transação nova: a que o usuário ensinou, senão a das regras, senão a padrão do tipo"""
+    padrao = _CATEGORIA_TIPO.get(tipo, 'geral')
+    if 'gasto' not in tipo:
+        return padrao
+    palavras = palavras_da_descricao(descricao)
+    return _categoria_aprendida(usuario_dados, palavras) or categoria_das_regras(descricao) or padrao
+
+def aprender_categoria(usuario_dados, descricao, categoria):
+    """Guarda a categoria da descrição para os próximos gastos (descarta a usada há mais tempo)"""
+    palavras = palavras_da_descricao(descricao)
+    if not palavras:
+        return None
+    aprendidas = usuario_dados.setdefault('categorias_aprendidas', {'uso': 0, 'mapa': {}})
+    aprendidas['uso'] += 1
+    chave = ' '.join(palavras)
+    aprendidas['mapa'][chave] = [categoria, aprendidas['uso']]
+    while len(aprendidas['mapa']) > CATEGORIAS_APRENDIDAS:
+        antiga = min(aprendidas['mapa'], key=lambda c: aprendidas['mapa'][c][1])
+        del aprendidas['mapa'][antiga]
+    return chave
+
+def trocar_categoria_ultima(usuario_dados, categoria):
+    """Troca a categoria da última transação, acertando os totais; retorna (antiga, nova).
+    
+    A transação é substituída por uma cópia: o diário e as partições gravam só a troca da última.
+    """
+    totais_do_usuario(usuario_dados)
+    transacoes = usuario_dados['transacoes']
+    antiga = transacoes.pop()
+    contabilizar(usuario_dados, antiga, -1)
+    nova = dict(antiga, categoria=categoria)
+    transacoes.append(nova)
+    contabilizar(usuario_dados, nova)
+    return antiga, nova
+
+def rotulo_categoria(categoria):
+    """'saude' -> '💊 Saúde' (categorias desconhecidas aparecem como foram gravadas)"""
+    emoji, nome = CATEGORIAS.get(categoria or 'geral', ('🏷️', categoria))
+    return f'{emoji} {nome}'
+
+# Comando: CORRIGIR CATEGORIA DO ÚLTIMO GASTO
+@prefixo('categoria ', 'corrigir categoria ', 'mudar categoria ')
+def cmd_corrigir_categoria(ctx):
+    usuario_dados = ctx['usuario_dados']
+    texto = ' '.join(palavras_da_descricao(ctx['resto']))
+    categoria = _CATEGORIA_POR_NOME.get(texto) or categoria_das_regras(ctx['resto'])
+    if categoria is None or categoria in ('vr', 'va', 'conta_fixa'):
+        return "❌ Categoria desconhecida!\nUse: categoria [nome]\nEx: categoria saúde\n\n💡 Use 'categorias' para ver a lista."
+    if not usuario_dados['transacoes']:
+        return "❌ Nenhum gasto para corrigir!"
+    
+    ultima = usuario_dados['transacoes'][-1]
+    if 'gasto' not in ultima['tipo'] or ultima.get('categoria') == 'conta_fixa':
+        return "❌ A última transação não é um gasto avulso!\n💡 A categoria só pode ser corrigida logo depois do gasto."
+    
+    antiga, nova = trocar_categoria_ultima(usuario_dados, categoria)
+    chave = aprender_categoria(usuario_dados, nova['descricao'], categoria)
+    salvar_dados(ctx['dados'])
+    
+    resposta = f"🏷️ *Categoria corrigida!*\n📝 {nova['descricao']}\n{rotulo_categoria(antiga['categoria'])} → {rotulo_categoria(categoria)}"
+    if chave:
+        resposta += f"\n\n💡 Próximos gastos com \"{chave}\" já entram em {CATEGORIAS[categoria][1]}."
+    return resposta
+
+# Comando: LISTAR CATEGORIAS
+@comando('categorias', 'categoria')
+def cmd_categorias(ctx):
+    lista = "🏷️ *CATEGORIAS*\n\n"
+    for categoria in _REGRAS_CATEGORIA:
+        lista += f"• {rotulo_categoria(categoria)}\n"
+    lista += f"• {rotulo_categoria('geral')}\n"
+    aprendidas = ctx['usuario_dados'].get('categorias_aprendidas')
+    if aprendidas and aprendidas['mapa']:
+        lista += f"\n🧠 {len(aprendidas['mapa'])} descrições aprendidas com você"
+    lista += "\n\n💡 Para corrigir o último gasto: categoria [nome]\nEx: categoria lazer"
+    return lista
+
+# ===== LINGUAGEM NATURAL =====
+
+def _lancamento_natural(grupos, texto):
+    """Lançamento (tipo, valor, descrição) descrito em linguagem natural; None se nada casar"""
+    # Detectar GASTO em linguagem natural
+    if 'gasto' in grupos and 'nao_gasto' not in grupos:
+        valor, descricao = extrair_valor_e_descricao(texto)
+        if valor:
+            return 'gasto', valor, descricao
+    
+    # Detectar GASTO VR / VA (ou crédito) em linguagem natural
+    for vale, nome in (('vr', 'VR'), ('va', 'VA')):
+        if vale not in grupos:
+            continue
+        valor, descricao = extrair_valor_e_descricao(texto)
+        if valor:
+            if 'credito' in grupos:
+                return f'credito_{vale}', valor, f'Crédito {nome}'
+            return f'gasto_{vale}', valor, descricao
+    
+    # Detectar ENTRADA em linguagem natural
+    if 'entrada' in grupos:
+        valor, descricao = extrair_valor_e_descricao(texto)
+        if valor:
+            return 'entrada', valor, descricao
+    
+    return None
+
+def _linguagem_natural(ctx):
+    """Detecta gastos, vales e entradas em linguagem natural; None se nada casar"""
+    grupos = grupos_palavras_chave(ctx['msg'])
+    if not grupos:
+        return None
+    lancamento = _lancamento_natural(grupos, ctx['msg_original'])
+    if lancamento is None:
+        return None
+    
+    usuario_dados = ctx['usuario_dados']
+    tipo, valor, descricao = lancamento
+    vale = tipo[-2:]
+    nome = vale.upper()
+    emoji = '🍽️' if vale == 'vr' else '🛒'
+    
+    if tipo in ('gasto_vr', 'gasto_va') and valor > usuario_dados[vale]:
+        return f"⚠️ Saldo insuficiente no {nome}!\n{'💳' if vale == 'vr' else '🛒'} Disponível: R$ {usuario_dados[vale]:.2f}"
+    
+    transacao = registrar_transacao(usuario_dados, tipo, valor, descricao, categorizar(usuario_dados, tipo, descricao))
+    salvar_dados(ctx['dados'])
+    
+    if tipo == 'gasto':
+        return f"✅ Gasto registrado!\n💸 R$ {valor:.2f} - {descricao}\n🏷️ {rotulo_categoria(transacao['categoria'])}\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}"
+    if tipo == 'entrada':
+        return f"✅ Entrada registrada!\n💵 R$ {valor:.2f} - {descricao}\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}"
+    if tipo.startswith('credito'):
+        return f"✅ {nome} creditado!\n💳 + R$ {valor:.2f}\n{emoji} Saldo {nome}: R$ {usuario_dados[vale]:.2f}"
+    return f"✅ Gasto {nome} registrado!\n{emoji} R$ {valor:.2f} - {descricao}\n🏷️ {rotulo_categoria(transacao['categoria'])}\n💳 Saldo {nome}: R$ {usuario_dados[vale]:.2f}"
+
+# ===== COMANDOS DIRETOS (mantidos para compatibilidade) =====
+
+# Comando: Boas-vindas (primeira mensagem)
+@comando('oi', 'olá', 'ola', 'hey', 'opa')
+def cmd_boas_vindas(ctx):
+    return f"""👋 Olá! Sou seu assistente financeiro!
+
+👤 *Usuário:* {ctx['nome_atual']}
+
+💬 *Fale naturalmente comigo:*
+• "gastei 50 na padaria"
+• "usei VR no restaurante, 35 reais"
+• "recebi salário de 3000"
+• "creditaram 600 no VR"
+
+📊 *Consultas:*
+• saldo
+• extrato
+• resumo
+
+👥 *Multi-usuário:*
+• usuario [nome]
+• usuarios
+
+💳 *Contas fixas:*
+• conta fixa [valor] [dia] [desc]
+• contas fixas
+
+❓ Digite *ajuda* para ver todos os comandos"""
+
+# Comando: AJUDA (menu completo)
+@comando('ajuda', 'help', 'menu', 'comandos')
+def cmd_ajuda(ctx):
+    return """📱 *ASSISTENTE FINANCEIRO - GUIA COMPLETO*
+
+💬 *CONVERSE NATURALMENTE:*
+
+*Registrar gastos:*
+• "gastei 50 reais no almoço"
+• "paguei 30 na padaria santa tereza"
+• "comprei remédio, foi 45 reais"
+
+*Usar Vale Refeição:*
+• "usei o VR, 35 reais no restaurante"
+• "gastei 28 com VR na lanchonete"
+
+*Usar Vale Alimentação:*
+• "usei o VA, 120 no mercado"
+• "gastei 85 com VA no supermercado"
+
+*Registrar entradas:*
+• "recebi meu salário de 3000"
+• "entrou 500 do freelance"
+
+*Creditar vales:*
+• "creditaram 600 no VR"
+• "caiu 300 no VA"
+
+*Vários de uma vez (um por linha):*
+• "gastei 12 pão
+  gastei 30 uber
+  usei VR 35 almoço"
+
+💰 *CONSULTAS:*
+• saldo - Ver todos os saldos
+• extrato - Últimas 10 transações
+• extrato completo - Ver TODAS (em páginas)
+• extrato mais - Próxima página
+• extrato página [N] - Ir para a página N
+• resumo - Relatório do mês
+• resumo [AAAA-MM] - Relatório de um mês fechado
+• resumo últimos 7 dias - Relatório dos últimos dias
+• gastos hoje / ontem / semana - Gastos do período
+• extrato 01/10 a 15/10 - Transações do período
+• meses - Meses fechados
+• total - Estatísticas de transações
+• buscar [termo] - Transações com o termo e o total
+• saldo em 10/10 - Saldos no fim de um dia passado
+
+👥 *MULTI-USUÁRIO:*
+• usuario [nome] - Trocar/criar usuário
+• usuarios - Ver todos os usuários
+• usuario - Ver usuário atual
+
+🏷️ *CATEGORIAS:*
+• Os gastos já entram categorizados (padaria, uber, farmácia...)
+• categoria [nome] - Corrige o último gasto e aprende
+  Ex: categoria lazer
+• categorias - Ver as categorias
+
+💳 *CONTAS FIXAS:*
+• conta fixa [valor] [dia] [desc]
+  Ex: conta fixa 150 10 aluguel
+• contas fixas - Ver todas as contas
+• pagar conta [número] - Registrar pagamento
+• remover conta [número] - Remover conta
+
+🗑️ *GERENCIAR DADOS:*
+• apagar historico - Limpa transações (mantém saldos)
+• limpar tudo - Reseta usuário atual
+• apagar ultima - Desfazer última transação
+• desfazer 3 - Desfazer as 3 últimas
+• desfazer [termo] - Desfazer a última com o termo
+  Ex: desfazer uber
+• zerar - Reinicia TUDO (todos usuários)
+
+🤖 *OU USE COMANDOS DIRETOS:*
+• gasto 50 almoço
+• vr 30 padaria
+• va 80 mercado
+• entrada 3000 salário
+• +vr 600 / +va 300
+
+Fale comigo naturalmente! 😊"""
+
+# Comando: GASTO
+@prefixo('gasto ', etapa='direto')
+def cmd_gasto(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        partes = ctx['resto'].split(' ', 1)
+        valor = ler_valor(partes[0])
+        descricao = partes[1] if len(partes) > 1 else 'Sem descrição'
+        
+        transacao = registrar_transacao(usuario_dados, 'gasto', valor, descricao,
+                                        categorizar(usuario_dados, 'gasto', descricao))
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ Gasto registrado!\n💸 R$ {valor:.2f} - {descricao}\n🏷️ {rotulo_categoria(transacao['categoria'])}\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: gasto [valor] [descrição]\nEx: gasto 50 almoço"
+
+# Comando: VR (Vale Refeição)
+@prefixo('vr ', etapa='direto')
+def cmd_vr(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        partes = ctx['resto'].split(' ', 1)
+        valor = ler_valor(partes[0])
+        descricao = partes[1] if len(partes) > 1 else 'Refeição'
+        
+        if valor > usuario_dados['vr']:
+            return f"⚠️ Saldo insuficiente no VR!\n💳 Disponível: R$ {usuario_dados['vr']:.2f}"
+        
+        transacao = registrar_transacao(usuario_dados, 'gasto_vr', valor, descricao,
+                                        categorizar(usuario_dados, 'gasto_vr', descricao))
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ Gasto VR registrado!\n🍽️ R$ {valor:.2f} - {descricao}\n🏷️ {rotulo_categoria(transacao['categoria'])}\n💳 Saldo VR: R$ {usuario_dados['vr']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: vr [valor] [descrição]\nEx: vr 25 restaurante"
+
+# Comando: VA (Vale Alimentação)
+@prefixo('va ', etapa='direto')
+def cmd_va(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        partes = ctx['resto'].split(' ', 1)
+        valor = ler_valor(partes[0])
+        descricao = partes[1] if len(partes) > 1 else 'Alimentação'
+        
+        if valor > usuario_dados['va']:
+            return f"⚠️ Saldo insuficiente no VA!\n🛒 Disponível: R$ {usuario_dados['va']:.2f}"
+        
+        transacao = registrar_transacao(usuario_dados, 'gasto_va', valor, descricao,
+                                        categorizar(usuario_dados, 'gasto_va', descricao))
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ Gasto VA registrado!\n🛒 R$ {valor:.2f} - {descricao}\n🏷️ {rotulo_categoria(transacao['categoria'])}\n💳 Saldo VA: R$ {usuario_dados['va']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: va [valor] [descrição]\nEx: va 80 mercado"
+
+# Comando: ENTRADA
+@prefixo('entrada ', etapa='direto')
+def cmd_entrada(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        partes = ctx['resto'].split(' ', 1)
+        valor = ler_valor(partes[0])
+        descricao = partes[1] if len(partes) > 1 else 'Entrada'
+        
+        registrar_transacao(usuario_dados, 'entrada', valor, descricao, 'geral')
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ Entrada registrada!\n💵 R$ {valor:.2f} - {descricao}\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: entrada [valor] [descrição]\nEx: entrada 3000 salário"
+
+# Comando: +VR
+@prefixo('+vr ', etapa='direto')
+def cmd_credito_vr(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        valor = ler_valor(ctx['resto'])
+        registrar_transacao(usuario_dados, 'credito_vr', valor, 'Crédito VR', 'vr')
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ VR creditado!\n💳 + R$ {valor:.2f}\n🍽️ Saldo VR: R$ {usuario_dados['vr']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: +vr [valor]\nEx: +vr 500"
+
+# Comando: +VA
+@prefixo('+va ', etapa='direto')
+def cmd_credito_va(ctx):
+    usuario_dados = ctx['usuario_dados']
+    try:
+        valor = ler_valor(ctx['resto'])
+        registrar_transacao(usuario_dados, 'credito_va', valor, 'Crédito VA', 'va')
+        salvar_dados(ctx['dados'])
+        
+        return f"✅ VA creditado!\n💳 + R$ {valor:.2f}\n🛒 Saldo VA: R$ {usuario_dados['va']:.2f}"
+    except (ValueError, IndexError):
+        return "❌ Formato inválido!\nUse: +va [valor]\nEx: +va 300"
+
+# Comando: SALDO
+@comando('saldo', 'saldos', 'extrato saldo')
+def cmd_saldo(ctx):
+    usuario_dados = ctx['usuario_dados']
+    return f"""💰 *SALDOS ATUAIS*
+
+💵 *Saldo Geral:* R$ {usuario_dados['saldo']:.2f}
+🍽️ *Vale Refeição:* R$ {usuario_dados['vr']:.2f}
+🛒 *Vale Alimentação:* R$ {usuario_dados['va']:.2f}
+
+📊 *Total Disponível:*
+R$ {usuario_dados['saldo'] + usuario_dados['vr'] + usuario_dados['va']:.2f}"""
+
+EMOJI_TIPO = {
+    'entrada': '💵',
+    'gasto': '💸',
+    'gasto_vr': '🍽️',
+    'gasto_va': '🛒',
+    'credito_vr': '💳',
+    'credito_va': '💳'
+}
+
+# Comando: EXTRATO
+@comando('extrato', 'historico', 'transacoes')
+def cmd_extrato(ctx):
+    usuario_dados = ctx['usuario_dados']
+    if not usuario_dados['transacoes']:
+        return "📋 Nenhuma transação registrada ainda."
+    
+    ultimas = usuario_dados['transacoes'][-10:]
+    texto = "📋 *ÚLTIMAS 10 TRANSAÇÕES*\n\n"
+    
+    for t in reversed(ultimas):
+        emoji = EMOJI_TIPO.get(t['tipo'], '📌')
+        sinal = '+' if 'entrada' in t['tipo'] or 'credito' in t['tipo'] else '-'
+        texto += f"{emoji} {sinal}R$ {t['valor']:.2f}\n"
+        texto += f"   {t['descricao']}\n"
+        texto += f"   {t['data']}\n\n"
+    
+    total_transacoes = len(usuario_dados['transacoes'])
+    if total_transacoes > 10:
+        texto += f"💡 Total: {total_transacoes} transações\n"
+        texto += "Use 'extrato completo' para ver todas"
+    
+    return texto.strip()
+
+# Extrato completo em páginas de tamanho fixo: cada página cabe numa mensagem
+ITENS_POR_PAGINA = 12
+TAMANHO_DESCRICAO = 60
+
+def transacoes_recentes(transacoes, pular, quantidade):
+    """Da mais nova para a mais antiga, pulando as `pular` mais novas; custo proporcional à página"""
+    if isinstance(transacoes, TransacoesSQLite):
+        return transacoes.recentes(pular, quantidade)
+    fim = len(transacoes) - pular
+    return transacoes[max(0, fim - quantidade):max(0, fim)][::-1]
+
+def item_extrato(tipo, valor, descricao, data):
+    """Uma transação no extrato (descrição cortada em TAMANHO_DESCRICAO caracteres)"""
+    emoji = EMOJI_TIPO.get(tipo, '📌')
+    sinal = '+' if 'entrada' in tipo or 'credito' in tipo else '-'
+    if len(descricao) > TAMANHO_DESCRICAO:
+        descricao = descricao[:TAMANHO_DESCRICAO - 1] + '…'
+    return f"{emoji} {sinal}R$ {valor:.2f} - {descricao}\n   {data}\n\n"
+
+def pagina_extrato(transacoes, pagina, total=None):
+    """Texto de uma página do extrato completo, limitado a LIMITE_MENSAGEM caracteres.
+    
+    Retorna (texto, total_de_paginas). Com uma página só, o texto é o mesmo de sempre.
+    """
+    if total is None:
+        total = len(transacoes)
+    paginas = max(1, -(-total // ITENS_POR_PAGINA))
+    
+    cabecalho = f"📋 *TODAS AS TRANSAÇÕES ({total})*"
+    if paginas > 1:
+        cabecalho += f" - página {pagina} de {paginas}"
+    rodape = "💡 Envie 'extrato mais' para a próxima página" if pagina < paginas else ''
+    
+    partes = [cabecalho, '\n\n']
+    tamanho = len(cabecalho) + 2 + len(rodape)
+    for t in transacoes_recentes(transacoes, (pagina - 1) * ITENS_POR_PAGINA, ITENS_POR_PAGINA):
+        item = item_extrato(t['tipo'], t['valor'], t['descricao'], t['data'])
+        if tamanho + len(item) > LIMITE_MENSAGEM:
+            break
+        partes.append(item)
+        tamanho += len(item)
+    partes.append(rodape)
+    return ''.join(partes).strip(), paginas
+
+def _responder_paginas(ctx, pagina):
+    """Envia a partir de `pagina` (até PAGINAS_POR_RESPOSTA mensagens) e guarda o cursor do remetente"""
+    usuario_dados = ctx['usuario_dados']
+    transacoes = usuario_dados['transacoes']
+    total = quantidade_transacoes(usuario_dados)
+    cursores = usuario_dados.get('paginas_extrato', {})
+    chave = ctx['remetente'] or ''
+    anterior = cursores.get(chave)
+    
+    mensagens = []
+    paginas = pagina
+    while len(mensagens) < PAGINAS_POR_RESPOSTA and pagina <= paginas:
+        texto, paginas = pagina_extrato(transacoes, pagina, total)
+        mensagens.append(texto)
+        pagina += 1
+    
+    # O cursor fica com o usuário (travado durante a mensagem), por remetente; só é
+    # gravado se mudou: ver de novo a mesma página não escreve nada
+    proxima = pagina if pagina <= paginas else None
+    if proxima != anterior:
+        if proxima is None:
+            cursores.pop(chave)
+        else:
+            usuario_dados.setdefault('paginas_extrato', cursores)[chave] = proxima
+        salvar_dados(ctx['dados'])
+    return mensagens[0] if len(mensagens) == 1 else mensagens
+
+# Comando: EXTRATO COMPLETO
+@comando('extrato completo', 'historico completo', 'ver tudo', 'ver todas')
+def cmd_extrato_completo(ctx):
+    if not ctx['usuario_dados']['transacoes']:
+        return "📋 Nenhuma transação registrada ainda."
+    return _responder_paginas(ctx, 1)
+
+# Comando: PRÓXIMA PÁGINA DO EXTRATO
+@comando('extrato mais', 'mais', 'proxima pagina', 'próxima página')
+def cmd_extrato_mais(ctx):
+    pagina = ctx['usuario_dados'].get('paginas_extrato', {}).get(ctx['remetente'] or '')
+    if pagina is None:
+        return "📋 Não há mais páginas.\n\n💡 Envie 'extrato completo' para ver desde o início."
+    return _responder_paginas(ctx, pagina)
+
+# Comando: PÁGINA N DO EXTRATO
+@prefixo('extrato página ', 'extrato pagina ')
+def cmd_extrato_pagina(ctx):
+    try:
+        pagina = int(ctx['resto'].strip())
+    except ValueError:
+        return "❌ Formato inválido!\nUse: extrato página [número]\nEx: extrato página 2"
+    if not ctx['usuario_dados']['transacoes']:
+        return "📋 Nenhuma transação registrada ainda."
+    
+    paginas = max(1, -(-quantidade_transacoes(ctx['usuario_dados']) // ITENS_POR_PAGINA))
+    if pagina < 1 or pagina > paginas:
+        return f"❌ Página {pagina} não existe! O extrato tem {paginas} página(s)."
+    return _responder_paginas(ctx, pagina)
+
+# Comando: LIMPAR TUDO (apaga histórico e zera saldos do usuário atual)
+@comando('limpar tudo', 'resetar', 'limpar dados')
+def cmd_limpar_tudo(ctx):
+    usuario_dados = ctx['usuario_dados']
+    # O razão continua: 'saldo em' ainda mostra os saldos de antes
+    registrar_evento(usuario_dados, 'saldos', saldos={'saldo': 0, 'vr': 0, 'va': 0})
+    usuario_dados['saldo'] = 0
+    usuario_dados['vr'] = 0
+    usuario_dados['va'] = 0
+    limpar_transacoes(usuario_dados)
+    usuario_dados['contas_fixas'] = []
+    salvar_dados(ctx['dados'])
+    apagar_arquivo(ctx['nome_atual'])
+    return f"🗑️ *Dados limpos!*\n\n✅ Usuário *{ctx['nome_atual']}* resetado:\n💰 Saldos zerados\n📋 Histórico apagado\n💳 Contas fixas removidas\n\n💡 Outros usuários não foram afetados\n💡 Não dá para desfazer; 'saldo em [dd/mm]' ainda mostra os saldos de antes"
+
+# Comando: APAGAR ÚLTIMA TRANSAÇÃO
+@comando('apagar ultima', 'apagar última', 'desfazer', 'cancelar ultima')
+def cmd_apagar_ultima(ctx):
+    usuario_dados = ctx['usuario_dados']
+    if not usuario_dados['transacoes']:
+        return "❌ Nenhuma transação para apagar!"
+    
+    ultima = desfazer_ultima_transacao(usuario_dados)
+    salvar_dados(ctx['dados'])
+    
+    return f"🔙 *Última transação desfeita!*\n\n❌ {ultima['descricao']}\n💰 R$ {ultima['valor']:.2f}\n⏰ {ultima['data']}\n\n💰 Saldo atual: R$ {usuario_dados['saldo']:.2f}"
+
+# Comando: CONTAR TRANSAÇÕES
+@comando('total', 'contar', 'quantas transacoes')
+def cmd_total(ctx):
+    totais = totais_por_tipo(ctx['usuario_dados'])
+    total = sum(quantidade for quantidade, _ in totais.values())
+    gastos = sum(quantidade for tipo, (quantidade, _) in totais.items() if 'gasto' in tipo)
+    entradas = sum(quantidade for tipo, (quantidade, _) in totais.items()
+                   if 'entrada' in tipo or 'credito' in tipo)
+    
+    return f"""📊 *ESTATÍSTICAS*
+
+📝 Total de transações: {total}
+💸 Gastos: {gastos}
+💵 Entradas: {entradas}
+
+💡 Use 'extrato' para ver as últimas 10
+💡 Use 'extrato completo' para ver todas"""
+
+def _texto_categorias(categorias, total_gastos):
+    """Gastos por categoria ({categoria: (quantidade, soma)}), do maior para o menor, com a fatia de cada um"""
+    linhas = []
+    for categoria, (quantidade, soma) in sorted(categorias.items(), key=lambda item: -item[1][1]):
+        fatia = f' ({soma / total_gastos:.0%})' if total_gastos else ''
+        linhas.append(f"• {rotulo_categoria(categoria)}: R$ {soma:.2f}{fatia} - {quantidade}x")
+    return '\n'.join(linhas)
+
+def _texto_resumo(titulo, titulo_saldos, saldos, totais, categorias=None):
+    """Texto do resumo a partir dos saldos, dos totais por tipo ({tipo: (quantidade, soma)})
+    e, se houver, dos totais dos gastos por categoria"""
+    total_entradas = sum(soma for tipo, (_, soma) in totais.items()
+                         if tipo in ['entrada', 'credito_vr', 'credito_va'])
+    total_gastos = sum(soma for tipo, (_, soma) in totais.items() if 'gasto' in tipo)
+    
+    gastos_vr = totais.get('gasto_vr', (0, 0))[1]
+    gastos_va = totais.get('gasto_va', (0, 0))[1]
+    gastos_geral = totais.get('gasto', (0, 0))[1]
+    quantidade = sum(q for q, _ in totais.values())
+    por_categoria = ''
+    if categorias:
+        por_categoria = f"\n🏷️ *GASTOS POR CATEGORIA:*\n{_texto_categorias(categorias, total_gastos)}\n"
+    
+    return f"""📊 *{titulo}*
+
+💰 *{titulo_saldos}:*
+• Geral: R$ {saldos['saldo']:.2f}
+• VR: R$ {saldos['vr']:.2f}
+• VA: R$ {saldos['va']:.2f}
+
+📈 *MOVIMENTAÇÃO:*
+• Total Entradas: R$ {total_entradas:.2f}
+• Total Gastos: R$ {total_gastos:.2f}
+
+💸 *GASTOS POR SALDO:*
+• Geral: R$ {gastos_geral:.2f}
+• Vale Refeição: R$ {gastos_vr:.2f}
+• Vale Alimentação: R$ {gastos_va:.2f}
+{por_categoria}
+📝 *Transações:* {quantidade}"""
+
+# Comando: RESUMO
+@comando('resumo', 'relatorio', 'mes')
+def cmd_resumo(ctx):
+    # Totais mantidos a cada transação: não percorre o histórico
+    usuario_dados = ctx['usuario_dados']
+    return _texto_resumo('RESUMO DO MÊS', 'SALDOS ATUAIS', usuario_dados, totais_por_tipo(usuario_dados),
+                         totais_por_categoria(usuario_dados))
+
+# Comando: RESUMO DE UM MÊS FECHADO (lê só o resumo arquivado)
+@prefixo('resumo ', 'relatorio ')
+def cmd_resumo_mes(ctx):
+    ultimos = _ULTIMOS_DIAS.fullmatch(ctx['resto'].strip())
+    if ultimos and 1 <= int(ultimos[1]) <= 366:
+        return resumo_ultimos_dias(ctx, int(ultimos[1]))
+    mes = _mes_do_texto(ctx['resto'])
+    if mes is None:
+        return "❌ Mês ou período inválido!\nUse: resumo [AAAA-MM] ou resumo últimos [N] dias\nEx: resumo 2026-09"
+    if mes == ctx['dados']['mes_atual']:
+        return cmd_resumo(ctx)
+    
+    rotulo = f'{mes[5:]}/{mes[:4]}'
+    resumo = resumo_arquivado(ctx['nome_atual'], mes)
+    if resumo is None:
+        return f"📭 Nenhum dado arquivado de {rotulo}.\n\n💡 Use 'meses' para ver os meses disponíveis."
+    totais = {tipo: tuple(valores) for tipo, valores in resumo['totais']['tipo'].items()}
+    # Meses arquivados antes da categorização não têm os gastos por categoria
+    categorias = {categoria: tuple(valores) for categoria, valores in resumo['totais'].get('gastos', {}).items()}
+    return _texto_resumo(f'RESUMO DE {rotulo}', 'SALDOS NO FIM DO MÊS', resumo['saldos'], totais, categorias)
+
+# Comando: MESES ARQUIVADOS
+@comando('meses', 'meses anteriores', 'meses arquivados')
+def cmd_meses(ctx):
+    meses = meses_arquivados(ctx['nome_atual'])
+    if not meses:
+        return "📭 Nenhum mês fechado ainda.\n\n💡 No início de cada mês o anterior é arquivado e pode ser consultado com: resumo [AAAA-MM]"
+    
+    lista = "🗓️ *MESES FECHADOS*\n\n"
+    for mes in reversed(meses):
+        totais = resumo_arquivado(ctx['nome_atual'], mes)['totais']['tipo']
+        quantidade = sum(q for q, _ in totais.values())
+        lista += f"• {mes[5:]}/{mes[:4]} - {quantidade} transações\n"
+    lista += f"\n💡 Para ver um mês: resumo {meses[-1]}"
+    return lista
+
+# Comando: ZERAR
+@comando('zerar')
+def cmd_zerar(ctx):
+    dados = ctx['dados']
+    # Substitui no próprio objeto residente, que é compartilhado entre threads
+    dados.update(dados_vazios())
+    salvar_dados(dados)
+    apagar_arquivo()
+    return "✅ Dados zerados com sucesso!\n\n⚠️ Todos os usuários e dados foram apagados!\n💡 Não dá para desfazer; 'saldo em [dd/mm]' ainda mostra os saldos de antes"
+
+# ===== LANÇAMENTOS EM LOTE =====
+
+# Comandos diretos que lançam uma transação: função -> (tipo, descrição padrão).
+# Nos créditos a descrição é sempre a padrão.
+_LANCAMENTOS_DIRETOS = {
+    cmd_gasto: ('gasto', 'Sem descrição'),
+    cmd_vr: ('gasto_vr', 'Refeição'),
+    cmd_va: ('gasto_va', 'Alimentação'),
+    cmd_entrada: ('entrada', 'Entrada'),
+    cmd_credito_vr: ('credito_vr', 'Crédito VR'),
+    cmd_credito_va: ('credito_va', 'Crédito VA'),
+}
+# Itens listados na confirmação de um lote (o resto vira "e mais N")
+ITENS_POR_LOTE = 15
+
+def interpretar_lancamento(linha):
+    """Lançamento (tipo, valor, descrição) de uma linha, como a mensagem sozinha seria lida.
+    
+    None se a linha não for um lançamento (outro comando ou texto não reconhecido).
+    """
+    msg = linha.lower().strip()
+    if msg in _COMANDOS_EXATOS or _buscar_prefixo('sistema', msg):
+        return None
+    grupos = grupos_palavras_chave(msg)
+    if grupos:
+        lancamento = _lancamento_natural(grupos, linha.strip())
+        if lancamento:
+            return lancamento
+    
+    encontrado = _buscar_prefixo('direto', msg)
+    if encontrado is None or encontrado[0] not in _LANCAMENTOS_DIRETOS:
+        return None
+    tipo, padrao = _LANCAMENTOS_DIRETOS[encontrado[0]]
+    partes = msg[encontrado[1]:].split(' ', 1)
+    try:
+        valor = ler_valor(partes[0])
+    except ValueError:
+        return None
+    if tipo.startswith('credito'):
+        return (tipo, valor, padrao) if len(partes) == 1 else None
+    return tipo, valor, partes[1] if len(partes) > 1 else padrao
+
+# Comando: LOTE (uma mensagem com um lançamento por linha)
+def cmd_lote(ctx):
+    linhas = [linha.strip() for linha in ctx['msg_original'].splitlines() if linha.strip()]
+    if len(linhas) < 2:
+        return None
+    
+    lancamentos = []
+    invalidas = []
+    for numero, linha in enumerate(linhas, 1):
+        lancamento = interpretar_lancamento(linha)
+        if lancamento is None:
+            invalidas.append(f"• Linha {numero}: {linha}")
+        else:
+            lancamentos.append(lancamento)
+    if not lancamentos:
+        # Nenhuma linha é lançamento: segue o despacho normal da mensagem inteira
+        return None
+    if invalidas:
+        return ("❌ Não entendi estas linhas:\n" + '\n'.join(invalidas)
+                + "\n\n⚠️ Nada foi registrado. Corrija e envie o lote de novo.")
+    
+    # Confere os vales com o saldo corrente do lote (um crédito antes do gasto vale)
+    usuario_dados = ctx['usuario_dados']
+    saldos = {campo: centavos(usuario_dados[campo]) for campo in ('saldo', 'vr', 'va')}
+    for numero, (tipo, valor, descricao) in enumerate(lancamentos, 1):
+        campo, sinal = _EFEITO_TIPO[tipo]
+        saldos[campo] += sinal * centavos(valor)
+        if campo != 'saldo' and saldos[campo] < 0:
+            disponivel = reais(saldos[campo] + centavos(valor))
+            return (f"⚠️ Saldo insuficiente no {campo.upper()} na linha {numero} ({descricao})!\n"
+                    f"💳 Disponível nesse ponto: R$ {disponivel:.2f}\n\n⚠️ Nada foi registrado.")
+    
+    novas = registrar_lote(usuario_dados, lancamentos)
+    salvar_dados(ctx['dados'])
+    
+    gastos = sum(centavos(t['valor']) for t in novas if 'gasto' in t['tipo'])
+    entradas = sum(centavos(t['valor']) for t in novas if 'gasto' not in t['tipo'])
+    resposta = f"✅ *{len(novas)} lançamentos registrados!*\n\n"
+    for t in novas[:ITENS_POR_LOTE]:
+        sinal = '-' if 'gasto' in t['tipo'] else '+'
+        rotulo = f" ({rotulo_categoria(t['categoria'])})" if 'gasto' in t['tipo'] else ''
+        resposta += f"{EMOJI_TIPO.get(t['tipo'], '📌')} {sinal}R$ {t['valor']:.2f} - {t['descricao']}{rotulo}\n"
+    if len(novas) > ITENS_POR_LOTE:
+        resposta += f"… e mais {len(novas) - ITENS_POR_LOTE}\n"
+    resposta += f"\n💸 Gastos: R$ {reais(gastos):.2f}"
+    if entradas:
+        resposta += f"\n💵 Entradas: R$ {reais(entradas):.2f}"
+    resposta += (f"\n\n💰 Saldo: R$ {usuario_dados['saldo']:.2f}\n🍽️ VR: R$ {usuario_dados['vr']:.2f}"
+                 f"\n🛒 VA: R$ {usuario_dados['va']:.2f}")
+    return resposta
+
+# ===== ÍNDICES DO HISTÓRICO =====
+
+# Índices por usuário (os que consultaram por último, até INDICE_USUARIOS), e por mês
+# arquivado consultado: 'chaves' tem (tipo, valor, descrição, data) de cada posição do
+# histórico; 'termos' leva cada termo às posições, em ordem crescente, das transações que
+# o contêm; 'momentos' tem os minutos das datas em ordem e 'posicoes' a posição de cada um
+_indices = {'lock': threading.Lock(), 'entradas': OrderedDict()}
+# Quantas transações do fim do histórico são conferidas antes de desistir e reindexar tudo
+RECUO_INDICE = 8
+
+@lru_cache(maxsize=65536)
+def termos_busca(texto):
+    """Palavras do texto sem acento e em minúsculas ('Padaria São João' -> {'padaria', 'sao', 'joao'}).
+    
+    Com cache: as descrições se repetem muito ('mercado', 'uber', 'almoço').
+    """
+    return frozenset(re.findall(r'\w+', _sem_acento(texto)))
+
+@lru_cache(maxsize=4096)
+def _minuto_do_dia(texto):
+    """'%d/%m/%Y' -> minutos desde 01/01/0001 até o início do dia (as transações se repetem muito de dia)"""
+    return date(int(texto[6:10]), int(texto[3:5]), int(texto[:2])).toordinal() * 1440
+
+def minuto_da_data(data):
+    """'%d/%m/%Y %H:%M' (ou só '%d/%m/%Y') -> minutos desde 01/01/0001, ordenáveis (None fora do formato)"""
+    if not isinstance(data, str) or len(data) not in (10, 16) or data[2] != '/' or data[5] != '/':
+        return None
+    try:
+        minuto = _minuto_do_dia(data[:10])
+        if len(data) == 16:
+            horas, minutos = int(data[11:13]), int(data[14:16])
+            if data[13] != ':' or horas > 23 or minutos > 59:
+                return None
+            minuto += horas * 60 + minutos
+    except ValueError:
+        return None
+    return minuto
+
+def datetime_para_minuto(momento):
+    """datetime -> minutos desde 01/01/0001, na mesma escala de minuto_da_data"""
+    return momento.toordinal() * 1440 + momento.hour * 60 + momento.minute
+
+def _chave_indice(transacao):
+    return (transacao['tipo'], transacao['valor'], transacao['descricao'], transacao['data'])
+
+def _entrada_indice(chave):
+    """Entrada do cache de índices (a mais usada por último vai para o fim; as antigas saem).
+    
+    Cada índice só é montado na primeira consulta que precisa dele: quem nunca buscou
+    por termo não paga pelo índice invertido.
+    """
+    with _indices['lock']:
+        entrada = _indices['entradas'].pop(chave, None) or {
+            'chaves': [], 'termos': None, 'momentos': None, 'posicoes': None, 'assinatura': None
+        }
+        _indices['entradas'][chave] = entrada
+        while len(_indices['entradas']) > INDICE_USUARIOS:
+            _indices['entradas'].popitem(last=False)
+    return entrada
+
+def descartar_indice(nome):
+    """Esquece os índices do histórico ativo do usuário (o próximo uso reindexa tudo).
+    
+    Para quando sai uma transação do meio do histórico, que o acompanhamento pela ponta
+    não reconhece com segurança.
+    """
+    with _indices['lock']:
+        _indices['entradas'].pop(nome, None)
+
+def _indexar_termos(entrada, desde):
+    """Acrescenta ao índice invertido as posições a partir de `desde`"""
+    chaves, termos = entrada['chaves'], entrada['termos']
+    for posicao in range(desde, len(chaves)):
+        for termo in termos_busca(chaves[posicao][2]):
+            termos.setdefault(termo, []).append(posicao)
+
+def _indexar_datas(entrada, desde):
+    """Acrescenta ao índice por data as posições a partir de `desde`"""
+    chaves, momentos, posicoes = entrada['chaves'], entrada['momentos'], entrada['posicoes']
+    datadas = []
+    for posicao in range(desde, len(chaves)):
+        minuto = minuto_da_data(chaves[posicao][3])
+        if minuto is not None:
+            datadas.append((minuto, posicao))
+    datadas.sort()
+    if not momentos or not datadas or datadas[0][0] >= momentos[-1]:
+        # Caso comum: lançamentos de agora, depois de tudo o que já está no índice
+        momentos.extend(minuto for minuto, _ in datadas)
+        posicoes.extend(posicao for _, posicao in datadas)
+    else:
+        # Datas fora de ordem (extrato importado, data retroativa)
+        for minuto, posicao in datadas:
+            i = bisect_right(momentos, minuto)
+            momentos.insert(i, minuto)
+            posicoes.insert(i, posicao)
+
+def _acompanhar_historico(entrada, transacoes):
+    """Põe os índices em dia com o histórico processando só o que mudou no fim dele.
+    
+    Transações acrescentadas entram nos índices e as desfeitas (apagar ultima) saem
+    deles, inclusive as gravadas por outros processos. Se a ponta do histórico não bate
+    (histórico apagado, mês arquivado), tudo é reindexado.
+    """
+    chaves, termos = entrada['chaves'], entrada['termos']
+    momentos, posicoes = entrada['momentos'], entrada['posicoes']
+    
+    # Índices negativos: no SQLite, o fim do histórico sai com LIMIT, sem ler o resto
+    total = len(transacoes)
+    n = len(chaves)
+    mantidas = min(n, total)
+    while mantidas and chaves[mantidas - 1] != _chave_indice(transacoes[mantidas - 1 - total]):
+        mantidas -= 1
+        if n - mantidas > RECUO_INDICE:
+            mantidas = 0
+    
+    if mantidas == 0:
+        chaves.clear()
+        if termos is not None:
+            termos.clear()
+        if momentos is not None:
+            del momentos[:], posicoes[:]
+    else:
+        for posicao in range(n - 1, mantidas - 1, -1):
+            _, _, descricao, data = chaves[posicao]
+            # As posições mais altas estão no fim de cada lista de termos
+            for termo in termos_busca(descricao) if termos is not None else ():
+                lista = termos[termo]
+                lista.pop()
+                if not lista:
+                    del termos[termo]
+            minuto = minuto_da_data(data) if momentos is not None else None
+            if minuto is not None:
+                i = bisect_left(momentos, minuto)
+                while posicoes[i] != posicao:
+                    i += 1
+                del momentos[i], posicoes[i]
+        del chaves[mantidas:]
+    
+    if mantidas < total:
+        chaves.extend(map(_chave_indice, transacoes[mantidas - total:] if mantidas else transacoes))
+        if termos is not None:
+            _indexar_termos(entrada, mantidas)
+        if momentos is not None:
+            _indexar_datas(entrada, mantidas)
+    return entrada
+
+def indice_historico(nome, transacoes, termos=False, datas=False):
+    """Índices do histórico ativo do usuário, em dia com ele (chamar com a trava do usuário).
+    
+    `termos` e `datas` pedem o índice invertido e o índice por data, montados aqui se
+    for a primeira consulta deles.
+    """
+    return _preparar_indices(_acompanhar_historico(_entrada_indice(nome), transacoes), termos, datas)
+
+def _preparar_indices(entrada, termos=False, datas=False):
+    if termos and entrada['termos'] is None:
+        entrada['termos'] = {}
+        _indexar_termos(entrada, 0)
+    if datas and entrada['momentos'] is None:
+        entrada['momentos'], entrada['posicoes'] = array('q'), array('q')
+        _indexar_datas(entrada, 0)
+    return entrada
+
+def _indice_arquivado(nome, mes):
+    """Índice por data de um mês fechado, relido do arquivo só se ele mudou"""
+    caminho = os.path.join(_pasta_arquivo(nome), f'{mes}.json')
+    try:
+        info = os.stat(caminho)
+        assinatura = (info.st_ino, info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        assinatura = None
+    entrada = _entrada_indice(('arquivo', nome, mes))
+    if entrada['assinatura'] != assinatura:
+        entrada['assinatura'] = assinatura
+        _acompanhar_historico(entrada, [])
+        _acompanhar_historico(entrada, transacoes_arquivadas(nome, mes))
+    return _preparar_indices(entrada, datas=True)
+
+def transacoes_no_periodo(nome, transacoes, inicio, fim):
+    """Chaves (tipo, valor, descrição, data) das transações de `inicio` até antes de `fim`
+    (datetimes), em ordem cronológica.
+    
+    Os meses fechados do período vêm do arquivo. Em cada índice são duas buscas
+    binárias e a leitura do que está no intervalo: O(log n + k).
+    """
+    limites = (datetime_para_minuto(inicio), datetime_para_minuto(fim))
+    mes_atual = datetime.now().strftime('%Y-%m')
+    fechados = [mes for mes in meses_arquivados(nome)
+                if inicio.strftime('%Y-%m') <= mes <= fim.strftime('%Y-%m') and mes < mes_atual]
+    resultado = []
+    for entrada in [_indice_arquivado(nome, mes) for mes in fechados] + [indice_historico(nome, transacoes, datas=True)]:
+        momentos, posicoes, chaves = entrada['momentos'], entrada['posicoes'], entrada['chaves']
+        i, j = (bisect_left(momentos, limite) for limite in limites)
+        resultado += [chaves[posicao] for posicao in posicoes[i:j]]
+    return resultado
+
+def buscar_transacoes(entrada, consulta):
+    """Posições (crescentes) das transações cuja descrição tem todos os termos da consulta.
+    
+    Percorre só a lista do termo mais raro, conferindo os outros por busca binária:
+    o custo acompanha o número de resultados, não o tamanho do histórico.
+    """
+    listas = sorted((entrada['termos'].get(termo, []) for termo in termos_busca(consulta)), key=len)
+    if len(listas) < 2:
+        return list(listas[0]) if listas else []
+    
+    def tem(posicoes, posicao):
+        i = bisect_left(posicoes, posicao)
+        return i < len(posicoes) and posicoes[i] == posicao
+    
+    return [posicao for posicao in listas[0] if all(tem(outra, posicao) for outra in listas[1:])]
+
+NOME_TIPO = {
+    'gasto': 'Gastos',
+    'gasto_vr': 'Gastos VR',
+    'gasto_va': 'Gastos VA',
+    'entrada': 'Entradas',
+    'credito_vr': 'Créditos VR',
+    'credito_va': 'Créditos VA',
+}
+
+# Comando: BUSCAR
+@prefixo('buscar ', 'busca ', 'procurar ')
+def cmd_buscar(ctx):
+    consulta = ctx['resto'].strip()
+    if not termos_busca(consulta):
+        return "❌ Digite o que procurar!\nEx: buscar padaria"
+    
+    entrada = indice_historico(ctx['nome_atual'], ctx['usuario_dados']['transacoes'], termos=True)
+    posicoes = buscar_transacoes(entrada, consulta)
+    if not posicoes:
+        return f"🔎 Nenhuma transação com *{consulta}*."
+    
+    chaves = entrada['chaves']
+    somas = {}
+    for posicao in posicoes:
+        tipo, valor = chaves[posicao][:2]
+        somas[tipo] = somas.get(tipo, 0) + centavos(valor)
+    
+    texto = f"🔎 *BUSCA: {consulta}*\n\n📝 {len(posicoes)} transação(ões)\n"
+    for tipo, soma in somas.items():
+        texto += f"{EMOJI_TIPO.get(tipo, '📌')} {NOME_TIPO.get(tipo, tipo)}: R$ {reais(soma):.2f}\n"
+    
+    texto += "\n*Mais recentes:*\n\n"
+    for posicao in reversed(posicoes[-10:]):
+        tipo, valor, descricao, data = chaves[posicao]
+        sinal = '+' if 'entrada' in tipo or 'credito' in tipo else '-'
+        texto += f"{EMOJI_TIPO.get(tipo, '📌')} {sinal}R$ {valor:.2f}\n"
+        texto += f"   {descricao[:TAMANHO_DESCRICAO]}\n"
+        texto += f"   {data}\n\n"
+    return texto.strip()
+
+# ===== CONSULTAS POR PERÍODO =====
+
+# '15/10', '15/10/26' ou '15/10/2026'; o período é 'data a data' (ou uma data só)
+_DATA_CONSULTA = re.compile(r'(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?')
+_PERIODO = re.compile(r'(\S+)(?:\s+(?:a|até|ate)\s+(\S+))?')
+_ULTIMOS_DIAS = re.compile(r'(?:dos |nos )?(?:últimos|ultimos) (\d+) dias?')
+
+def _dia_do_texto(texto, ano):
+    """'15/10/2026' -> (date, True); sem ano, usa `ano` -> (date, False). None se inválida"""
+    encontrado = _DATA_CONSULTA.fullmatch(texto)
+    if not encontrado:
+        return None
+    dia, mes, informado = encontrado.groups()
+    if informado:
+        ano = int(informado) + (2000 if len(informado) == 2 else 0)
+    try:
+        return date(ano, int(mes), int(dia)), informado is not None
+    except ValueError:
+        return None
+
+def periodo_do_texto(texto, hoje=None):
+    """'01/10 a 15/10' -> (início, fim) em datas, com o fim incluído; None se não for um período.
+    
+    Sem ano vale o ano de hoje; se o início sem ano ficar depois do fim ('20/12 a 05/01'),
+    é do ano anterior.
+    """
+    hoje = hoje or date.today()
+    encontrado = _PERIODO.fullmatch(texto.strip())
+    if not encontrado:
+        return None
+    inicio = _dia_do_texto(encontrado[1], hoje.year)
+    fim = _dia_do_texto(encontrado[2], hoje.year) if encontrado[2] else inicio
+    if inicio is None or fim is None:
+        return None
+    (inicio, com_ano), (fim, _) = inicio, fim
+    if inicio > fim and not com_ano:
+        inicio = (_dia_do_texto(encontrado[1], inicio.year - 1) or (fim, None))[0]
+    if inicio > fim:
+        return None
+    return inicio, fim
+
+def _transacoes_nos_dias(ctx, inicio, fim):
+    """Chaves (tipo, valor, descrição, data) de `inicio` a `fim` (datas, fim incluído), em ordem cronológica"""
+    return transacoes_no_periodo(
+        ctx['nome_atual'], ctx['usuario_dados']['transacoes'],
+        datetime.combine(inicio, datetime.min.time()), datetime.combine(fim + timedelta(days=1), datetime.min.time())
+    )
+
+def _totais_das_chaves(chaves):
+    """Totais por tipo ({tipo: (quantidade, soma)}) das chaves, somando em centavos"""
+    somas = {}
+    for tipo, valor, _, _ in chaves:
+        quantidade, soma = somas.get(tipo, (0, 0))
+        somas[tipo] = (quantidade + 1, soma + centavos(valor))
+    return {tipo: (quantidade, reais(soma)) for tipo, (quantidade, soma) in somas.items()}
+
+def _itens_extrato(chaves, tamanho):
+    """Itens do extrato, do mais novo para o mais antigo, até caber em LIMITE_MENSAGEM com `tamanho` já usado.
+    
+    Retorna (itens, quantos couberam).
+    """
+    partes = []
+    for tipo, valor, descricao, data in reversed(chaves):
+        item = item_extrato(tipo, valor, descricao, data)
+        if tamanho + len(item) > LIMITE_MENSAGEM:
+            break
+        partes.append(item)
+        tamanho += len(item)
+    return ''.join(partes), len(partes)
+
+def _texto_gastos(ctx, titulo, inicio, fim):
+    """Gastos (geral, VR e VA) de `inicio` a `fim`, com os mais recentes"""
+    gastos = [chave for chave in _transacoes_nos_dias(ctx, inicio, fim) if 'gasto' in chave[0]]
+    if not gastos:
+        return f"🎉 Nenhum gasto {titulo.lower()}."
+    
+    totais = _totais_das_chaves(gastos)
+    total = reais(sum(centavos(soma) for _, soma in totais.values()))
+    texto = f"""💸 *GASTOS {titulo}*
+
+• Geral: R$ {totais.get('gasto', (0, 0))[1]:.2f}
+• Vale Refeição: R$ {totais.get('gasto_vr', (0, 0))[1]:.2f}
+• Vale Alimentação: R$ {totais.get('gasto_va', (0, 0))[1]:.2f}
+💰 *Total: R$ {total:.2f}* ({len(gastos)} gasto(s))
+
+"""
+    itens, _ = _itens_extrato(gastos[-10:], len(texto))
+    return (texto + itens).strip()
+
+# Comando: GASTOS DE HOJE
+@comando('gastos hoje', 'gastos de hoje', 'gasto hoje')
+def cmd_gastos_hoje(ctx):
+    hoje = date.today()
+    return _texto_gastos(ctx, 'DE HOJE', hoje, hoje)
+
+# Comando: GASTOS DE ONTEM
+@comando('gastos ontem', 'gastos de ontem', 'gasto ontem')
+def cmd_gastos_ontem(ctx):
+    ontem = date.today() - timedelta(days=1)
+    return _texto_gastos(ctx, 'DE ONTEM', ontem, ontem)
+
+# Comando: GASTOS DA SEMANA (desde segunda-feira)
+@comando('gastos semana', 'gastos da semana', 'gastos desta semana', 'gastos dessa semana', 'gasto semana')
+def cmd_gastos_semana(ctx):
+    hoje = date.today()
+    return _texto_gastos(ctx, 'DA SEMANA', hoje - timedelta(days=hoje.weekday()), hoje)
+
+# Comando: EXTRATO DE UM PERÍODO
+@prefixo('extrato ')
+def cmd_extrato_periodo(ctx):
+    periodo = periodo_do_texto(ctx['resto'])
+    if periodo is None:
+        return "❌ Período inválido!\nUse: extrato [dd/mm] a [dd/mm]\nEx: extrato 01/10 a 15/10"
+    inicio, fim = periodo
+    rotulo = inicio.strftime('%d/%m/%Y') + ('' if inicio == fim else f" A {fim.strftime('%d/%m/%Y')}")
+    chaves = _transacoes_nos_dias(ctx, inicio, fim)
+    if not chaves:
+        return f"📋 Nenhuma transação em {rotulo.lower()}."
+    
+    totais = _totais_das_chaves(chaves)
+    entradas = sum(soma for tipo, (_, soma) in totais.items() if 'entrada' in tipo or 'credito' in tipo)
+    gastos = sum(soma for tipo, (_, soma) in totais.items() if 'gasto' in tipo)
+    cabecalho = f"📋 *EXTRATO {rotulo} ({len(chaves)})*\n💵 Entradas: R$ {entradas:.2f}\n💸 Gastos: R$ {gastos:.2f}\n\n"
+    rodape = f"💡 Mostrando as {{}} mais recentes de {len(chaves)}; diminua o período para ver as outras"
+    itens, quantidade = _itens_extrato(chaves, len(cabecalho) + len(rodape) + 4)
+    if quantidade < len(chaves):
+        itens += rodape.format(quantidade)
+    return (cabecalho + itens).strip()
+
+def resumo_ultimos_dias(ctx, dias):
+    """Resumo de hoje e dos `dias` - 1 dias anteriores, pelos índices por data"""
+    hoje = date.today()
+    chaves = _transacoes_nos_dias(ctx, hoje - timedelta(days=dias - 1), hoje)
+    return _texto_resumo(f'RESUMO DOS ÚLTIMOS {dias} DIAS', 'SALDOS ATUAIS', ctx['usuario_dados'], _totais_das_chaves(chaves))
+
+# ===== DESFAZER E SALDOS PASSADOS =====
+
+# Quantas transações 'desfazer N' desfaz de uma vez, no máximo (para tudo há 'limpar tudo')
+DESFAZER_MAXIMO = 20
+
+# Comando: DESFAZER AS ÚLTIMAS N OU UMA TRANSAÇÃO PELA DESCRIÇÃO
+@prefixo('desfazer ', 'apagar ultimas ', 'apagar últimas ')
+def cmd_desfazer(ctx):
+    usuario_dados = ctx['usuario_dados']
+    pedido = ctx['resto'].strip()
+    if not usuario_dados['transacoes']:
+        return "❌ Nenhuma transação para desfazer!"
+    
+    if pedido.isdigit():
+        quantidade = int(pedido)
+        if not 1 <= quantidade <= DESFAZER_MAXIMO:
+            return f"❌ Dá para desfazer de 1 a {DESFAZER_MAXIMO} transações de uma vez!\nEx: desfazer 3"
+        desfeitas = desfazer_ultimas_transacoes(usuario_dados, quantidade)
+    else:
+        if not termos_busca(pedido):
+            return "❌ Diga quantas ou qual transação desfazer!\nEx: desfazer 3\nEx: desfazer uber"
+        entrada = indice_historico(ctx['nome_atual'], usuario_dados['transacoes'], termos=True)
+        posicoes = buscar_transacoes(entrada, pedido)
+        if not posicoes:
+            return f"🔎 Nenhuma transação com *{pedido}* para desfazer."
+        # A mais recente com esses termos
+        desfeitas = [desfazer_transacao(usuario_dados, posicoes[-1])]
+        descartar_indice(ctx['nome_atual'])
+    salvar_dados(ctx['dados'])
+    
+    texto = f"🔙 *{len(desfeitas)} transação(ões) desfeita(s)!*\n\n"
+    for t in desfeitas:
+        texto += f"❌ {item_extrato(t['tipo'], t['valor'], t['descricao'], t['data'])}"
+    return texto + f"💰 Saldo atual: R$ {usuario_dados['saldo']:.2f}"
+
+# Comando: SALDO EM UMA DATA PASSADA
+@prefixo('saldo em ', 'saldos em ', 'saldo no dia ', 'saldo dia ')
+def cmd_saldo_em(ctx):
+    encontrado = _dia_do_texto(ctx['resto'].strip(), date.today().year)
+    if encontrado is None:
+        return "❌ Data inválida!\nUse: saldo em [dd/mm]\nEx: saldo em 10/10"
+    dia = encontrado[0]
+    rotulo = dia.strftime('%d/%m/%Y')
+    if dia > date.today():
+        return f"❌ {rotulo} ainda não chegou!\nPara os saldos de agora use: saldo"
+    # Tudo o que foi registrado até o fim do dia
+    saldos, _ = saldos_em(ctx['nome_atual'], ctx['usuario_dados'], minuto_da_data(f'{rotulo} 23:59'))
+    if saldos is None:
+        return f"📅 Sem registros até {rotulo}.\n\n💡 O razão começa no primeiro lançamento depois da atualização"
+    return f"""📅 *SALDOS EM {rotulo}*
+
+💵 *Saldo Geral:* R$ {saldos['saldo']:.2f}
+🍽️ *Vale Refeição:* R$ {saldos['vr']:.2f}
+🛒 *Vale Alimentação:* R$ {saldos['va']:.2f}
+
+📊 *Total Disponível:*
+R$ {reais(sum(centavos(valor) for valor in saldos.values())):.2f}"""
+
+# ===== IMPORTAÇÃO DE EXTRATOS =====
+
+# Nomes de coluna aceitos no CSV (sem acento, minúsculos)
+_COLUNAS_CSV = {
+    'data': ('data', 'date', 'data lancamento', 'data da transacao', 'data movimento', 'dtposted'),
+    'valor': ('valor', 'amount', 'value', 'valor (r$)', 'valor r$', 'trnamt'),
+    'descricao': ('descricao', 'historico', 'lancamento', 'description', 'title', 'memo', 'identificacao'),
+    'tipo': ('tipo', 'type', 'trntype'),
+    'categoria': ('categoria', 'category'),
+}
+# Datas aceitas: 31/01/2024 [10:30[:00]], 2024-01-31[T10:30[:00]] e a do OFX (20240131[103000][.000][-3:BRT])
+_DATA_EXTRATO = re.compile(r'''
+    (?:(?P<dia>\d{1,2})/(?P<mes>\d{1,2})/(?P<ano>\d{4})
+      |(?P<ano_iso>\d{4})-(?P<mes_iso>\d{2})-(?P<dia_iso>\d{2})
+      |(?P<ano_ofx>\d{4})(?P<mes_ofx>\d{2})(?P<dia_ofx>\d{2})(?=\d{4}|\[|\.|$)
+    )
+    (?:[ T]?(?P<hora>\d{1,2}):?(?P<minuto>\d{2})(?::?\d{2})?)?
+    (?:\.\d+)?(?:\[.*\])?$
+''', re.VERBOSE)
+_TAG_OFX = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+# Categoria de quem não informa uma, pelo tipo
+_CATEGORIA_TIPO = {'gasto_vr': 'vr', 'credito_vr': 'vr', 'gasto_va': 'va', 'credito_va': 'va'}
+
+def _abrir_extrato(binario, formato=None):
+    """Reconhece o formato (csv/ofx) e a codificação pelo começo do arquivo; devolve (texto, formato)"""
+    inicio = binario.read(2048)
+    binario.seek(0)
+    if formato is None:
+        formato = 'ofx' if b'OFXHEADER' in inicio or b'<OFX>' in inicio.upper() else 'csv'
+    try:
+        inicio.decode('ascii')
+        # Só ASCII no começo: vale o que o cabeçalho do OFX declarar
+        codificacao = 'cp1252' if b'CHARSET:1252' in inicio or b'windows-1252' in inicio.lower() else 'utf-8-sig'
+    except UnicodeDecodeError:
+        try:
+            inicio.decode('utf-8')
+            codificacao = 'utf-8-sig'
+        except UnicodeDecodeError as erro:
+            # Corte no meio de um caractere no fim do trecho lido não conta
+            codificacao = 'utf-8-sig' if erro.start >= len(inicio) - 3 else 'cp1252'
+    return io.TextIOWrapper(binario, encoding=codificacao, errors='replace', newline=''), formato
+
+def _linhas_csv(texto):
+    """Linhas do CSV como {data, valor, descricao, tipo, categoria} (texto cru), uma de cada vez"""
+    cabecalho = texto.readline()
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    colunas = [_sem_acento(coluna) for coluna in next(csv.reader([cabecalho], delimiter=separador), [])]
+    indices = {campo: next((i for i, coluna in enumerate(colunas) if coluna in nomes), None)
+               for campo, nomes in _COLUNAS_CSV.items()}
+    if indices['data'] is None or indices['valor'] is None:
+        raise ValueError("o CSV precisa de cabeçalho com as colunas 'data' e 'valor'")
+    
+    for linha in csv.reader(texto, delimiter=separador):
+        yield {campo: linha[i] if i is not None and i < len(linha) else ''
+               for campo, i in indices.items()}
+
+def _linhas_ofx(texto):
+    """Transações (<STMTTRN>) do OFX, lidas em blocos: SGML ou XML, com ou sem quebras de linha"""
+    atual = None
+    resto = ''
+    while True:
+        bloco = texto.read(65536)
+        conteudo = resto + bloco
+        # A última tag pode estar cortada: fica para o próximo bloco
+        corte = max(conteudo.rfind('<'), 0) if bloco else len(conteudo)
+        for fechamento, tag, valor in _TAG_OFX.findall(conteudo[:corte]):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if fechamento and atual is not None:
+                    yield {
+                        'data': atual.get('DTPOSTED', ''),
+                        'valor': atual.get('TRNAMT', ''),
+                        'descricao': atual.get('MEMO') or atual.get('NAME', ''),
+                        'tipo': '',
+                        'categoria': ''
+                    }
+                atual = None if fechamento else {}
+            elif atual is not None and not fechamento:
+                atual[tag] = valor.strip()
+        resto = conteudo[corte:]
+        if not bloco:
+            break
+
+def _data_do_extrato(texto):
+    """Data do extrato no formato do histórico ('%d/%m/%Y %H:%M'), ou None"""
+    encontrado = _DATA_EXTRATO.match(texto.strip())
+    if not encontrado:
+        return None
+    partes = encontrado.groupdict()
+    ano = partes['ano'] or partes['ano_iso'] or partes['ano_ofx']
+    mes = partes['mes'] or partes['mes_iso'] or partes['mes_ofx']
+    dia = partes['dia'] or partes['dia_iso'] or partes['dia_ofx']
+    hora, minuto = int(partes['hora'] or 0), int(partes['minuto'] or 0)
+    try:
+        date(int(ano), int(mes), int(dia))
+    except ValueError:
+        return None
+    if hora > 23 or minuto > 59:
+        return None
+    return f'{int(dia):02d}/{int(mes):02d}/{ano} {hora:02d}:{minuto:02d}'
+
+def _centavos_do_extrato(texto):
+    """'-1.234,56' / 'R$ 1234.56' / '(50,00)' -> centavos com sinal"""
+    texto = texto.replace('R$', '').replace(' ', '').strip()
+    negativo = texto.startswith('(') and texto.endswith(')')
+    texto = texto.strip('()')
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    quantia = ler_centavos(texto)
+    return -quantia if negativo else quantia
+
+def _transacao_do_extrato(linha, datas):
+    """Converte uma linha do extrato numa transação do histórico; None se for inválida"""
+    data = datas.get(linha['data'])
+    if data is None:
+        if len(datas) > 4096:
+            datas.clear()
+        data = datas[linha['data']] = _data_do_extrato(linha['data'])
+    try:
+        quantia = _centavos_do_extrato(linha['valor'])
+    except ValueError:
+        return None
+    if data is None or quantia == 0:
+        return None
+    
+    tipo = _sem_acento(linha['tipo'])
+    if tipo not in _EFEITO_TIPO:
+        if tipo in ('c', 'credito', 'credit'):
+            tipo = 'entrada'
+        elif tipo in ('d', 'debito', 'debit'):
+            tipo = 'gasto'
+        else:
+            tipo = 'entrada' if quantia > 0 else 'gasto'
+    descricao = ' '.join(linha['descricao'].split()) or 'Importado'
+    return {
+        'tipo': tipo,
+        'valor': reais(abs(quantia)),
+        'descricao': descricao,
+        'data': data,
+        'categoria': linha['categoria'].strip() or ('gasto' in tipo and categoria_das_regras(descricao))
+                     or _CATEGORIA_TIPO.get(tipo, 'geral')
+    }
+
+def _chave_extrato(transacao):
+    """(data, tipo, valor em centavos, descrição): o que identifica um lançamento repetido"""
+    return transacao['data'], transacao['tipo'], centavos(transacao['valor']), transacao['descricao']
+
+def importar_extrato(binario, nome, formato=None):
+    """Importa um extrato CSV ou OFX para o usuário nome, num lote só.
+    
+    O arquivo é lido linha a linha e as transações vão direto para o histórico
+    (no SQLite, num executemany alimentado pelo próprio leitor). Lançamentos que
+    já existem (no histórico ativo ou num mês arquivado) com a mesma data, valor
+    e descrição são pulados: reimportar o mesmo extrato não duplica nada.
+    Os saldos recebem o efeito somado uma única vez e os dados são salvos uma vez.
+    
+    Retorna {'importadas', 'repetidas', 'invalidas'}.
+    """
+    texto, formato = _abrir_extrato(binario, formato)
+    linhas = _linhas_ofx(texto) if formato == 'ofx' else _linhas_csv(texto)
+    resultado = {'importadas': 0, 'repetidas': 0, 'invalidas': 0}
+    
+    with trava(f'usuario:{nome}'):
+        dados = carregar_dados()
+        usuario_dados = dados['usuarios'].setdefault(nome, novo_usuario())
+        totais_do_usuario(usuario_dados)
+        transacoes = usuario_dados['transacoes']
+        if STORAGE_BACKEND == 'sqlite' and not isinstance(transacoes, TransacoesSQLite) and not transacoes:
+            # Usuário novo: o lote vai direto para o banco em vez de se acumular numa lista
+            transacoes = usuario_dados['transacoes'] = TransacoesSQLite(_conexao_sqlite(), nome)
+        
+        # Quantas vezes cada lançamento já existe; a k-ésima ocorrência no arquivo só
+        # entra se houver menos de k iguais (duas compras iguais no mesmo dia continuam duas).
+        # As contagens guardam só o hash da chave, para ocupar pouca memória
+        if isinstance(transacoes, TransacoesSQLite):
+            ja_existentes = transacoes.quantidade_iguais
+        else:
+            contagem = {}
+            for t in transacoes:
+                chave = hash(_chave_extrato(t))
+                contagem[chave] = contagem.get(chave, 0) + 1
+            ja_existentes = lambda transacao: contagem.get(hash(_chave_extrato(transacao)), 0)
+        arquivados = set(meses_arquivados(nome))
+        contagem_arquivo = {}
+        vistas = {}
+        datas = {}
+        efeitos = {'saldo': 0, 'vr': 0, 'va': 0}
+        
+        def novas():
+            for linha in linhas:
+                transacao = _transacao_do_extrato(linha, datas)
+                if transacao is None:
+                    resultado['invalidas'] += 1
+                    continue
+                chave = hash(_chave_extrato(transacao))
+                mes = _mes_da_data(transacao['data'])
+                if mes in arquivados and mes not in contagem_arquivo:
+                    contagem_arquivo[mes] = {}
+                    for t in transacoes_arquivadas(nome, mes):
+                        chave_arquivada = hash(_chave_extrato(t))
+                        contagem_arquivo[mes][chave_arquivada] = contagem_arquivo[mes].get(chave_arquivada, 0) + 1
+                existentes = ja_existentes(transacao) + contagem_arquivo.get(mes, {}).get(chave, 0)
+                if existentes:
+                    # Só lançamentos que já existiam precisam contar as ocorrências no arquivo
+                    vistas[chave] = vistas.get(chave, 0) + 1
+                    if vistas[chave] <= existentes:
+                        resultado['repetidas'] += 1
+                        continue
+                campo, sinal = _EFEITO_TIPO[transacao['tipo']]
+                efeitos[campo] += sinal * centavos(transacao['valor'])
+                contabilizar(usuario_dados, transacao)
+                resultado['importadas'] += 1
+                yield transacao
+        
+        transacoes.extend(novas())
+        if any(efeitos.values()):
+            registrar_evento(usuario_dados, 'ajuste', efeitos={campo: reais(efeito) for campo, efeito in efeitos.items()},
+                             nota=f"extrato importado ({resultado['importadas']} lançamentos)")
+        for campo, efeito in efeitos.items():
+            if efeito:
+                usuario_dados[campo] = reais(centavos(usuario_dados[campo]) + efeito)
+        salvar_dados(dados)
+    return resultado
+
+# ===== MENSAGENS REPETIDAS =====
+
+# Respostas já dadas por MessageSid: {sid: (expira_em, resposta)} na ordem de chegada,
+# que com o mesmo TTL para todas é também a ordem de expiração. `inode`/`posicao` marcam
+# até onde o DEDUP_ARQUIVO já foi lido; `linhas` conta as linhas dele (vivas ou não)
+_entregas = {'lock': threading.Lock(), 'respostas': OrderedDict(), 'inode': None, 'posicao': 0, 'linhas': 0}
+
+def _podar_entregas(agora):
+    """Descarta as respostas vencidas e as mais antigas acima de DEDUP_MAXIMO"""
+    respostas = _entregas['respostas']
+    while respostas:
+        expira, _ = respostas[next(iter(respostas))]
+        if expira > agora and len(respostas) <= DEDUP_MAXIMO:
+            break
+        respostas.popitem(last=False)
+
+def _ler_entregas():
+    """Incorpora as respostas que outros processos (ou este, antes de reiniciar) gravaram no arquivo"""
+    try:
+        info = os.stat(DEDUP_ARQUIVO)
+    except FileNotFoundError:
+        return
+    if info.st_ino != _entregas['inode']:
+        # Arquivo novo ou reescrito pela limpeza: lê do começo
+        _entregas['inode'], _entregas['posicao'], _entregas['linhas'] = info.st_ino, 0, 0
+    if info.st_size <= _entregas['posicao']:
+        return
+    with open(DEDUP_ARQUIVO, 'rb') as f:
+        f.seek(_entregas['posicao'])
+        bloco = f.read(info.st_size - _entregas['posicao'])
+    # A última linha pode estar no meio da gravação; fica para a próxima leitura
+    fim = bloco.rfind(b'\n') + 1
+    _entregas['posicao'] += fim
+    respostas = _entregas['respostas']
+    for linha in bloco[:fim].splitlines():
+        try:
+            sid, expira, resposta = json.loads(linha)
+        except ValueError:
+            continue
+        _entregas['linhas'] += 1
+        respostas[sid] = (expira, resposta)
+    _podar_entregas(time.time())
+
+def resposta_registrada(sid):
+    """Resposta já dada à mensagem `sid`, ou None se ela ainda não foi processada"""
+    if DEDUP_TTL <= 0:
+        return None
+    with _entregas['lock']:
+        if DEDUP_ARQUIVO:
+            _ler_entregas()
+        registro = _entregas['respostas'].get(sid)
+    if registro is None or registro[0] <= time.time():
+        return None
+    return registro[1]
+
+def _limpar_arquivo_entregas():
+    """Reescreve o arquivo só com as respostas vivas (chamada com a trava 'entregas')"""
+    temporario = DEDUP_ARQUIVO + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        for sid, (expira, resposta) in _entregas['respostas'].items():
+            f.write(json.dumps([sid, expira, resposta], ensure_ascii=False, separators=(',', ':')) + '\n')
+    os.replace(temporario, DEDUP_ARQUIVO)
+    info = os.stat(DEDUP_ARQUIVO)
+    _entregas['inode'], _entregas['posicao'], _entregas['linhas'] = info.st_ino, info.st_size, len(_entregas['respostas'])
+
+def registrar_resposta(sid, resposta):
+    """Guarda a resposta da mensagem `sid` para as entregas repetidas"""
+    if DEDUP_TTL <= 0:
+        return
+    expira = time.time() + DEDUP_TTL
+    if not DEDUP_ARQUIVO:
+        with _entregas['lock']:
+            _entregas['respostas'][sid] = (expira, resposta)
+            _podar_entregas(time.time())
+        return
+    
+    linha = (json.dumps([sid, expira, resposta], ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+    # A trava entre processos mantém as linhas inteiras e a limpeza sem perder gravações
+    with trava('entregas'), _entregas['lock']:
+        _ler_entregas()
+        with open(DEDUP_ARQUIVO, 'ab') as f:
+            f.write(linha)
+            if DURABILIDADE == 'sempre':
+                f.flush()
+                os.fsync(f.fileno())
+        if _entregas['inode'] is None:
+            _entregas['inode'] = os.stat(DEDUP_ARQUIVO).st_ino
+        _entregas['posicao'] += len(linha)
+        _entregas['linhas'] += 1
+        _entregas['respostas'][sid] = (expira, resposta)
+        _podar_entregas(time.time())
+        # Linhas vencidas ou descartadas passaram do limite: reescreve só as vivas
+        if _entregas['linhas'] > len(_entregas['respostas']) + DEDUP_MAXIMO:
+            _limpar_arquivo_entregas()
+
+# ===== RESPOSTA ASSÍNCRONA =====
+
+def enviar_pelo_twilio(destino, origem, texto):
+    """Envia a resposta pela API REST do Twilio (TWILIO_ACCOUNT_SID / TWILIO_AUTH_TOKEN)"""
+    from twilio.rest import Client
+    
+    cliente = _fila.get('cliente_twilio')
+    if cliente is None:
+        cliente = _fila['cliente_twilio'] = Client(os.environ['TWILIO_ACCOUNT_SID'],
+                                                   os.environ['TWILIO_AUTH_TOKEN'])
+    cliente.messages.create(from_=origem, to=destino, body=texto)
+
+# Quem envia as respostas no modo assíncrono: função (destino, origem, texto).
+# Pode ser trocada (ex.: por um envio falso em testes e benchmarks).
+enviar_resposta = enviar_pelo_twilio
+
+# Fila do modo assíncrono: uma fila por thread de trabalho; cada remetente cai sempre
+# na mesma fila, então as mensagens dele são processadas e respondidas em ordem
+_fila = {
+    'filas': [],
+    'threads': [],
+    'lock': threading.Lock(),
+    'pendentes': 0,
+    'processadas': 0,
+    'falhas': 0,
+    'atraso_total': 0.0,
+    'atraso_maximo': 0.0,
+}
+
+def _trabalhar(fila):
+    """Processa as mensagens de uma fila e envia as respostas; None encerra"""
+    while True:
+        item = fila.get()
+        if item is None:
+            return
+        mensagem, remetente, origem, sid, recebida = item
+        try:
+            resposta, repetida = processar_entrega(mensagem, remetente, sid)
+            # Entrega repetida que entrou na fila antes de a original terminar: já foi respondida
+            if not repetida:
+                for texto in (resposta if isinstance(resposta, list) else [resposta]):
+                    enviar_resposta(remetente, origem, texto)
+        except Exception:
+            app.logger.exception('Falha ao processar/enviar a mensagem de %s', remetente)
+            with _fila['lock']:
+                _fila['falhas'] += 1
+        atraso = time.monotonic() - recebida
+        with _fila['lock']:
+            _fila['pendentes'] -= 1
+            _fila['processadas'] += 1
+            _fila['atraso_total'] += atraso
+            _fila['atraso_maximo'] = max(_fila['atraso_maximo'], atraso)
+
+def enfileirar(mensagem, remetente, origem, sid=None):
+    """Coloca a mensagem na fila do remetente (as threads sobem na primeira chamada)"""
+    with _fila['lock']:
+        if not _fila['threads']:
+            for _ in range(TRABALHADORES_FILA):
+                fila = queue.Queue()
+                thread = threading.Thread(target=_trabalhar, args=(fila,), daemon=True)
+                thread.start()
+                _fila['filas'].append(fila)
+                _fila['threads'].append(thread)
+        _fila['pendentes'] += 1
+        fila = _fila['filas'][hash(remetente) % len(_fila['filas'])]
+    fila.put((mensagem, remetente, origem, sid, time.monotonic()))
+
+def metricas_fila():
+    """Profundidade da fila e atraso entre receber e responder (segundos)"""
+    with _fila['lock']:
+        processadas = _fila['processadas']
+        return {
+            'pendentes': _fila['pendentes'],
+            'processadas': processadas,
+            'falhas': _fila['falhas'],
+            'atraso_medio': _fila['atraso_total'] / processadas if processadas else 0.0,
+            'atraso_maximo': _fila['atraso_maximo'],
+        }
+
+def _esvaziar_fila(espera):
+    """Processa o que já está na fila e encerra as threads de trabalho"""
+    with _fila['lock']:
+        filas, threads = _fila['filas'], _fila['threads']
+        _fila['filas'], _fila['threads'] = [], []
+    for fila in filas:
+        fila.put(None)
+    limite = time.monotonic() + espera
+    for thread in threads:
+        thread.join(max(0, limite - time.monotonic()))
+
+# ===== AGENDA DE CONTAS FIXAS =====
+
+# Relógio da agenda; pode ser trocado por um relógio simulado (testes e benchmarks)
+relogio_agenda = date.today
+
+# Índice dos próximos vencimentos de todos os usuários: heap de (data ordinal, usuário, dia,
+# descrição). Entradas não saem do heap quando a conta muda ou é removida: ao chegar a vez,
+# cada uma é conferida com a conta atual e descartada se não bater. 'sujos' são os usuários
+# cujas contas outro processo alterou, reindexados no próximo ciclo; 'tudo' pede a reconstrução
+_agenda = {
+    'lock': threading.Lock(),
+    'heap': [],
+    'sujos': set(),
+    'tudo': True,
+    'versao_sqlite': None,
+    'thread': None,
+    'parar': threading.Event(),
+}
+
+def proximo_vencimento(dia, desde):
+    """Primeira data a partir de `desde` no dia `dia` do mês (31 vira o último dia dos meses curtos)"""
+    ano, mes = desde.year, desde.month
+    while True:
+        vencimento = date(ano, mes, min(dia, calendar.monthrange(ano, mes)[1]))
+        if vencimento >= desde:
+            return vencimento
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+def _entrada_agenda(nome, conta, hoje):
+    """Entrada do heap para a conta; contas antigas, sem vencimento gravado, vencem a partir de hoje"""
+    vencimento = conta.get('vencimento')
+    data = date.fromisoformat(vencimento) if vencimento else proximo_vencimento(conta['dia'], hoje)
+    return (data.toordinal(), nome, conta['dia'], conta['descricao'])
+
+def agendar_conta(nome, conta):
+    """Põe a conta no índice (ao cadastrar; a remoção é preguiçosa)"""
+    with _agenda['lock']:
+        if not _agenda['tudo']:
+            heapq.heappush(_agenda['heap'], _entrada_agenda(nome, conta, relogio_agenda()))
+
+def marcar_contas_alteradas(nome=None):
+    """As contas de `nome` (ou de todos, sem nome) mudaram por fora: reindexa no próximo ciclo"""
+    with _agenda['lock']:
+        if nome is None:
+            _agenda['tudo'] = True
+        else:
+            _agenda['sujos'].add(nome)
+
+def _atualizar_indice(hoje):
+    """Traz o índice para o estado dos dados: inteiro na primeira vez, depois só os usuários sujos"""
+    dados = None
+    if STORAGE_BACKEND == 'sqlite':
+        # data_version muda quando outra conexão (thread ou processo) confirma uma gravação
+        versao = _conexao_sqlite().execute('PRAGMA data_version').fetchone()[0]
+        if versao != _agenda['versao_sqlite']:
+            _agenda['versao_sqlite'] = versao
+            marcar_contas_alteradas()
+    elif STORAGE_BACKEND == 'particoes':
+        dados = carregar_dados()
+        alterados = contas_alteradas_particoes()
+        for nome in (None,) if alterados is None else alterados:
+            marcar_contas_alteradas(nome)
+    else:
+        # Reaplicar o diário gravado por outros processos marca os usuários sujos
+        dados = carregar_dados()
+    
+    with _agenda['lock']:
+        tudo, sujos = _agenda['tudo'], _agenda['sujos']
+        _agenda['tudo'], _agenda['sujos'] = False, set()
+        if tudo:
+            _agenda['heap'] = []
+    if not tudo and not sujos:
+        return
+    
+    dados = dados or carregar_dados()
+    # Na reconstrução bastam os cabeçalhos (nas partições, o histórico não é lido)
+    usuarios = dict(cabecalhos_usuarios(dados)) if tudo else dados['usuarios']
+    entradas = [
+        _entrada_agenda(nome, conta, hoje)
+        for nome in (list(usuarios) if tudo else sujos) if nome in usuarios
+        for conta in list(usuarios[nome].get('contas_fixas', []))
+    ]
+    with _agenda['lock']:
+        heap = _agenda['heap']
+        if tudo:
+            heap.extend(entradas)
+            heapq.heapify(heap)
+        else:
+            for entrada in entradas:
+                heapq.heappush(heap, entrada)
+
+def _conta_agendada(usuario, entrada):
+    """A conta que a entrada do heap representa, se ela ainda vence naquela data"""
+    ordinal, _, dia, descricao = entrada
+    for conta in (usuario or {}).get('contas_fixas', []):
+        if conta['dia'] == dia and conta['descricao'] == descricao:
+            vencimento = conta.get('vencimento')
+            if vencimento is None or date.fromisoformat(vencimento).toordinal() == ordinal:
+                return conta
+    return None
+
+def _vencer_conta(usuario, conta, vencimento, hoje):
+    """Lança ou lembra a conta que venceu em `vencimento` e a passa para o mês seguinte.
+    
+    Retorna o texto do aviso, ou None se não há o que avisar (conta já paga no mês,
+    vencimento perdido sem AGENDA_RECUPERAR, lembrete de um mês já superado por outro).
+    """
+    conta['vencimento'] = proximo_vencimento(conta['dia'], vencimento + timedelta(days=1)).isoformat()
+    if conta.get('pago_ate', '') >= vencimento.strftime('%Y-%m'):
+        return None
+    if vencimento < hoje and not AGENDA_RECUPERAR:
+        return None
+    
+    situacao = 'vence hoje' if vencimento == hoje else f"venceu em {vencimento.strftime('%d/%m/%Y')}"
+    if AGENDA_MODO == 'debitar':
+        registrar_transacao(usuario, 'gasto', conta['valor'], f"[CONTA FIXA] {conta['descricao']}", 'conta_fixa')
+        conta['pago_ate'] = vencimento.strftime('%Y-%m')
+        return f"💳 *Conta fixa lançada* ({situacao})\n💰 R$ {conta['valor']:.2f}\n📝 {conta['descricao']}\n💰 Saldo: R$ {usuario['saldo']:.2f}"
+    
+    # Vários meses perdidos viram um lembrete só, o do mais recente
+    if date.fromisoformat(conta['vencimento']) <= hoje:
+        return None
+    numero = next(i for i, c in enumerate(usuario['contas_fixas'], 1) if c is conta)
+    return f"⏰ *Lembrete:* a conta fixa {situacao}\n💳 R$ {conta['valor']:.2f}\n📝 {conta['descricao']}\n\n💡 Já pagou? Responda: pagar conta {numero}"
+
+@cronometrar('agenda')
+def executar_agenda(hoje=None):
+    """Um ciclo da agenda: processa as contas vencidas até `hoje` (padrão: relogio_agenda()).
+    
+    O custo é proporcional às contas vencidas e aos usuários alterados por outros
+    processos desde o ciclo anterior, não ao total de usuários. Vencimentos perdidos
+    com o serviço parado saem todos no primeiro ciclo. Retorna os avisos [(número, texto)].
+    """
+    hoje = hoje or relogio_agenda()
+    avisos = []
+    with trava('agenda'):
+        _atualizar_indice(hoje)
+        vencidas = {}
+        with _agenda['lock']:
+            heap = _agenda['heap']
+            while heap and heap[0][0] <= hoje.toordinal():
+                entrada = heapq.heappop(heap)
+                vencidas.setdefault(entrada[1], []).append(entrada)
+        if not vencidas:
+            return avisos
+        
+        # Trava todos os usuários com contas vencidas (em ordem, sem risco de impasse: as
+        # mensagens travam um usuário só) e grava tudo de uma vez
+        proximas = []
+        try:
+            with ExitStack() as travas:
+                for nome in sorted(vencidas):
+                    travas.enter_context(trava(f'usuario:{nome}'))
+                dados = carregar_dados()
+                for nome, entradas in vencidas.items():
+                    usuario = dados['usuarios'].get(nome)
+                    for entrada in entradas:
+                        conta = _conta_agendada(usuario, entrada)
+                        if conta is None:
+                            continue
+                        vencimento = date.fromordinal(entrada[0])
+                        while vencimento <= hoje:
+                            texto = _vencer_conta(usuario, conta, vencimento, hoje)
+                            if texto:
+                                avisos.append((conta.get('remetente'), texto))
+                            vencimento = date.fromisoformat(conta['vencimento'])
+                        proximas.append(_entrada_agenda(nome, conta, hoje))
+                if proximas:
+                    salvar_dados(dados)
+        except Exception:
+            # As entradas já saíram do heap: reindexa esses usuários no próximo ciclo
+            for nome in vencidas:
+                marcar_contas_alteradas(nome)
+            raise
+        with _agenda['lock']:
+            for entrada in proximas:
+                heapq.heappush(_agenda['heap'], entrada)
+    
+    for destino, texto in avisos:
+        if not destino or not TWILIO_NUMERO:
+            continue
+        try:
+            enviar_resposta(destino, TWILIO_NUMERO, texto)
+        except Exception:
+            app.logger.exception('Falha ao enviar o aviso de conta fixa para %s', destino)
+    return avisos
+
+def _rodar_agenda():
+    """Thread da agenda: um ciclo ao ligar (recupera o que venceu com o serviço parado) e um por intervalo"""
+    while True:
+        try:
+            executar_agenda()
+        except Exception:
+            app.logger.exception('Falha no ciclo da agenda de contas fixas')
+        if _agenda['parar'].wait(AGENDA_INTERVALO):
+            return
+
+def ligar_agenda():
+    """Liga a thread da agenda (se ainda não estiver rodando)"""
+    if _agenda['thread'] is None or not _agenda['thread'].is_alive():
+        _agenda['parar'].clear()
+        _agenda['thread'] = threading.Thread(target=_rodar_agenda, daemon=True)
+        _agenda['thread'].start()
+
+def desligar_agenda(espera=5):
+    """Para a thread da agenda, esperando o ciclo em andamento"""
+    _agenda['parar'].set()
+    thread = _agenda['thread']
+    if thread is not None and thread.is_alive():
+        thread.join(espera)
+    _agenda['thread'] = None
+
+if AGENDA:
+    ligar_agenda()
+
+@app.route('/whatsapp', methods=['POST'])
+@cronometrar('webhook')
+def whatsapp_webhook():
+    """Webhook para receber mensagens do WhatsApp via Twilio"""
+    mensagem_recebida = request.form.get('Body', '')
+    remetente = request.form.get('From')
+    # O Twilio reenvia o webhook (mesmo MessageSid) quando a resposta demora
+    sid = request.form.get('MessageSid')
+    
+    if RESPOSTA_ASSINCRONA:
+        # Confirma o webhook na hora; a resposta vai pela API quando a fila chegar nela
+        if sid and resposta_registrada(sid) is not None:
+            contar_comando('repetida')
+        else:
+            enfileirar(mensagem_recebida, remetente, request.form.get('To'), sid)
+        return str(MessagingResponse())
+    
+    resposta_texto, _ = processar_entrega(mensagem_recebida, remetente, sid)
+    
+    inicio = time.perf_counter()
+    resp = MessagingResponse()
+    # Extrato em várias páginas (PAGINAS_POR_RESPOSTA > 1) vira várias mensagens
+    for texto in (resposta_texto if isinstance(resposta_texto, list) else [resposta_texto]):
+        resp.message(texto)
+    twiml = str(resp)
+    observar('twiml', time.perf_counter() - inicio)
+    
+    return twiml
+
+@app.route('/teste', methods=['GET', 'POST'])
+def teste():
+    """Endpoint de teste sem Twilio"""
+    if request.method == 'POST':
+        mensagem = request.json.get('mensagem', '')
+        remetente = request.json.get('remetente')
+        return {'resposta': processar_mensagem(mensagem, remetente)}
+    return {'status': 'ok', 'mensagem': 'Envie POST com {"mensagem": "seu comando"}'}
+
+@app.route('/importar', methods=['POST'])
+def importar():
+    """Importa um extrato bancário (CSV ou OFX) no campo 'arquivo' de um formulário multipart.
+    
+    O usuário vem de 'usuario' ou, sem ele, do número em 'remetente'; 'formato'
+    (csv/ofx) é opcional.
+    """
+    if not _importacao_autorizada():
+        return {'erro': 'importação não autorizada'}, 403
+    arquivo = request.files.get('arquivo')
+    if arquivo is None:
+        return {'erro': "envie o extrato no campo 'arquivo'"}, 400
+    formato = request.form.get('formato') or None
+    if formato not in (None, 'csv', 'ofx'):
+        return {'erro': "formato deve ser 'csv' ou 'ofx'"}, 400
+    
+    nome = request.form.get('usuario')
+    if not nome:
+        remetente = request.form.get('remetente')
+        with trava(f'remetente:{remetente}'):
+            nome = usuario_do_remetente(carregar_dados(), remetente)
+    try:
+        resultado = importar_extrato(arquivo.stream, nome, formato)
+    except ValueError as erro:
+        return {'erro': str(erro)}, 400
+    return {'usuario': nome, **resultado}
+
+def _importacao_autorizada():
+    """Com IMPORTAR_TOKEN, se o pedido traz o token; sem ele, se veio da própria máquina"""
+    if IMPORTAR_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {IMPORTAR_TOKEN}')
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+def _pedido_local():
+    """Se o pedido veio da própria máquina (ou METRICAS_LOCAL=0 libera para todos)"""
+    return not METRICAS_LOCAL or request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas deste processo no formato do Prometheus"""
+    if not _pedido_local():
+        return {'erro': 'disponível só localmente'}, 403
+    return texto_metricas(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/perfil', methods=['GET', 'POST'])
+def perfil():
+    """GET: pilhas recolhidas pelo profiler; POST {"ligado": true/false, "intervalo_ms": 10} liga/desliga"""
+    if not _pedido_local():
+        return {'erro': 'disponível só localmente'}, 403
+    if request.method == 'POST':
+        pedido = request.get_json(silent=True) or request.form
+        if str(pedido.get('ligado', '')).lower() in ('1', 'true'):
+            ligar_perfil(float(pedido.get('intervalo_ms', 10)) / 1000)
+        else:
+            desligar_perfil()
+        return {'ligado': _perfil['ligado'], 'intervalo_ms': _perfil['intervalo'] * 1000}
+    return perfil_coletado(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+@app.route('/fila', methods=['GET'])
+def fila():
+    """Métricas da fila do modo assíncrono"""
+    if not _pedido_local():
+        return {'erro': 'disponível só localmente'}, 403
+    return metricas_fila()
+
+if __name__ == '__main__':
+    # python whatsapp_financas.py importar-sqlite: migra financas_data.json para o SQLite
+    if sys.argv[1:] == ['importar-sqlite']:
+        for nome, quantidade in importar_json_para_sqlite().items():
+            print(f'{nome}: {quantidade} transações importadas para {SQLITE_FILE}')
+        sys.exit(0)
+    
+    # python whatsapp_financas.py importar-particoes: migra financas_data.json para as partições
+    if sys.argv[1:] == ['importar-particoes']:
+        for nome, quantidade in importar_json_para_particoes().items():
+            print(f'{nome}: {quantidade} transações importadas para {_pasta_particao(nome)}')
+        sys.exit(0)
+    
+    # python whatsapp_financas.py verificar-totais [--corrigir]: confere os totais com o histórico
+    if sys.argv[1:2] == ['verificar-totais']:
+        corrigir = '--corrigir' in sys.argv[2:]
+        dados = carregar_dados()
+        divergencias = []
+        for nome in list(dados['usuarios']):
+            with trava(f'usuario:{nome}'):
+                dados = carregar_dados()
+                if nome not in dados['usuarios']:
+                    continue
+                usuario = {nome: dados['usuarios'][nome]}
+                divergencias += verificar_totais({'usuarios': usuario}, corrigir)
+                if corrigir:
+                    salvar_dados(dados)
+        for nome, mes, grupo, chave, esperado, guardado in divergencias:
+            print(f'{nome} {mes or "(sem data)"} {grupo}={chave}: histórico {esperado}, guardado {guardado}')
+        print(f'{len(divergencias)} divergência(s)' + (' corrigida(s)' if corrigir and divergencias else ''))
+        sys.exit(1 if divergencias and not corrigir else 0)
+    
+    # python whatsapp_financas.py verificar-saldos [--corrigir]: confere os saldos com o histórico
+    if sys.argv[1:2] == ['verificar-saldos']:
+        corrigir = '--corrigir' in sys.argv[2:]
+        divergencias = []
+        for nome in list(carregar_dados()['usuarios']):
+            with trava(f'usuario:{nome}'):
+                dados = carregar_dados()
+                if nome not in dados['usuarios']:
+                    continue
+                divergencias += verificar_saldos({'usuarios': {nome: dados['usuarios'][nome]}}, corrigir)
+                if corrigir:
+                    salvar_dados(dados)
+        for nome, campo, esperado, guardado in divergencias:
+            print(f'{nome} {campo}: histórico {esperado:.2f}, guardado {guardado!r}')
+        print(f'{len(divergencias)} divergência(s)' + (' corrigida(s)' if corrigir and divergencias else ''))
+        sys.exit(1 if divergencias and not corrigir else 0)
+    
+    # python whatsapp_financas.py verificar-razao: refaz os saldos pelo livro-razão inteiro e confere
+    if sys.argv[1:2] == ['verificar-razao']:
+        divergencias = []
+        for nome in list(carregar_dados()['usuarios']):
+            with trava(f'usuario:{nome}'):
+                dados = carregar_dados()
+                if nome in dados['usuarios']:
+                    divergencias += verificar_razao({'usuarios': {nome: dados['usuarios'][nome]}})
+        for nome, campo, pelo_razao, guardado in divergencias:
+            print(f'{nome} {campo}: razão {pelo_razao:.2f}, guardado {guardado!r}')
+        print(f'{len(divergencias)} divergência(s)')
+        sys.exit(1 if divergencias else 0)
+    
+    # python whatsapp_financas.py importar-extrato arquivo.csv|arquivo.ofx [usuario]
+    if sys.argv[1:2] == ['importar-extrato'] and len(sys.argv) in (3, 4):
+        nome = sys.argv[3] if len(sys.argv) == 4 else carregar_dados()['usuario_atual']
+        with open(sys.argv[2], 'rb') as f:
+            resultado = importar_extrato(f, nome)
+        print(f"{nome}: {resultado['importadas']} importada(s), {resultado['repetidas']} repetida(s), "
+              f"{resultado['invalidas']} inválida(s)")
+        sys.exit(0)
+    
+    # python whatsapp_financas.py agenda [AAAA-MM-DD]: um ciclo da agenda (ex.: pelo cron), hoje ou na data dada
+    if sys.argv[1:2] == ['agenda'] and len(sys.argv) <= 3:
+        avisos = executar_agenda(date.fromisoformat(sys.argv[2]) if len(sys.argv) == 3 else None)
+        for destino, texto in avisos:
+            print(f"{destino or '(sem número)'}: {texto.splitlines()[0]}")
+        print(f'{len(avisos)} aviso(s)')
+        sys.exit(0)
+    
+    # python whatsapp_financas.py arquivar-meses: arquiva os meses fechados de todos os usuários
+    if sys.argv[1:] == ['arquivar-meses']:
+        for nome in list(carregar_dados()['usuarios']):
+            with trava(f'usuario:{nome}'):
+                dados = carregar_dados()
+                if nome not in dados['usuarios']:
+                    continue
+                meses = arquivar_meses_fechados(nome, dados['usuarios'][nome])
+                if meses:
+                    salvar_dados(dados)
+                    print(f"{nome}: {', '.join(meses)} arquivado(s) em {_pasta_arquivo(nome)}")
+        sys.exit(0)
+    
+    # python whatsapp_financas.py compactar-snapshot: regrava o snapshot agora, no FORMATO_SNAPSHOT atual
+    if sys.argv[1:] == ['compactar-snapshot'] and STORAGE_BACKEND == 'json':
+        carregar_dados()
+        _compactar()
+        print(f'{DATA_FILE} regravado no formato {FORMATO_SNAPSHOT} ({os.path.getsize(DATA_FILE)} bytes)')
+        sys.exit(0)
+    
+    # python whatsapp_financas.py exportar-json [arquivo]: estado completo em JSON legível
+    if sys.argv[1:2] == ['exportar-json']:
+        dados = carregar_dados()
+        usuarios = {nome: {**usuario, 'transacoes': list(usuario['transacoes'])}
+                    for nome, usuario in dados['usuarios'].items()}
+        texto = json.dumps({**dados, 'usuarios': usuarios}, indent=2, ensure_ascii=False)
+        if sys.argv[2:]:
+            with open(sys.argv[2], 'w', encoding='utf-8') as f:
+                f.write(texto)
+        else:
+            print(texto)
+        sys.exit(0)
+    
+    # python whatsapp_financas.py importar-json arquivo: substitui o estado pelo JSON exportado
+    if sys.argv[1:2] == ['importar-json'] and len(sys.argv) == 3 and STORAGE_BACKEND != 'sqlite':
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            novos = json.load(f)
+        with trava('importacao'):
+            dados = carregar_dados()
+            dados.clear()
+            dados.update(novos)
+            salvar_dados(dados)
+            if STORAGE_BACKEND == 'json':
+                _compactar()
+        destino = PARTICOES_DIR if STORAGE_BACKEND == 'particoes' else f'{DATA_FILE} ({FORMATO_SNAPSHOT})'
+        print(f"{sum(len(u['transacoes']) for u in novos['usuarios'].values())} transações importadas "
+              f'para {destino}')
+        sys.exit(0)
+    
+    # Servidor de desenvolvimento; em produção use o gunicorn (Procfile / gunicorn.conf.py)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    port = int(os.environ.get('PORT', 5000))
+    try:
+        app.run(host='0.0.0.0', port=port, debug=False)
+    finally:
+        encerrar()